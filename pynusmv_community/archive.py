@@ -0,0 +1,404 @@
+'''
+This module contains the archive of the per-bound artifacts of a model. A long
+sweep with many flags produces tens of thousands of small files (cnf, mapping,
+communities, clouds, json, ...) which are slow to create, copy and scan on a
+network file system. With the `--archive` flag, these files are packed -- as
+soon as their bound is analyzed -- into one single append-only zip file:
+
+    + '{model}/artifacts.zip'   : the artifacts (a zip file)
+    + '{model}/artifacts.sqlite': the manifest of the archive, mapping the name
+      of each artifact (ie. 'communities/003/curated.txt') to its bound and to
+      the position of its data in the zip
+
+Thanks to the manifest, one artifact is read with a single seek -- without
+parsing the central directory of the zip -- and the artifacts stored without
+compression (images and time tables) can even be read piecewise, in place.
+
+.. note::
+    The manifest is the authority on the content of the archive. Appending to
+    a zip overwrites its central directory, so a pack that is killed midway
+    leaves a zip that standard tools can't read (the artifacts packed before
+    are still read through the manifest). The manifest also records the
+    position and content of the central directory of the last committed pack:
+    the next pack (or `repair`) truncates the zip back to that state, after
+    which it is a regular zip file again.
+
+The artifacts are read back by the viewers (see `serve`), by the `commu
+extract` subcommand and by `open_artifact`.
+
+.. note::
+    Only the files of the bounds (ie. having a '{bound:03d}' folder or file
+    name) are packed. The files of the whole run (stats, databases, ...) are
+    rewritten as the sweep goes and stay where they are.
+
+.. note::
+    An artifact that is packed again (ie. when a bound is analyzed once more)
+    is appended to the zip: the manifest only refers to its last version.
+'''
+import os
+import io
+import sys
+import zlib
+import struct
+import sqlite3
+import fnmatch
+import zipfile
+import argparse
+import warnings
+
+from collections import namedtuple
+
+# The name of the zip file (in the folder of the model)
+ARCHIVE  = 'artifacts.zip'
+# The name of the manifest (in the folder of the model)
+MANIFEST = 'artifacts.sqlite'
+
+# The folders of the model that are never packed
+KEEP     = ('stats',)
+# The files that are stored without compression: these are compressed already
+# or read piecewise (the time tables)
+STORED   = ('.png', '.webp', '.npz', '.parquet', '.gz', '.jsonl')
+
+# The max time (in seconds) a writer waits for the archive to be available
+LOCK_TIMEOUT = 600
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS members (
+        name      TEXT    PRIMARY KEY,
+        bound     INTEGER NOT NULL,
+        offset    INTEGER NOT NULL,
+        size      INTEGER NOT NULL,
+        length    INTEGER NOT NULL,
+        method    INTEGER NOT NULL,
+        crc       INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS members_by_bound ON members (bound);
+    CREATE TABLE IF NOT EXISTS directory (
+        id        INTEGER PRIMARY KEY CHECK (id = 0),
+        offset    INTEGER NOT NULL,
+        tail      BLOB    NOT NULL
+    );
+'''
+
+# One artifact of the archive:
+#   + name  : its path, relative to the folder of the model
+#   + bound : the bound it belongs to
+#   + offset: the position of its (possibly compressed) data in the zip
+#   + size  : the size of its data in the zip
+#   + length: its actual (uncompressed) size
+#   + method: the zip compression method (ZIP_STORED or ZIP_DEFLATED)
+#   + crc   : the crc32 of its content
+Member = namedtuple('Member', 'name bound offset size length method crc')
+
+def bound_of(name):
+    '''
+    :return: the bound of the artifact `name` (a path relative to the folder of
+        the model): the first of its folders/files whose name starts with 3+
+        digits. None if `name` belongs to no bound.
+    '''
+    for part in name.split('/'):
+        stem = part.split('.')[0]
+        if stem.isdigit() and len(stem) >= 3:
+            return int(stem)
+    return None
+
+def exists(model):
+    ''':return: True iff the `model` folder holds an archive'''
+    return os.path.isfile(os.path.join(model, MANIFEST))
+
+class Archive:
+    '''
+    The archive of the artifacts of one model (see the module documentation)
+    '''
+
+    def __init__(self, model, readonly=False, shared=False):
+        '''
+        :param model: the folder of the model (ie. the name of the model)
+        :param readonly: open an existing archive for reading only
+        :param shared: the (read only) archive is used by several threads
+        '''
+        self.model    = model
+        self.zip_file = os.path.join(model, ARCHIVE)
+        self.manifest = os.path.join(model, MANIFEST)
+
+        if readonly:
+            if not os.path.exists(self.manifest):
+                raise FileNotFoundError("No archive for model '{}' ({})".format(model, self.manifest))
+            self.db = sqlite3.connect('file:{}?mode=ro'.format(self.manifest), uri=True,
+                                      check_same_thread=not shared)
+        else:
+            os.makedirs(model, exist_ok=True)
+            self.db = sqlite3.connect(self.manifest, timeout=LOCK_TIMEOUT, isolation_level=None)
+            self.db.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    ############### READING ###################################################
+
+    def __contains__(self, name):
+        return self.member(name) is not None
+
+    def member(self, name):
+        ''':return: the `Member` named `name` (None if there is no such member)'''
+        row = self.db.execute('SELECT * FROM members WHERE name = ?', (name,)).fetchone()
+        return None if row is None else Member(*row)
+
+    def members(self, pattern='*', bound=None):
+        '''
+        :param pattern: a glob pattern the names of the members must match
+        :param bound: only list the members of that bound (all if None)
+        :return: the list of the matching `Member`s, sorted by name
+        '''
+        query, args = 'SELECT * FROM members', ()
+        if bound is not None:
+            query, args = query + ' WHERE bound = ?', (bound,)
+        rows = self.db.execute(query + ' ORDER BY name', args).fetchall()
+        return [ Member(*r) for r in rows if fnmatch.fnmatchcase(r[0], pattern) ]
+
+    def names(self, prefix=''):
+        ''':return: the sorted names of the members starting with `prefix`'''
+        rows = self.db.execute('SELECT name FROM members WHERE substr(name, 1, ?) = ? ORDER BY name',
+                               (len(prefix), prefix))
+        return [ r[0] for r in rows ]
+
+    def read(self, name):
+        '''
+        :return: the content (bytes) of the member `name`
+        :raises KeyError: when there is no such member
+        '''
+        member = self.member(name)
+        if member is None:
+            raise KeyError(name)
+
+        with open(self.zip_file, 'rb') as f:
+            f.seek(member.offset)
+            data = f.read(member.size)
+
+        if member.method == zipfile.ZIP_DEFLATED:
+            data = zlib.decompress(data, -zlib.MAX_WBITS)
+        if zlib.crc32(data) != member.crc:
+            raise zipfile.BadZipFile("Bad crc for {} in {}".format(name, self.zip_file))
+        return data
+
+    ############### WRITING ###################################################
+
+    def loose(self, bounds):
+        '''
+        :return: the sorted names of the files of the model folder that belong
+            to one of the `bounds` and are not packed yet
+        '''
+        bounds = set(bounds)
+        result = []
+        for folder, dirs, files in os.walk(self.model):
+            relative = os.path.relpath(folder, self.model).replace(os.sep, '/')
+            if relative == '.':
+                dirs[:] = [ d for d in dirs if d not in KEEP ]
+                relative = ''
+            for file in files:
+                name = relative + '/' + file if relative else file
+                # the files being written (renamed when complete) are skipped
+                if '.tmp' in file or name in (ARCHIVE, MANIFEST):
+                    continue
+                if bound_of(name) in bounds:
+                    result.append(name)
+        return sorted(result)
+
+    def pack(self, bounds):
+        '''
+        Moves the files of the given `bounds` into the archive: the files are
+        appended to the zip, registered in the manifest and removed from the
+        folder of the model (in this order, so that a crash never loses a file).
+
+        :return: the number of packed files
+        '''
+        # the write transaction serializes the processes packing the same model
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            names = self.loose(bounds)
+            if not names:
+                self.db.execute('ROLLBACK')
+                return 0
+
+            self._repair()
+            with zipfile.ZipFile(self.zip_file, 'a', allowZip64=True) as archive, \
+                 warnings.catch_warnings():
+                # a file packed again is appended (see the module documentation)
+                warnings.simplefilter('ignore', UserWarning)
+                for name in names:
+                    stored = name.endswith(STORED)
+                    method = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+                    archive.write(os.path.join(self.model, name), name, compress_type=method)
+                infos = archive.infolist()[-len(names):]
+            # once closed, start_dir is the position of the central directory
+            directory = archive.start_dir
+
+            with open(self.zip_file, 'rb') as f:
+                rows = [ (i.filename, bound_of(i.filename), data_offset(f, i.header_offset),
+                          i.compress_size, i.file_size, i.compress_type, i.CRC) for i in infos ]
+                f.seek(directory)
+                tail = f.read()
+
+            self.db.executemany('INSERT OR REPLACE INTO members VALUES (?,?,?,?,?,?,?)', rows)
+            self.db.execute('INSERT OR REPLACE INTO directory VALUES (0,?,?)', (directory, tail))
+            self.db.execute('COMMIT')
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+
+        for name in names:
+            os.remove(os.path.join(self.model, name))
+        prune(self.model)
+        return len(names)
+
+    def repair(self):
+        '''
+        Restores the zip as it was after the last committed pack (see the module
+        documentation)
+
+        :return: True iff the zip had to be repaired
+        '''
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            repaired = self._repair()
+            self.db.execute('COMMIT')
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        return repaired
+
+    def _repair(self):
+        # this must be called in a write transaction (see `pack` and `repair`)
+        row = self.db.execute('SELECT offset, tail FROM directory').fetchone()
+        if row is None or not os.path.exists(self.zip_file):
+            return False
+
+        directory, tail = row
+        with open(self.zip_file, 'r+b') as f:
+            f.seek(directory)
+            if f.read(len(tail) + 1) == tail:
+                return False
+            # the entries of the interrupted pack are dropped (their files are
+            # still loose: they are packed again)
+            f.seek(directory)
+            f.write(tail)
+            f.truncate()
+        return True
+
+    def extract(self, members, output):
+        '''
+        Writes the given `members` in the `output` folder (keeping their path)
+
+        :return: the paths of the extracted files
+        '''
+        result = []
+        for member in members:
+            path = os.path.join(output, *member.name.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(self.read(member.name))
+            result.append(path)
+        return result
+
+def data_offset(f, header_offset):
+    '''
+    :return: the position of the data of the zip entry whose local header
+        starts at `header_offset` in the (binary) zip file `f`
+    '''
+    f.seek(header_offset)
+    header = f.read(zipfile.sizeFileHeader)
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    return header_offset + zipfile.sizeFileHeader + name_length + extra_length
+
+def prune(model):
+    '''
+    Removes the (now) empty folders of the `model` folder
+    '''
+    for folder, dirs, files in os.walk(model, topdown=False):
+        if folder != model and not os.listdir(folder):
+            os.rmdir(folder)
+
+############### ENTRY POINTS ##################################################
+
+def pack(model, bounds):
+    '''
+    Packs the files of the given `bounds` of `model` in its archive (see
+    `Archive.pack`)
+
+    :return: the number of packed files
+    '''
+    with Archive(model) as archive:
+        return archive.pack(bounds)
+
+def open_artifact(model, name):
+    '''
+    :param model: the folder of the model
+    :param name: the path of the artifact, relative to the model folder
+    :return: a binary file object reading the artifact `name` of the `model`
+        (from its loose file if it exists, from the archive otherwise)
+    :raises FileNotFoundError: when the artifact is nowhere to be found
+    '''
+    path = os.path.join(model, *name.split('/'))
+    if os.path.isfile(path) or not exists(model):
+        return open(path, 'rb')
+
+    with Archive(model, readonly=True) as archive:
+        try:
+            return io.BytesIO(archive.read(name))
+        except KeyError:
+            raise FileNotFoundError("No artifact {} for model '{}'".format(name, model))
+
+def arguments():
+    args = argparse.ArgumentParser(prog="commu extract", description="""
+        Lists or extracts the artifacts of a model which were packed in its
+        archive (see --archive)
+    """)
+
+    model             = args.add_argument("model")
+    model.help        = "The folder of the model (holding artifacts.zip)"
+
+    patterns          = args.add_argument("patterns", nargs='*')
+    patterns.help     = "Glob patterns of the artifacts to extract (ie. 'communities/*'). All by default"
+
+    bound             = args.add_argument("-b", "--bound", type=int)
+    bound.help        = "Only extract the artifacts of that bound"
+
+    output            = args.add_argument("-o", "--output")
+    output.help       = "The folder where to extract the artifacts (default: the model folder)"
+
+    listing           = args.add_argument("-l", "--list", action="store_true")
+    listing.help      = "Only list the matching artifacts (name, bound and size)"
+
+    return args
+
+def main(argv=None):
+    '''
+    The entry point of the `commu extract` subcommand.
+    '''
+    args = arguments().parse_intermixed_args(argv)
+    try:
+        archive = Archive(args.model, readonly=True)
+    except FileNotFoundError as e:
+        sys.exit(str(e))
+
+    with archive:
+        selected = {}
+        for pattern in args.patterns or ['*']:
+            for member in archive.members(pattern, args.bound):
+                selected[member.name] = member
+        selected = [ selected[n] for n in sorted(selected) ]
+
+        if args.list:
+            for member in selected:
+                print("{:>4}  {:>12}  {}".format(member.bound, member.length, member.name))
+            return
+
+        output = args.output or args.model
+        paths  = archive.extract(selected, output)
+        print("{} artifact(s) extracted in {}".format(len(paths), output), file=sys.stderr)
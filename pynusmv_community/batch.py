@@ -0,0 +1,403 @@
+'''
+This module contains the logic of the `commu batch` subcommand. This command
+runs the analysis of many (model, formula, bound) combinations described in
+a manifest file on a pool of worker processes.
+
+The manifest is a YAML (or JSON) file that looks like this:
+
+.. code-block:: yaml
+
+    output : nightly               # where to generate all the artifacts
+    workers: 8                     # the size of the worker pool
+    options: ['--dump-stats']      # the cmdline options common to all jobs
+    jobs   :
+      - model   : philo_9
+        path    : /path/to/models
+        formulas: [~, 'F G (p1.waiting -> F !p1.waiting)']   # ~ means none
+        bounds  : {min: 0, max: 20} # inclusive range (or a list of bounds)
+        options : ['--expansion', 'clique,64:sample']
+
+.. note::
+    Each worker keeps the last model it has loaded in memory so that running
+    several jobs on the same model only pays the NuSMV startup once. To that
+    end, the tasks are dispatched grouped by model.
+
+.. note::
+    Each (model, formula, bound) record is appended to a checkpoint file
+    (`checkpoint.jsonl` in the output folder) as soon as it is finished. When a
+    batch is restarted, the tasks whose record is already present in the
+    checkpoint are not analyzed again.
+
+.. note::
+    The outputs of each task are generated in the `{model}/{key}` folder of
+    the output folder, where the key identifies the path, formula and options
+    of the task (see `task_folder`). This way, the tasks which only differ by
+    their formula or options never write the same files. The 
+    `{model}/tasks.txt` file maps each key to the formula and options it 
+    stands for.
+'''
+import os
+import sys
+import json
+import hashlib
+import argparse
+import contextlib
+import multiprocessing
+
+from collections import namedtuple, OrderedDict
+
+# The name of the checkpoint file (in the output folder)
+CHECKPOINT = 'checkpoint.jsonl'
+
+# One analysis to perform
+Task = namedtuple('Task', 'path model formula bound options')
+
+############### MANIFEST ######################################################
+
+def load_manifest(filename):
+    '''
+    Loads the manifest from the given `filename` (YAML or JSON)
+
+    :return: the manifest as a dictionary
+    '''
+    with open(filename, 'r') as f:
+        if filename.endswith('.json'):
+            return json.load(f)
+
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError("PyYAML is required to read YAML manifests "
+                               "(pip install pyyaml) -- or use a JSON manifest")
+        return yaml.safe_load(f)
+
+def bounds_of(job):
+    '''
+    :return: the list of bounds to analyze for the given `job`. The bounds of a
+        job are either given as one single integer, as an explicit list of 
+        bounds or as a dictionary with the 'min' and 'max' (inclusive) keys.
+    '''
+    bounds = job.get('bounds', {'min': 0, 'max': 10})
+    if isinstance(bounds, int):
+        return [bounds]
+    if isinstance(bounds, dict):
+        return list(range(bounds.get('min', 0), 1+bounds['max']))
+    return sorted(set(int(b) for b in bounds))
+
+def tasks_of(manifest):
+    '''
+    :return: the list of all the tasks described in the `manifest` grouped by
+        model.
+    '''
+    common = list(manifest.get('options', []))
+    tasks  = []
+
+    for job in manifest.get('jobs', []):
+        formulas = job.get('formulas', [job.get('formula')])
+        options  = common + list(job.get('options', []))
+
+        for formula in formulas:
+            for bound in bounds_of(job):
+                tasks.append(Task(job.get('path', '.'), job['model'], formula, bound, options))
+
+    # tasks on one same model are dispatched one after the other
+    return sorted(tasks, key=lambda t: (t.path, t.model))
+
+def normalize_options(options):
+    '''
+    :return: a canonical string of the cmdline `options`: each option is kept
+        together with its values and the options are sorted, so that the same 
+        options given in some other order yield the same string.
+    '''
+    groups = []
+    for token in options:
+        if token.startswith('-') or not groups:
+            groups.append([token])
+        else:
+            groups[-1].append(token)
+    return ' '.join(sorted(' '.join(g) for g in groups))
+
+def key_of(path, model, formula, bound, options):
+    '''
+    :return: the key identifying one record in the checkpoint. Two jobs on the
+        same model name but on a different path or with different options are
+        distinct.
+    '''
+    return (os.path.abspath(path), model, formula or '', bound, normalize_options(options))
+
+def task_key(task):
+    ''':return: the key (see `key_of`) of the given `task`'''
+    return key_of(task.path, task.model, task.formula, task.bound, task.options)
+
+def task_folder(task):
+    '''
+    :return: the folder (relative to the output folder) where the outputs of
+        `task` are generated. All the bounds of one (path, model, formula, 
+        options) combination share the same folder.
+    '''
+    path, model, formula, _, options = task_key(task)
+    digest = hashlib.sha1('\0'.join((path, formula, options)).encode('utf-8'))
+    return "{}/t{}".format(model, digest.hexdigest()[:10])
+
+def check_options(tasks):
+    '''
+    Makes sure that the cmdline options of all the `tasks` are valid *before*
+    any of them is dispatched to a worker.
+
+    :raise RuntimeError: when the options of some task can't be parsed (the 
+        reason was printed by argparse)
+    '''
+    from pynusmv_community import cmdline
+
+    parser = cmdline.arguments()
+    for options in sorted({ tuple(t.options) for t in tasks }):
+        try:
+            parser.parse_args(list(options) + ['model'])
+        except SystemExit:
+            raise RuntimeError("invalid options in the manifest: {}".format(' '.join(options)))
+
+def dump_task_keys(output, tasks):
+    '''
+    Writes the `{model}/tasks.txt` files (in `output`) mapping the folder of
+    each task to its formula and options.
+    '''
+    folders = OrderedDict()
+    for task in tasks:
+        folders.setdefault(task_folder(task), task)
+
+    by_model = OrderedDict()
+    for folder, task in folders.items():
+        by_model.setdefault(task.model, []).append((folder, task))
+
+    for model, entries in by_model.items():
+        os.makedirs(os.path.join(output, model), exist_ok=True)
+        with open(os.path.join(output, model, 'tasks.txt'), 'w') as f:
+            for folder, task in entries:
+                f.write("{}\t{}\t{}\n".format(os.path.basename(folder), task.formula or '', 
+                                             normalize_options(task.options)))
+
+############### CHECKPOINT ####################################################
+
+def read_checkpoint(output):
+    '''
+    :return: an ordered dictionary key -> record of all the records that were
+        already checkpointed in the `output` folder
+    '''
+    done = OrderedDict()
+    path = os.path.join(output, CHECKPOINT)
+
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # the last line may have been truncated by a crash
+                    continue
+                # the entries of older checkpoints (without path and options)
+                # can't be told apart: these tasks are simply run again
+                if 'path' not in entry:
+                    continue
+                key       = key_of(entry['path'], entry['model'], entry['formula'], entry['bound'], entry['options'])
+                done[key] = entry['record']
+    return done
+
+def write_checkpoint(f, task, record):
+    '''
+    Appends the `record` obtained for `task` to the checkpoint file `f`, and
+    makes sure that it is persisted on disk.
+    '''
+    entry = {'path'   : os.path.abspath(task.path),
+             'model'  : task.model, 
+             'formula': task.formula or '', 
+             'bound'  : task.bound, 
+             'options': list(task.options),
+             'record' : record}
+    print(json.dumps(entry), file=f)
+    f.flush()
+    os.fsync(f.fileno())
+
+############### WORKERS #######################################################
+
+# The context of the model currently loaded in this worker (if any)
+__LOADED  = None
+__CONTEXT = None
+
+def _ensure_loaded(path, model):
+    '''
+    Makes sure the `model` is the one loaded in this worker process. When some
+    other model is currently loaded, it is released first.
+    '''
+    global __LOADED, __CONTEXT
+    from pynusmv_community import main
+
+    if __LOADED == (path, model):
+        return
+
+    if __CONTEXT is not None:
+        __CONTEXT.close()
+        __LOADED, __CONTEXT = None, None
+
+    context = contextlib.ExitStack()
+    context.enter_context(main.loaded_model(path, model))
+    __LOADED, __CONTEXT = (path, model), context
+
+def _release():
+    '''
+    Releases the model loaded in this worker (if any)
+    '''
+    global __LOADED, __CONTEXT
+
+    if __CONTEXT is not None:
+        __CONTEXT.close()
+    __LOADED, __CONTEXT = None, None
+
+def _init_worker(output):
+    '''
+    Initializes a worker process: all artifacts are generated in `output`
+    '''
+    import atexit
+
+    os.chdir(output)
+    atexit.register(_release)
+
+def run_task(task):
+    '''
+    Analyzes one task (this is executed in a worker process).
+
+    :return: a tuple (task, record, error) where either the record (flattened
+        dictionary of stats) or the error message is None.
+    '''
+    from pynusmv_community import main, cmdline, render, archive
+
+    try:
+        _ensure_loaded(task.path, task.model)
+
+        folder = task_folder(task)
+        flags  = cmdline.arguments().parse_args(task.options + [task.model])
+        record = main.analyze_one(folder, task.bound, task.formula, flags)
+        record['instance'] = [task.model]
+        if flags.archive:
+            render.wait()
+            archive.pack(folder, [task.bound])
+        return (task, { k: v[0] for k,v in record.items() }, None)
+    # argparse exits on a bad option: that must not kill the worker
+    except (Exception, SystemExit) as e:
+        # the model is reloaded from scratch for the next task
+        _release()
+        return (task, None, '{}: {}'.format(type(e).__name__, e))
+
+############### AGGREGATION ###################################################
+
+def summarize(output, done, tasks):
+    '''
+    Writes a summary (`batch.csv`) of all the checkpointed records in `output`
+    and dumps the per-model statistics for the models of the tasks that were
+    run with the '--dump-stats' option.
+    '''
+    import pandas
+    from pynusmv_community import dump
+
+    if not done:
+        return
+
+    frames = []
+    for (path, model, formula, bound, options), record in done.items():
+        row = dict(record)
+        row['formula'] = formula
+        row['path']    = path
+        row['options'] = options
+        frames.append(row)
+
+    data = pandas.DataFrame(frames)
+    data.to_csv(os.path.join(output, 'batch.csv'), sep=';', index=False)
+
+    with_stats = { t.model for t in tasks if '--dump-stats' in t.options }
+    for model in sorted(with_stats & set(data['instance'])):
+        cwd = os.getcwd()
+        try:
+            os.chdir(output)
+            dump.statistics(model, data[data['instance'] == model].sort_values(['path', 'options', 'formula', 'bound']))
+        finally:
+            os.chdir(cwd)
+
+############### ENTRY POINT ###################################################
+
+def arguments():
+    args = argparse.ArgumentParser(prog="commu batch", description="""
+        Runs the analysis of all the (model, formula, bound) combinations
+        described in a manifest on a pool of workers
+    """)
+
+    manifest          = args.add_argument("manifest")
+    manifest.help     = "The YAML (or JSON) manifest describing the jobs to run"
+
+    workers           = args.add_argument("-j", "--workers", type=int)
+    workers.help      = "The number of worker processes (overrides the manifest)"
+
+    output            = args.add_argument("-o", "--output")
+    output.help       = "The output folder (overrides the manifest)"
+
+    restart           = args.add_argument("--restart", action="store_true")
+    restart.help      = "Ignore the checkpoint and redo all the work"
+
+    return args
+
+def run(manifest, output, workers=None, restart=False):
+    '''
+    Runs all the tasks of the `manifest` which are not checkpointed yet in the
+    `output` folder.
+
+    :return: the number of tasks that failed
+    '''
+    os.makedirs(output, exist_ok=True)
+
+    tasks   = tasks_of(manifest)
+
+    if restart:
+        from pynusmv_community import evolution
+        if os.path.exists(os.path.join(output, CHECKPOINT)):
+            os.remove(os.path.join(output, CHECKPOINT))
+        # the workers resume the evolution tracking: only start it over here
+        for folder in { task_folder(t) for t in tasks }:
+            evolution.reset(os.path.join(output, folder))
+
+    done    = read_checkpoint(output)
+    todo    = [ t for t in tasks if task_key(t) not in done ]
+    failed  = 0
+
+    print("{} tasks, {} already done, {} to go".format(len(tasks), len(tasks)-len(todo), len(todo)))
+
+    if todo:
+        check_options(todo)
+        dump_task_keys(output, tasks)
+
+        # make the task paths independent of the worker's working directory
+        todo = [ t._replace(path=os.path.abspath(t.path)) for t in todo ]
+
+        with open(os.path.join(output, CHECKPOINT), 'a') as f, \
+             multiprocessing.Pool(workers, _init_worker, (os.path.abspath(output),)) as pool:
+
+            for task, record, error in pool.imap_unordered(run_task, todo):
+                if error:
+                    failed += 1
+                    print("FAILED {} | {} | {} -> {}".format(task.model, task.formula, task.bound, error), file=sys.stderr)
+                else:
+                    write_checkpoint(f, task, record)
+                    done[task_key(task)] = record
+
+    summarize(output, done, tasks)
+    return failed
+
+def main(argv=None):
+    '''
+    The entry point of the `commu batch` subcommand.
+    '''
+    args     = arguments().parse_args(argv)
+    manifest = load_manifest(args.manifest)
+    output   = args.output  or manifest.get('output', '.')
+    workers  = args.workers or manifest.get('workers')
+
+    failed   = run(manifest, output, workers, args.restart)
+    if failed:
+        sys.exit("{} task(s) failed. Run the same command again to retry them.".format(failed))
@@ -3,11 +3,18 @@ This module contains nothing but the logic to parse the command line arguments
 '''
 import argparse
 
-from collections import namedtuple 
+from pynusmv_community import stages
 
 # Is the verbosity turned on ?
 __VERBOSE = False
 
+def positive(text):
+    ''':return: the positive integer given as `text` (an argparse type)'''
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, not {}".format(value))
+    return value
+
 def arguments():
     args = argparse.ArgumentParser(description="""
         A tool to analyze the community structure of SAT BMC problem instances
@@ -38,6 +45,109 @@ def arguments():
     formula           = general.add_argument("-f", "--formula")
     formula.help      = "A formula to generate the model checking problem"
     
+    formulas          = general.add_argument("-F", "--formula-file")
+    formulas.help     = "A file listing one LTL formula per line: each of them is analyzed on the same unrolled model"
+    
+    ################## SWEEP ##################################################
+    sweep             = args.add_argument_group("Sweep")
+    sweep.help        = "Configuration of the bounds that are analyzed"
+    
+    adaptive          = sweep.add_argument("--adaptive", action="store_true")
+    adaptive.help     = "Analyze a coarse grid of bounds and only refine where the modularity or #commu. change"
+    
+    step              = sweep.add_argument("--coarse-step", type=int)
+    step.help         = "The distance between two bounds of the coarse grid (with --adaptive)"
+    step.default      = 10
+    
+    tol_q             = sweep.add_argument("--tolerance-modularity", type=float)
+    tol_q.help        = "Refine the intervals where the modularity changes more than that (with --adaptive)"
+    tol_q.default     = 0.01
+    
+    tol_c             = sweep.add_argument("--tolerance-communities", type=float)
+    tol_c.help        = "Refine the intervals where #commu. changes (relatively) more than that (with --adaptive)"
+    tol_c.default     = 0.05
+    
+    max_bounds        = sweep.add_argument("--max-analyzed-bounds", type=int)
+    max_bounds.help   = "The max number of bounds to analyze"
+    
+    budget            = sweep.add_argument("--time-budget", type=float)
+    budget.help       = "The max duration of the sweep in seconds (no new bound is started beyond that)"
+    
+    max_edges         = sweep.add_argument("--max-edges", type=int)
+    max_edges.help    = "Do not start a bound whose graph is predicted to have more edges than that"
+    
+    max_rss           = sweep.add_argument("--max-rss", type=int)
+    max_rss.help      = "Do not start a bound whose analysis is predicted to need more memory (in MB) than that"
+    
+    timeout           = sweep.add_argument("--phase-timeout", type=float)
+    timeout.help      = "The max duration (in seconds) of each phase (cnf, graph, clustering, stages) of a bound. "\
+                      + "A bound whose phase times out is skipped; no bound predicted to time out is started"
+    
+    on_limit          = sweep.add_argument("--on-limit", choices=['degrade', 'stop'])
+    on_limit.help     = "What to do when a limit would be exceeded: degrade the analysis (single clustering "\
+                      + "instead of an ensemble, sampled graph) or stop the sweep"
+    on_limit.default  = 'degrade'
+    
+    ################## GRAPH CONSTRUCTION #####################################
+    graph             = args.add_argument_group("Graph")
+    graph.help        = "Configuration of the construction of the VIG"
+    
+    build             = graph.add_argument("--chunk-size", type=int)
+    build.help        = "The number of clauses processed in one batch while building the VIG"
+    
+    ram_cap           = graph.add_argument("--ram-cap", type=int)
+    ram_cap.help      = "The max size (in MB) of the VIG edges held in RAM (beyond that, edges are spilled to disk)"
+    
+    spill_dir         = graph.add_argument("--spill-dir")
+    spill_dir.help    = "The directory where the VIG edges exceeding the RAM cap are spilled"
+    
+    expansion         = graph.add_argument("--expansion")
+    expansion.help    = "How clauses are expanded as edges depending on their length. (A comma separated "\
+                      + "list of [threshold:]strategy where strategy is one of clique, star, sample, skip. "\
+                      + "ie: 'clique,64:sample,4096:skip')"
+    expansion.default = 'clique'
+    
+    degree            = graph.add_argument("--sample-degree", type=int)
+    degree.help       = "The average number of edges sampled per variable in the clauses expanded with 'sample'"
+    degree.default    = 8
+    
+    simplify          = graph.add_argument("--simplify", action="store_true")
+    simplify.help     = "Simplify the CNF (unit propagation, duplicate/subsumed clauses removal, pure literal "\
+                      + "elimination) before building its graph. The sizes before/after are reported in the stats"
+    
+    project           = graph.add_argument("--project-semantic", action="store_true")
+    project.help      = "Cluster (and analyze) the projection of the graph on the model variables: the Tseitin "\
+                      + "auxiliary vertices are eliminated by connecting their semantic neighbours"
+    
+    hops              = graph.add_argument("--projection-hops", type=positive)
+    hops.help         = "The max number of auxiliary vertices on a path contracted by --project-semantic (at least 1)"
+    hops.default      = 2
+    
+    levels            = graph.add_argument("--keep-levels", action="store_true")
+    levels.help       = "Keep (and dump) all the levels of the multilevel community hierarchy"
+    
+    level             = graph.add_argument("--level", type=int)
+    level.help        = "The level of the hierarchy analyzed by the dumps, visualizations and mining "\
+                      + "(0 is the finest, -1 the coarsest). Only meaningful with --keep-levels"
+    level.default     = -1
+    
+    ensemble          = graph.add_argument("--ensemble", type=int)
+    ensemble.help     = "Run that many seeded clusterings of each graph, use their consensus partition and "\
+                      + "report the mean/std modularity and the stability of the communities "\
+                      + "(the hierarchy is not kept in this mode)"
+    
+    ens_jobs          = graph.add_argument("--ensemble-jobs", type=int)
+    ens_jobs.help     = "The number of worker processes running the clusterings of the ensemble"
+    ens_jobs.default  = 1
+    
+    external          = graph.add_argument("--import-membership")
+    external.help     = "Use the clustering computed by an external tool rather than computing it. This is "\
+                      + "the name of the membership file of each bound, where {model} and {bound} are "\
+                      + "substituted (ie. 'parts/{model}.{bound:03d}.txt', see core.import_membership)"
+    
+    seed              = graph.add_argument("--seed", type=int)
+    seed.help         = "The seed of the random generator (ie. used to sample edges)"
+    
     ################## DUMP COMMAND ###########################################
     dump              = args.add_argument_group("Dump")
     dump.help         = "Generate some raw data files about the analyzed instance(s)"
@@ -60,9 +170,33 @@ def arguments():
     stats             = dump.add_argument("--dump-stats", action="store_true")
     stats.help        = 'CSV file containing the evolution of modularity and #commu.'
     
+    index             = dump.add_argument("--build-index", action="store_true")
+    index.help        = 'Build the semantic index name -> (bound, vertex, community) (see commu query)'
+    
+    evolution         = dump.add_argument("--track-evolution", action="store_true")
+    evolution.help    = 'Match the communities of neighbouring analyzed bounds and dump their lineage and evolution events'
+    
+    evo_threshold     = dump.add_argument("--evolution-threshold", type=float)
+    evo_threshold.help= 'The min Jaccard index of two matching communities (with --track-evolution)'
+    evo_threshold.default = 0.3
+    
+    stats_fmt         = dump.add_argument("--stats-format")
+    stats_fmt.help    = 'Comma separated formats of the stats (csv, parquet)'
+    stats_fmt.default = 'csv'
+    
     stats             = dump.add_argument("--dump-json-cluster-graph", action="store_true")
     stats.help        = 'JSON file containing a representation of the cluster graph'
     
+    edgelist          = dump.add_argument("--dump-edgelist", action="store_true")
+    edgelist.help     = 'Binary (int32) edge list of the graph, to cluster it with an external tool'
+    
+    metis             = dump.add_argument("--dump-metis", action="store_true")
+    metis.help        = 'METIS file of the graph, to cluster it with an external tool'
+    
+    archive           = dump.add_argument("--archive", action="store_true")
+    archive.help      = 'Pack the artifacts of each bound in {model}/artifacts.zip (indexed by '\
+                      + '{model}/artifacts.sqlite) rather than in many small files. See `commu extract`'
+    
     
     ################## SHOW COMMAND ###########################################
     show              = args.add_argument_group("Visualization")
@@ -81,7 +215,7 @@ def arguments():
     time_table.help   = 'Generates a d3 time/table based visualisation of the problem (very useful!)'
     
     fca_concepts      = show.add_argument("--show-formal-concepts", action="store_true")
-    fca_concepts.help = 'Shows the concepts that could be mined in each of the communities using formal concept analysis'
+    fca_concepts.help = 'Mines the concepts of each community using formal concept analysis (see --fca-* options)'
     
     clouds            = show.add_argument("--show-clouds", action="store_true")
     clouds.help       = 'Generate a word cloud for each community' 
@@ -89,6 +223,25 @@ def arguments():
     stats             = show.add_argument("--show-stats", action="store_true")
     stats.help        = 'Plot the evolution of modularity and #commu.' 
     
+    r_format          = show.add_argument("--render-format", choices=['png', 'svg', 'webp', 'pdf'])
+    r_format.help     = 'Format of the images of --show-vig/--show-cluster-graph (default: png/svg). '\
+                      + 'webp needs Pillow'
+    
+    r_size            = show.add_argument("--render-size", type=int)
+    r_size.help       = 'Width (and height) in pixels of the rendered images (default: 2400/3200)'
+    
+    r_jobs            = show.add_argument("--render-jobs", type=int)
+    r_jobs.help       = 'Number of processes rendering the images in the background'
+    r_jobs.default    = 1
+    
+    r_timeout         = show.add_argument("--render-timeout", type=float)
+    r_timeout.help    = 'Max duration (in seconds) of the rendering of one image; it is killed afterwards (0: no limit)'
+    r_timeout.default = 600
+    
+    r_max_edges       = show.add_argument("--render-max-edges", type=int)
+    r_max_edges.help  = 'The graphs having more edges than this are not rendered (the reason is logged)'
+    r_max_edges.default = 250000
+    
     ################## MINE COMMAND ###########################################
     mine              = args.add_argument_group("Mining")
     mine.help         = "Mines the semantic information (SMV identifiers)"
@@ -99,11 +252,41 @@ def arguments():
     sequences         = mine.add_argument("--mine-sequences", action="store_true")
     sequences.help    = 'Mine frequently occuring *sequences* with "a priori"' 
     
+    m_cache           = mine.add_argument("--mining-cache-size", type=int)
+    m_cache.help      = 'Max size (in MB) of the cache of the mined patterns/sequences of identical communities '\
+                      + '({model}/mining/mining.sqlite). 0 disables the cache'
+    m_cache.default   = 64
+    
+    m_normalize       = mine.add_argument("--mining-time-normalize", action="store_true")
+    m_normalize.help  = 'Let the mining cache match the communities having the same content at different time frames'
+    
+    fca_supp          = mine.add_argument("--fca-min-support", type=float)
+    fca_supp.help     = 'Min support of the formal concepts (a fraction of the community size when < 1)'
+    fca_supp.default  = 0.1
+    
+    fca_max           = mine.add_argument("--fca-max-concepts", type=int)
+    fca_max.help      = 'Max number of formal concepts computed per community'
+    fca_max.default   = 256
+    
+    fca_jobs          = mine.add_argument("--fca-jobs", type=int)
+    fca_jobs.help     = 'Number of processes used to compute the formal concepts of the communities'
+    fca_jobs.default  = 1
+    
+    ################## PLUGIN STAGES ##########################################
+    plugins           = stages.discover()
+    if plugins:
+        extra         = args.add_argument_group("Plugins")
+        extra.help    = "Artifact stages registered by third party packages"
+        
+        for flag in plugins:
+            stage     = extra.add_argument("--"+flag.replace('_', '-'), action="store_true", dest=flag)
+            stage.help= 'Run the {} stage (plugin)'.format(flag)
+    
     return args
 
-def parse_args():
+def parse_args(argv=None):
     args              = arguments()
-    parsed            = args.parse_args()
+    parsed            = args.parse_args(argv)
     
     if parsed.verbose:
         global __VERBOSE
@@ -112,10 +295,11 @@ def parse_args():
     return parsed
 
 def do_nothing_flags():
-    flags = namedtuple('Flags', 'dump_cnf dump_mapping dump_communities dump_raw_communities dump_semantic_communities dump_stats '
-                              + 'show_vig show_cluster_graph show_d3_cluster_graph showw_time_table show_formal_concepts show_clouds show_stats '
-                              + 'mine_patterns mine_sequences')
-    return flags(False, False, False, False, False, False, False, False, False, False, False, False, False, False, False)
+    '''
+    :return: a set of flags where all the options have their default value
+        (hence, none of the artifacts stages is enabled).
+    '''
+    return arguments().parse_args(['idle'])
     
 def log_verbose(func):
     '''
@@ -2,7 +2,13 @@
 This module contains some utility function that help analyze BMC instances
 '''
 import math
-import concepts
+
+from collections import namedtuple
+
+# The complete multilevel (Louvain) community hierarchy of a graph: 
+# membership is a (#levels, #vertices) int32 array (one partition per level,
+# from the finest to the coarsest) and modularity holds the q-score of each level
+Hierarchy = namedtuple('Hierarchy', 'membership modularity')
 
 # # PyNuSMV
 # import pynusmv.init          as _init
@@ -40,6 +46,9 @@ def cnf_to_be_var(literal):
     :return: a `BeVar` object representing the given literal but provinding 
         plenty of additional meta-data about that bit.  
     '''
+    if literal == 0:
+        return None
+    
     enc    = _enc.BeEnc.global_singleton_instance()
     mgr    = enc.manager
     # This line can fail because of the 0 return value
@@ -82,12 +91,11 @@ def vertex_to_lit(graph, vertex):
     :param vertex: an integer denoting the igraph identifier of some vertex
     :return: the CNF literal associated with some `vertex`
     '''
-    return graph.vs[vertex]['lit']
+    return int(graph.lit[vertex])
 
 def vertex_to_be_var(graph, vertex):
     '''
-    :param graph: a graph having the 'lit' attribute set for all vertices 
-        and containing `vertex` 
+    :param graph: a `VIG` containing `vertex` 
     :param vertex: a boolean variable of the problem as it is represented in the
         associated graph.
     :return: The `BeVar` associated with the literal represented by `vertex` in
@@ -97,28 +105,29 @@ def vertex_to_be_var(graph, vertex):
  
 def vertex_repr(graph, vertex):
     '''
-    :param graph: a graph having the 'lit' attribute set for all vertices 
-        and containing `vertex` 
+    :param graph: a `VIG` containing `vertex` 
     :param vertex: a boolean variable of the problem as it is represented in the
         associated graph.
     :return: a  short string representation of the semantic info associated with
         the `vertex` in the `graph`
     '''
-    return short_var_repr(vertex_to_be_var(graph, vertex))
+    return graph.semantics[vertex]
+
+def semantic_name(repres):
+    '''
+    :param repres: the short representation of a variable (see `short_var_repr`)
+    :return: the name of the semantic variable (without bit and time info)
+    '''
+    return repres.split(sep="*")[0]
 
 def semantic_vars(graph):
     '''
     Lists all the semantic variables that intervene in the problem.
+    
+    .. note::
+        The NuSMV lookups are only performed once per graph (see `VIG.semantics`)
     '''
-    result = set()
-    for vertex in graph.vs:
-        literal= vertex['lit']
-        be_var = cnf_to_be_var(literal)
-        repres = short_var_repr(be_var)
-        name   = repres.split(sep="*")[0]
-        result.add(name)
-        
-    return sorted( list( result ) )
+    return sorted( set( semantic_name(r) for r in graph.semantics ) )
 
 ############### GENERATION UTILS #############################################
 
@@ -148,6 +157,48 @@ def mk_cnf_with_formula(formula, bound):
     problem = _ltlspec.generate_ltl_problem(fsm, prop, bound).to_cnf()
     return problem
 
+def mk_property_cnf(formula, bound):
+    '''
+    :return: a `BeCnf` expression encoding the (bounded) semantics of the LTL
+        `formula` for `bound` time steps, *without* the unrolled model. The 
+        conjunction of this cnf with the one of `mk_cnf_no_formula(bound)` 
+        yields the same problem as `mk_cnf_with_formula(formula, bound)`.
+    
+    .. note::
+        The CNF variables are allocated by NuSMV once per boolean expression,
+        hence the variables of the model path are the same in both cnfs.
+    '''
+    import pynusmv.node        as _node
+    import pynusmv.parser      as _parser
+    import pynusmv.bmc.glob    as _bmc
+    import pynusmv.bmc.ltlspec as _ltlspec
+    
+    prop    = _node.Node.from_ptr( _parser.parse_ltl_spec(formula) )
+    fsm     = _bmc.master_be_fsm()
+    return _ltlspec.bounded_semantics(fsm, prop, bound).to_cnf()
+
+class Conjunction:
+    '''
+    The conjunction of several cnf formulas. It exposes the same attributes as
+    a `BeCnf` (`vars_number`, `clauses_number`, `clauses_list`) so that it can
+    be used wherever a cnf is expected.
+    '''
+    
+    def __init__(self, *parts):
+        self.parts = parts
+    
+    @property
+    def vars_number(self):
+        return max(p.vars_number for p in self.parts)
+    
+    @property
+    def clauses_number(self):
+        return sum(p.clauses_number for p in self.parts)
+    
+    @property
+    def clauses_list(self):
+        return [ c for p in self.parts for c in p.clauses_list ]
+
 def mk_cnf(bound, formula=None):
     '''
     :return: a sat instance for the current problem regardless of whether there
@@ -155,7 +206,8 @@ def mk_cnf(bound, formula=None):
     '''
     return mk_cnf_with_formula(formula, bound) if formula else mk_cnf_no_formula(bound)
 
-def mk_graph(cnf):
+def mk_graph(cnf, chunk_size=None, ram_cap=None, spill_dir=None, 
+             expansion=None, sample_degree=None, seed=None):
     '''
     Generates a variable relationship graph.
     
@@ -168,37 +220,308 @@ def mk_graph(cnf):
         The dimacs CNF format declares way more variables than are actually
         used. This is a waste of resources and it makes the output cluttered
         and hardly analyzable.
+        
+    .. note::
+        The clauses are walked by batches of `chunk_size` clauses and the edges
+        are stored as int32 pairs in a NumPy buffer (which is spilled to a 
+        memory mapped file when it grows bigger than `ram_cap` bytes). This 
+        way, the peak memory scales with the size of the graph rather than with
+        the overhead of python objects.
+        
+    .. note::
+        Expanding long clauses as cliques is O(k^2). The `expansion` policy 
+        permits to choose another strategy (star, sample, skip) for the clauses
+        whose length exceeds some threshold (see `vig.parse_policy`). The 
+        number of clauses handled by each strategy is reported in the 
+        `expansion` attribute of the resulting graph.
+    
+    :param cnf: the `BeCnf` whose VIG is to be built (the result is a `vig.VIG`)
+    :param chunk_size: the number of clauses to process in one batch
+    :param ram_cap: the max number of bytes of edges to keep in RAM
+    :param spill_dir: the directory where edges exceeding `ram_cap` are spilled
+    :param expansion: the expansion policy of the clauses (ie. 'clique,64:star')
+    :param sample_degree: the avg number of edges sampled per variable of the 
+        clauses expanded with the 'sample' strategy
+    :param seed: the seed used to sample the edges
+    '''
+    builder    = mk_builder(cnf, chunk_size, ram_cap, spill_dir, expansion, sample_degree, seed)
+    try:
+        return builder.to_vig()
+    finally:
+        builder.close()
+
+def mk_builder(cnf, chunk_size=None, ram_cap=None, spill_dir=None, 
+               expansion=None, sample_degree=None, seed=None):
+    '''
+    :return: a `vig.EdgeBuilder` holding the edges of the VIG of `cnf` (see 
+        `mk_graph` for the meaning of the parameters). The caller is 
+        responsible for closing the builder.
+    '''
+    from pynusmv_community import vig
+    
+    chunk_size = chunk_size or vig.DEFAULT_CHUNK_SIZE
+    ram_cap    = ram_cap    or vig.DEFAULT_RAM_CAP
+    degree     = sample_degree or vig.DEFAULT_SAMPLE_DEGREE
+    builder    = vig.EdgeBuilder(cnf.vars_number, ram_cap, spill_dir, expansion, degree, seed)
+    try:
+        builder.add_all(cnf.clauses_list, chunk_size)
+        return builder
+    except:
+        builder.close()
+        raise
+
+def extend_graph(builder, cnf, chunk_size=None):
+    '''
+    Generates the VIG of the conjunction of the formula whose edges are held
+    by `builder` (see `mk_builder`) and `cnf`. The `builder` is left untouched
+    so that it can be extended with several other formulas.
+    
+    :return: a `vig.VIG`
+    '''
+    from pynusmv_community import vig
+    
+    chunk_size = chunk_size or vig.DEFAULT_CHUNK_SIZE
+    extended   = builder.copy()
+    try:
+        extended.add_all(cnf.clauses_list, chunk_size)
+        return extended.to_vig()
+    finally:
+        extended.close()
+
+############### CLUSTERING ####################################################
+
+def mk_clusters(graph, keep_levels=False, level=-1):
+    '''
+    Computes the community structure of the given `graph` with the multilevel
+    (Louvain) algorithm. 
+    
+    :param graph: the `VIG` to cluster (its edge weights are used if any)
+    :param keep_levels: keep the complete hierarchy of communities (all 
+        the levels of the multilevel algorithm) rather than the final one only
+    :param level: the level of the hierarchy to return as the clustering 
+        (only meaningful when `keep_levels` is True; -1 is the final level)
+    :return: a tuple (clusters, hierarchy) where clusters is the igraph 
+        `VertexClustering` of the requested level and hierarchy is a `Hierarchy`
+        (None when `keep_levels` is False)
+    '''
+    if not keep_levels:
+        return (graph.community_multilevel(weights=graph.weights), None)
+    
+    levels    = graph.community_multilevel(weights=graph.weights, return_levels=True)
+    hierarchy = mk_hierarchy(levels)
+    return (levels[level], hierarchy)
+
+def mk_hierarchy(levels):
+    '''
+    :param levels: the list of `VertexClustering` of all levels of a hierarchy
+    :return: a compact `Hierarchy` representing the given `levels`
+    '''
+    import numpy
+    
+    membership = numpy.array([ l.membership for l in levels ], dtype=numpy.int32)
+    modularity = numpy.array([ l.modularity for l in levels ], dtype=numpy.float64)
+    return Hierarchy(membership.reshape(len(levels), -1), modularity)
+
+def hierarchy_level(graph, hierarchy, level=-1):
+    '''
+    Returns the communities of one `level` of a `hierarchy` without 
+    re-clustering the `graph`.
+    
+    :param graph: the `VIG` whose communities are described by `hierarchy`
+    :param hierarchy: the `Hierarchy` of communities of the graph
+    :param level: the level to retrieve (0 is the finest, -1 the coarsest)
+    :return: an igraph `VertexClustering` 
     '''
     import igraph
     
-    counter  = 0
-    canonical= {} 
+    membership = hierarchy.membership[level].tolist()
+    return igraph.VertexClustering(graph.graph, membership, 
+                                   modularity_params={'weights': graph.weights})
+
+def hierarchy_community_counts(hierarchy, virtual=None):
+    '''
+    :param virtual: the boolean mask of the virtual vertices, which are not 
+        counted (see `vig.VIG.virtual`)
+    :return: the number of communities (having 2+ nodes, see `community_count`)
+        at each level of the `hierarchy`
+    '''
+    import numpy
     
-    edgelist = []
-    lit_attr = []
-    # still \Theta(n^2) but already better.
-    for clause in cnf.clauses_list:
-        for i in range(len(clause)):
-            for j in range(i+1, len(clause)):
-                # no distinction between literals for one variable
-                source = abs(clause[i])
-                dest   = abs(clause[j])
-                
-                if source not in canonical:
-                    canonical[source] = counter
-                    lit_attr.append(source)
-                    counter += 1
-                
-                if dest not in canonical:
-                    canonical[dest] = counter
-                    lit_attr.append(dest)
-                    counter += 1
-                
-                c_src = canonical[source]
-                c_dst = canonical[dest]
-                edgelist.append((c_src, c_dst))
-    
-    return igraph.Graph(n=counter, edges=edgelist, vertex_attrs={'lit': lit_attr})
+    real = slice(None) if virtual is None else ~virtual
+    return [ int((numpy.bincount(m[real]) >= 2).sum()) for m in hierarchy.membership ]
+
+def exclude_virtual(graph, clusters):
+    '''
+    Excludes the virtual vertices of the `graph` (the centres of the clauses
+    expanded with the 'star' strategy) from the outputs of its `clusters`: 
+    the communities only list their real vertices. A virtual vertex alone in
+    its community (without any real vertex) is moved to the community of one
+    of its neighbours beforehand so that no community is empty.
+    
+    :param graph: the `VIG` that has been clustered
+    :param clusters: the igraph `VertexClustering` of the `graph`
+    :return: a `vig.RealClustering` (the `clusters` themselves when the graph
+        has no virtual vertex)
+    '''
+    import numpy
+    import igraph
+    from pynusmv_community import vig
+    
+    virtual = graph.virtual
+    if not virtual.any():
+        return clusters
+    
+    membership = numpy.asarray(clusters.membership, dtype=numpy.int64)
+    has_real   = numpy.bincount(membership[~virtual], minlength=len(clusters)) > 0
+    orphan     = virtual & ~has_real[membership]
+    
+    if orphan.any():
+        # the neighbours of a virtual vertex are all real vertices
+        edges = graph.edges
+        for src, dst in ((0, 1), (1, 0)):
+            moved = orphan[edges[:, src]]
+            membership[edges[moved, src]] = membership[edges[moved, dst]]
+        _, membership = numpy.unique(membership, return_inverse=True)
+        clusters = igraph.VertexClustering(graph.graph, membership.tolist(),
+                                           modularity_params={'weights': graph.weights})
+    
+    return vig.RealClustering(clusters, virtual)
+
+def load_hierarchy(model, bound):
+    '''
+    :return: the `Hierarchy` that was dumped for `model` unrolled `bound` times
+        (see `dump.hierarchy`).
+    '''
+    import numpy
+    from pynusmv_community import archive
+    
+    with archive.open_artifact(model, "hierarchy/{:03d}.npz".format(bound)) as f, numpy.load(f) as data:
+        return Hierarchy(data['membership'], data['modularity'])
+
+############### EXPORT / IMPORT ###############################################
+
+# The weights of the METIS exports are integers: the fractional weights are
+# multiplied by this factor (and rounded) before being exported
+METIS_WEIGHT_SCALE = 1000
+
+def export_edgelist(graph, path, chunk_size=None):
+    '''
+    Exports the `graph` as a compact binary edge list, streamed from its edge
+    arrays (no python list of the edges is ever created). The following files
+    are written:
+    
+        + `path`           : the (src, dst) pairs of vertices (int32, little endian)
+        + `path`.weights   : the weight of each edge (float32, only if weighted)
+        + `path`.literals  : the CNF variable of each vertex (int32)
+    
+    :param graph: the `VIG` to export
+    :param path: the name of the edge list file
+    :param chunk_size: the number of edges written at once
+    '''
+    from pynusmv_community import vig
+    
+    chunk_size = chunk_size or vig.DEFAULT_CHUNK_SIZE
+    edges      = graph.edges
+    
+    with open(path, 'wb') as f:
+        for start in range(0, len(edges), chunk_size):
+            edges[start:start+chunk_size].astype('<i4').tofile(f)
+    
+    if graph.weight is not None:
+        with open(path+'.weights', 'wb') as f:
+            graph.weight.astype('<f4').tofile(f)
+    
+    graph.lit.astype('<i4').tofile(path+'.literals')
+
+def export_metis(graph, path, chunk_size=None):
+    '''
+    Exports the `graph` in the METIS graph format (the format read by METIS,
+    KaHIP, Mt-KaHyPar, ...). Since this format forbids self loops and 
+    parallel edges, the loops are dropped and the parallel edges are merged 
+    (their weights are summed up). The vertices are numbered from 1.
+    
+    .. note::
+        The METIS weights are integers. Hence when the `graph` has fractional
+        weights, they are multiplied by `METIS_WEIGHT_SCALE` and rounded (with
+        a minimum of 1).
+    
+    :param graph: the `VIG` to export
+    :param path: the name of the METIS file
+    :param chunk_size: the number of vertices written at once
+    '''
+    import numpy
+    from scipy import sparse
+    from pynusmv_community import vig
+    
+    chunk_size = chunk_size or vig.DEFAULT_CHUNK_SIZE
+    n          = len(graph)
+    edges      = graph.edges
+    weight     = numpy.ones(len(edges)) if graph.weight is None else graph.weight.astype(numpy.float64)
+    
+    # the symmetric adjacency: parallel edges are summed by the conversion
+    matrix = sparse.coo_matrix((weight, (edges[:, 0], edges[:, 1])), shape=(n, n)).tocsr()
+    matrix = (matrix + matrix.T).tocsr()
+    matrix.setdiag(0)
+    matrix.eliminate_zeros()
+    matrix.sort_indices()
+    
+    weighted = graph.weight is not None
+    if weighted:
+        values = matrix.data
+        if not numpy.allclose(values, numpy.round(values)):
+            values = values * METIS_WEIGHT_SCALE
+        values = numpy.maximum(1, numpy.round(values)).astype(numpy.int64)
+    
+    with open(path, 'w') as f:
+        print('{} {}{}'.format(n, matrix.nnz // 2, ' 001' if weighted else ''), file=f)
+        
+        for start in range(0, n, chunk_size):
+            lines = []
+            for v in range(start, min(start+chunk_size, n)):
+                lo, hi = matrix.indptr[v], matrix.indptr[v+1]
+                neigh  = (matrix.indices[lo:hi] + 1).tolist()
+                if weighted:
+                    pairs = zip(neigh, values[lo:hi].tolist())
+                    lines.append(' '.join('{} {}'.format(u, w) for u, w in pairs))
+                else:
+                    lines.append(' '.join(map(str, neigh)))
+            print('\n'.join(lines), file=f)
+
+def import_membership(graph, membership):
+    '''
+    Imports a clustering of the `graph` computed by some external tool.
+    
+    :param graph: the `VIG` that has been clustered
+    :param membership: either a sequence giving the community of each vertex,
+        or the name of a file containing it. The file is either a NumPy 
+        (.npy) array or a text file with one line per vertex holding either 
+        its community or the vertex (from 0) and its community (lines starting with 
+        '#' or '%' are ignored). The communities can be arbitrary integers.
+    :return: an igraph `VertexClustering` of the `graph` 
+    '''
+    import numpy
+    import igraph
+    
+    if isinstance(membership, str):
+        if membership.endswith('.npy'):
+            membership = numpy.load(membership)
+        else:
+            rows = numpy.loadtxt(membership, dtype=numpy.int64, comments=('#', '%'), ndmin=2)
+            if rows.shape[1] >= 2:
+                membership = numpy.full(len(graph), -1, dtype=numpy.int64)
+                membership[rows[:, 0]] = rows[:, 1]
+            else:
+                membership = rows[:, 0]
+    
+    membership = numpy.asarray(membership, dtype=numpy.int64).ravel()
+    if len(membership) != len(graph) or (membership < 0).any():
+        raise ValueError("The membership gives the community of {} vertices, the graph has {}"
+                         .format(int((membership >= 0).sum()), len(graph)))
+    
+    # communities are renumbered 0..k-1
+    _, membership = numpy.unique(membership, return_inverse=True)
+    return igraph.VertexClustering(graph.graph, membership.tolist(), 
+                                   modularity_params={'weights': graph.weights})
 
 ############### MISC UTILITIES ################################################
 
@@ -262,9 +585,62 @@ def community_count(clustering):
             nb_communities += 1
     return nb_communities
 
+def cluster_graph(clusters, graph):
+    '''
+    Computes the cluster graph of the given `clusters`: the graph having one 
+    vertex per community and one edge between two communities iff some edge
+    of the `graph` connects them. The weight of such an edge is the total 
+    weight (the number, when the graph is unweighted) of the edges of `graph`
+    connecting the two communities. The edges within a community are dropped:
+    just like the cluster graph of igraph (which simplifies the contracted 
+    graph), this graph has no loops.
+    
+    .. note::
+        The weighted adjacency of the cluster graph is computed as P'.A.P 
+        where A is the (sparse) adjacency matrix of the `graph` and P is the 
+        (sparse) n x k membership matrix of the `clusters`. The sizes of the
+        communities are counted with a bincount. The attributes of the 
+        original `graph` are left untouched. 
+    
+    :param clusters: the `VertexClustering` of the `graph`
+    :param graph: the `VIG` that has been clustered
+    :return: a `VIG` whose `community`, `size` and `weight` arrays are set
+    '''
+    import numpy
+    import igraph
+    from scipy import sparse
+    from pynusmv_community import vig
+    
+    membership = numpy.asarray(clusters.membership, dtype=numpy.int32)
+    n_vertices = len(membership)
+    n_clusters = len(clusters)
+    
+    edges      = graph.edges
+    weight     = numpy.ones(len(edges)) if graph.weight is None else graph.weight.astype(numpy.float64)
+    adjacency  = sparse.csr_matrix((weight, (edges[:, 0], edges[:, 1])), shape=(n_vertices, n_vertices))
+    member     = sparse.csr_matrix((numpy.ones(n_vertices), (numpy.arange(n_vertices), membership)),
+                                   shape=(n_vertices, n_clusters))
+    
+    # each edge is stored once (in one direction): fold the result so that the
+    # weight between two communities ends up above the diagonal (no loops)
+    between    = (member.T @ adjacency @ member).tocoo()
+    between    = sparse.triu(between + between.T, k=1).tocoo()
+    pairs      = numpy.stack([between.row, between.col], axis=1).astype(numpy.int32)
+    
+    cg = vig.VIG(igraph.Graph(n=n_clusters, edges=pairs.tolist()), 
+                 edges  = pairs, 
+                 weight = between.data)
+    cg.community = numpy.arange(1, n_clusters+1, dtype=numpy.int32)
+    # the virtual vertices are not counted in the size of the communities
+    cg.size      = numpy.bincount(membership[~graph.virtual], minlength=n_clusters).astype(numpy.int32)
+    return cg
+
 def graph_to_json(graph):
     '''
     Generates a JSON representation of the given graph
+    
+    :param graph: a `VIG` whose `community`, `size` and `weight` are set (ie. 
+        the output of `cluster_graph`)
     '''
     # format strings
     v_format = '{{ "id": {}, "community": {}, "size" : {} , "normal" : {}  }}'
@@ -272,20 +648,14 @@ def graph_to_json(graph):
     g_format = '{{ "nodes" : [ {} ], "edges" : [ {} ] }}'
     
     # Vertex specific transformations
-    v_min    = min(graph.vs['size'])
-    v_attr   = lambda v,a: graph.vs[a][v.index]
-    v_comu   = lambda v: v_attr(v, 'community')
-    v_size   = lambda v: v_attr(v, 'size')
-    v_normal = lambda v: math.sqrt( v_size(v) / v_min )
-    v_json   = lambda v: v_format.format(v_comu(v)-1, v_comu(v), v_size(v), v_normal(v))
+    v_min    = graph.size.min()
+    v_json   = lambda c,s: v_format.format(c-1, c, s, math.sqrt(s / v_min))
     
     # Edge specific transformations
-    e_attr   = lambda e,a: graph.es[a][e.index]
-    e_weight = lambda e: e_attr(e, "weight")
-    e_json   = lambda e: e_format.format(e.source, e.target, e_weight(e), math.log(e_weight(e)) )
+    e_json   = lambda e,w: e_format.format(e[0], e[1], int(w), math.log(w))
     
-    vs_json  = ',\n'.join([ v_json(v) for v in graph.vs ])
-    es_json  = ',\n'.join([ e_json(e) for e in graph.es ])
+    vs_json  = ',\n'.join([ v_json(c, s) for c,s in zip(graph.community, graph.size) ])
+    es_json  = ',\n'.join([ e_json(e, w) for e,w in zip(graph.edges, graph.weight) ])
     g_json   = g_format.format(vs_json, es_json)
     
     return g_json
@@ -301,6 +671,8 @@ def graph_to_fca_context(graph, tokenize=True):
     :param tokenize: split the semantic names into token (increases the chances
         of fca finding something interesting)
     '''
+    import concepts
+    
     d = concepts.Definition()
     
     for vertex in range(len(graph.vs)):
@@ -316,4 +688,42 @@ def graph_to_fca_context(graph, tokenize=True):
         else:
             d.add_object(str(vertex), [var_name, var_block] )
     
-    return concepts.Context(*d)
\ No newline at end of file
+    return concepts.Context(*d)
+
+def community_to_fca_context(graph, community, tokenize=True):
+    '''
+    Builds a (deduplicated) FCA context for one single `community` of the 
+    `graph`. Each object of the context is the set of tokens (attributes) of
+    one vertex. Since many vertices of a community share the exact same set of
+    tokens (ie. the bits of one same variable), identical objects are collapsed
+    and their multiplicity is kept instead.
+    
+    .. note::
+        The vertices having no semantic information (???) are left out.
+    
+    :param graph: the graph containing the community
+    :param community: the list of the vertices of the community
+    :param tokenize: split the semantic names into token (increases the chances
+        of fca finding something interesting)
+    :return: a dictionary frozenset(tokens) -> multiplicity
+    '''
+    context = {}
+    
+    for vertex in community:
+        repres = vertex_repr(graph, vertex)
+        if repres == '???':
+            continue
+        
+        var_info   = repres.split(sep="*")
+        var_name   = var_info[0]
+        var_block  = var_info[-1]
+        
+        if tokenize:
+            tokens = frozenset(var_name.split(sep=".") + [var_block])
+        else:
+            tokens = frozenset([var_name, var_block])
+        
+        context[tokens] = context.get(tokens, 0) + 1
+    
+    return context
+
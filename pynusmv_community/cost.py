@@ -0,0 +1,468 @@
+'''
+This module contains the cost model of a sweep and the guardrails protecting
+the machine running it. The cost of a bound (#clauses, #vertices, #edges, time
+and peak memory) grows polynomially with the bound; hence, once a few bounds
+have been analyzed, the cost of the next ones can be extrapolated. This is
+used to:
+
+    + display an ETA of the sweep after each bound
+    + check the limits (`--max-edges`, `--max-rss`, `--phase-timeout`) *before*
+      the next bound is started. When a limit would be exceeded, the analysis
+      is degraded (single clustering instead of an ensemble, sampled graph
+      with fewer and fewer edges -- whichever reduces the exceeded metric) or
+      the sweep is stopped.
+
+On top of that, each phase of the analysis of a bound (cnf generation, graph
+construction, clustering, stages) is timed and interrupted by a `PhaseTimeout`
+when it lasts longer than `--phase-timeout`.
+
+.. note::
+    The timeouts rely on SIGALRM: they are only enforced in the main thread
+    of the process, and a long call to native code (ie. igraph clustering) is
+    only interrupted when it returns to the interpreter.
+
+.. note::
+    The peak memory is the high water mark of the resident set size which is
+    reset at the start of each bound (this is only possible on Linux, other
+    systems report the peak of the whole process).
+'''
+import sys
+import time
+import signal
+import argparse
+import threading
+import contextlib
+
+# The phases of the analysis of one bound
+PHASES             = ('cnf', 'graph', 'clustering', 'stages')
+
+# The metrics extrapolated by the cost model
+METRICS            = ('#clauses', '#vertices', '#edges', 'seconds', 'peak_rss_mb') \
+                   + tuple('seconds_'+p for p in PHASES)
+
+# The max length of the clauses still expanded as cliques in a sampled graph
+DEGRADED_CLIQUE    = 8
+
+# The degradation steps (see `Guard`)
+SINGLE_CLUSTERING  = 'single clustering'
+SAMPLED_GRAPH      = 'sampled graph'
+SAMPLE_DEGREE      = 'sample degree'
+
+# The metrics reduced by each degradation step and a (rough) guess of the
+# factor applied to each of them. The guess only stands until one bound has
+# been measured at the degraded level. (The clustering time of a single
+# clustering is that of the ensemble divided by the size of the ensemble)
+REDUCTIONS         = {
+    SINGLE_CLUSTERING : {'seconds_clustering': None},
+    SAMPLED_GRAPH     : {'#edges': 0.5, 'seconds_graph': 0.5, 'seconds_clustering': 0.5, 'peak_rss_mb': 0.75},
+    SAMPLE_DEGREE     : {'#edges': 0.5, 'seconds_graph': 0.5, 'seconds_clustering': 0.5, 'peak_rss_mb': 0.75}
+}
+
+# The bounds on the growth exponent of a metric (guards against silly fits)
+MIN_EXPONENT       = 0.0
+MAX_EXPONENT       = 4.0
+
+class PhaseTimeout(Exception):
+    '''
+    Raised when one phase of the analysis of a bound exceeds its timeout
+    '''
+    def __init__(self, phase, timeout):
+        super().__init__("phase '{}' exceeded {}s".format(phase, timeout))
+        self.phase   = phase
+        self.timeout = timeout
+
+############### MEASUREMENTS ##################################################
+
+# The timeout of each phase (None = no timeout)
+__TIMEOUT = None
+# The time spent in each phase of the current bound
+__PHASES  = dict.fromkeys(PHASES, 0.0)
+# When the current bound was started
+__STARTED = None
+
+def set_timeout(timeout):
+    '''
+    Sets the timeout (in seconds) of each phase (None to disable it)
+    '''
+    global __TIMEOUT
+    __TIMEOUT = timeout
+
+def peak_rss():
+    '''
+    :return: the peak resident set size (in MB) since the last call to
+        `reset_peak_rss` (or since the start of the process)
+    '''
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+def reset_peak_rss():
+    '''
+    Resets the peak resident set size (only possible on Linux)
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+def start_bound():
+    '''
+    Starts the measurements of a new bound
+    '''
+    global __PHASES, __STARTED
+
+    __PHASES  = dict.fromkeys(PHASES, 0.0)
+    __STARTED = time.time()
+    reset_peak_rss()
+
+def measures():
+    '''
+    :return: the measurements of the current bound as record columns: the
+        total duration, the duration of each phase and the peak memory
+    '''
+    record = {
+        'seconds'     : [time.time() - (__STARTED or time.time())],
+        'peak_rss_mb' : [peak_rss()]
+    }
+    for name, duration in __PHASES.items():
+        record['seconds_'+name] = [duration]
+    return record
+
+def _on_alarm(signum, frame):
+    raise _Alarm()
+
+class _Alarm(BaseException):
+    # not an Exception: nobody should catch it by mistake
+    pass
+
+@contextlib.contextmanager
+def phase(name):
+    '''
+    Context manager timing the phase `name` of the current bound. The phase is
+    interrupted with a `PhaseTimeout` when it lasts longer than the timeout
+    (see `set_timeout`).
+    '''
+    timeout = __TIMEOUT
+    armed   = timeout is not None and threading.current_thread() is threading.main_thread()
+    started = time.time()
+
+    if armed:
+        previous = signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        yield
+    except _Alarm:
+        raise PhaseTimeout(name, timeout) from None
+    finally:
+        if armed:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+        __PHASES[name] = __PHASES.get(name, 0.0) + time.time() - started
+
+############### COST MODEL ####################################################
+
+class CostModel:
+    '''
+    Extrapolates the cost of the next bounds from the bounds analyzed so far.
+    Each metric y is assumed to grow as a power of the bound: y ~ (bound+1)^e
+    where the exponent e is fitted (least squares in log-log space) over all
+    the measured bounds. The prediction is anchored on the last bound measured
+    at the current degradation `level` (since degrading the analysis changes
+    the scale of the costs but not their growth). Until some bound has been
+    measured at a level, the prediction of the previous level is scaled by the
+    expected effect of the degradation (see `scale`).
+    '''
+
+    def __init__(self):
+        # (bound, level, {metric: value})
+        self.points = []
+        # level -> {metric: factor} expected effect of reaching that level
+        self.scales = {}
+
+    def scale(self, level, factors):
+        '''
+        Records the expected effect (metric -> factor) of the degradation
+        leading to `level`
+        '''
+        self.scales[level] = dict(factors)
+
+    def observe(self, bound, level, values):
+        '''
+        Records the `values` (metric -> value) measured for `bound` at the
+        degradation `level`
+        '''
+        values = { m: float(values[m]) for m in METRICS if values.get(m) is not None }
+        self.points.append((bound, level, values))
+
+    def exponent(self, metric):
+        '''
+        :return: the fitted growth exponent of `metric` (None when there are
+            not enough points to fit it)
+        '''
+        import numpy
+        
+        pts = [ (b, v[metric]) for b, _, v in self.points if metric in v ]
+        if len({ b for b, _ in pts }) < 2:
+            return None
+
+        x = numpy.log([ b + 1.0 for b, _ in pts ])
+        y = numpy.log([ max(v, 1e-6) for _, v in pts ])
+        e = numpy.polyfit(x, y, 1)[0]
+        return float(min(MAX_EXPONENT, max(MIN_EXPONENT, e)))
+
+    def predict(self, bound, level):
+        '''
+        :return: a dictionary metric -> predicted value for `bound` at the
+            degradation `level`. The metrics that cannot be predicted yet 
+            (nothing was measured at that level or the growth is unknown) are
+            left out.
+        '''
+        anchors = [ (b, v) for b, l, v in self.points if l == level ]
+        if not anchors:
+            if level not in self.scales:
+                return {}
+            return scaled(self.predict(bound, level-1), self.scales[level])
+
+        last, values = anchors[-1]
+        ratio  = (bound + 1.0) / (last + 1.0)
+        result = {}
+        for metric, value in values.items():
+            exponent = self.exponent(metric)
+            if exponent is not None:
+                result[metric] = value * ratio ** exponent
+        return result
+
+    def eta(self, bounds, level):
+        '''
+        :return: the predicted duration (in seconds) of the analysis of all the
+            given `bounds` (None if it cannot be predicted)
+        '''
+        total = 0.0
+        for bound in bounds:
+            seconds = self.predict(bound, level).get('seconds')
+            if seconds is None:
+                return None
+            total += seconds
+        return total
+
+def scaled(values, factors):
+    '''
+    :return: a copy of the `values` (metric -> value) where each metric is
+        multiplied by its factor. The total duration follows the duration of
+        the phases.
+    '''
+    result = dict(values)
+    for metric, factor in factors.items():
+        if metric in result:
+            result[metric] = values[metric] * factor
+            if metric.startswith('seconds_') and 'seconds' in result:
+                result['seconds'] -= values[metric] - result[metric]
+    return result
+
+def sampled_policy(text, threshold=DEGRADED_CLIQUE):
+    '''
+    :return: the expansion policy `text` (see `vig.parse_policy`) where the
+        clauses having `threshold` literals or more are sampled rather than
+        expanded as cliques. The other rules of the policy (star, skip, ...)
+        are kept. None if no clause of the policy would be sampled.
+    '''
+    from pynusmv_community import vig
+
+    policy = vig.parse_policy(text)
+    result = dict(policy)
+    for i, (lower, strategy) in enumerate(policy):
+        upper = policy[i+1][0] if i+1 < len(policy) else None
+        start = max(lower, threshold)
+        if strategy == vig.CLIQUE and (upper is None or start < upper):
+            result[start] = vig.SAMPLE
+
+    if result == dict(policy):
+        return None
+
+    items = []
+    for threshold, strategy in sorted(result.items()):
+        # a tier having the strategy of the previous one is redundant
+        if not items or items[-1][1] != strategy:
+            items.append((threshold, strategy))
+    return ','.join(s if t == 0 else '{}:{}'.format(t, s) for t, s in items)
+
+def duration(seconds):
+    ''':return: a short representation (ie. 2h05m13s) of a duration'''
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours,   minutes = divmod(minutes, 60)
+    return "{}h{:02d}m{:02d}s".format(hours, minutes, seconds)
+
+############### GUARDRAILS ####################################################
+
+class Guard:
+    '''
+    Checks the limits of a sweep before each bound and degrades the analysis
+    (or stops the sweep) when one of them would be exceeded.
+
+    Each degradation step only helps for some of the metrics (see 
+    `REDUCTIONS`); the first of these steps that reduces the metric exceeding
+    its limit is applied:
+
+        + (only with --ensemble) a single clustering instead of an ensemble
+        + a sampled graph: the clauses longer than `DEGRADED_CLIQUE` that were
+          expanded as cliques are sampled (the rest of the policy is kept)
+        + the sample degree is halved (down to 1)
+
+    The bound is checked again after each step, with the prediction scaled
+    by the expected effect of the degradation.
+    '''
+
+    def __init__(self, flags):
+        '''
+        :param flags: the command line flags (the limits are `max_edges`,
+            `max_rss` (in MB) and `phase_timeout`; `on_limit` tells whether to
+            'degrade' or 'stop')
+        '''
+        self.flags     = flags
+        self.model     = CostModel()
+        self.level     = 0
+        self.changes   = []
+        self.max_edges = getattr(flags, 'max_edges',     None)
+        self.max_rss   = getattr(flags, 'max_rss',       None)
+        self.timeout   = getattr(flags, 'phase_timeout', None)
+        self.degrade   = getattr(flags, 'on_limit', 'degrade') == 'degrade'
+        set_timeout(self.timeout)
+
+    @property
+    def degradation(self):
+        ''':return: a description of the current degradation of the analysis'''
+        return '; '.join(self.changes) or 'none'
+
+    def exceeded(self, bound):
+        '''
+        :return: a tuple (reason, metric) where reason describes the limit that
+            the analysis of `bound` is predicted to exceed and metric is the 
+            name of the metric exceeding it ((None, None) if no limit would be
+            exceeded). Nothing is predicted until some bounds were measured.
+        '''
+        predicted = self.model.predict(bound, self.level)
+        if self.max_edges and predicted.get('#edges', 0) > self.max_edges:
+            return ("~{:.0f} edges > --max-edges {}".format(predicted['#edges'], self.max_edges), '#edges')
+        if self.max_rss and predicted.get('peak_rss_mb', 0) > self.max_rss:
+            return ("~{:.0f} MB > --max-rss {}".format(predicted['peak_rss_mb'], self.max_rss), 'peak_rss_mb')
+        if self.timeout:
+            for name in PHASES:
+                seconds = predicted.get('seconds_'+name, 0)
+                if seconds > self.timeout:
+                    reason = "~{:.2f}s of {} > --phase-timeout {}".format(seconds, name, self.timeout)
+                    return (reason, 'seconds_'+name)
+        return (None, None)
+
+    def steps(self):
+        '''
+        :return: the list of the degradation steps applicable to the current
+            analysis, as tuples (change, flags, factors) where flags are the 
+            degraded flags and factors the expected effect of the step.
+        '''
+        result = []
+        flags  = self.flags
+
+        if getattr(flags, 'ensemble', None):
+            degraded          = argparse.Namespace(**vars(flags))
+            degraded.ensemble = None
+            factors           = { 'seconds_clustering': 1.0 / max(1, flags.ensemble) }
+            result.append((SINGLE_CLUSTERING, degraded, factors))
+
+        policy = sampled_policy(flags.expansion)
+        if policy is not None:
+            degraded               = argparse.Namespace(**vars(flags))
+            degraded.expansion     = policy
+            degraded.sample_degree = flags.sample_degree or DEGRADED_CLIQUE
+            result.append((SAMPLED_GRAPH, degraded, REDUCTIONS[SAMPLED_GRAPH]))
+        elif ':sample' in str(flags.expansion) and (flags.sample_degree or 1) > 1:
+            degraded               = argparse.Namespace(**vars(flags))
+            degraded.sample_degree = flags.sample_degree // 2
+            change                 = '{} {}'.format(SAMPLE_DEGREE, degraded.sample_degree)
+            result.append((change, degraded, REDUCTIONS[SAMPLE_DEGREE]))
+
+        return result
+
+    def next_level(self, metric):
+        '''
+        Degrades the analysis by one level: the first applicable step (see
+        `steps`) reducing the given `metric` is applied.
+
+        :return: False iff the analysis cannot be degraded so as to reduce the
+            `metric` any further
+        '''
+        for change, flags, factors in self.steps():
+            if metric in factors:
+                self.flags  = flags
+                self.level += 1
+                self.changes.append(change)
+                self.model.scale(self.level, factors)
+                return True
+        return False
+
+    def admit(self, bound):
+        '''
+        Checks the limits before the analysis of `bound` starts (and degrades
+        the analysis until no limit is predicted to be exceeded). The analysis
+        must use `self.flags`.
+
+        :return: None if the bound can be analyzed, the reason why the sweep
+            must be stopped otherwise
+        '''
+        reason, metric = self.exceeded(bound)
+        while reason is not None:
+            if not self.degrade:
+                return reason
+            if not self.next_level(metric):
+                return reason + ' (cannot degrade further)'
+            print("bound {:03d} | {} | degraded: {}".format(bound, reason, self.degradation), file=sys.stderr)
+            reason, metric = self.exceeded(bound)
+        return None
+
+    def timed_out(self, bound, error):
+        '''
+        Handles a `PhaseTimeout` of the analysis of `bound` (which is skipped).
+
+        :return: None if the sweep can go on (with a degraded analysis), the
+            reason why it must be stopped otherwise
+        '''
+        reason = 'bound {:03d}: {}'.format(bound, error)
+        if not self.degrade or not self.next_level('seconds_'+error.phase):
+            return reason
+        print("{} | degraded: {}".format(reason, self.degradation), file=sys.stderr)
+        return None
+
+    def observe(self, bound, record):
+        '''
+        Feeds the cost model with the `record` of `bound`
+        '''
+        flat = { k: (v[0] if isinstance(v, list) else v) for k,v in record.items() }
+        self.model.observe(bound, self.level, flat)
+
+    def report(self, bound, record, pending=()):
+        '''
+        Prints the cost of `bound` and the predicted cost of the next bound and
+        of the rest of the sweep (the `pending` bounds).
+        '''
+        flat = { k: (v[0] if isinstance(v, list) else v) for k,v in record.items() }
+        text = "bound {:03d} | {:.1f}s | {} edges | {:.0f} MB".format(
+                    bound, flat['seconds'], flat.get('#edges', '?'), flat['peak_rss_mb'])
+
+        pending = list(pending)
+        nxt     = self.model.predict(pending[0], self.level) if pending else {}
+        if 'seconds' in nxt:
+            text += " | next ~{:.1f}s ~{:.0f} edges ~{:.0f} MB".format(
+                    nxt['seconds'], nxt.get('#edges', 0), nxt.get('peak_rss_mb', 0))
+            eta   = self.model.eta(pending, self.level)
+            if eta is not None:
+                text += " | ETA {}".format(duration(eta))
+        print(text, file=sys.stderr)
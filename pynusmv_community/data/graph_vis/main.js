@@ -1,7 +1,13 @@
-d3.queue()
-  .defer(d3.json, "data/cluster_graph.json")
-  .defer(d3.csv , "data/sequences.csv")
-  .await(function(err, graph, sequences){  
+/**************** DATA SOURCE ***********************************************/
+// The data is served by `commu serve`: the viewer is opened as
+// /graph/?model=<model>&bound=<bound>
+var params = new URLSearchParams(window.location.search);
+var api    = "/api/"+encodeURIComponent(params.get("model"))+"/"+params.get("bound");
+
+d3.json(api+"/graph", function(err, graph){  
+  
+  // the sequences of the community being displayed (fetched on demand)
+  var sequences = [];
   
   /**************** SCENE SETUP *********************************************/
   var width  = 800;
@@ -94,7 +100,12 @@ d3.queue()
   });
   
   /* -------------- Display the elements details upon clicking  --------- */
-  nodes.on("click", community_show_details);
+  nodes.on("click", function(commu){
+    d3.csv(api+"/sequences?community="+commu.community, function(err, rows){
+      sequences = err ? [] : rows;
+      community_show_details(commu);
+    });
+  });
   edges.on("click", edge_show_details);
   
   /**************** UTILITY FUNCITONS ************************************/
@@ -1,5 +1,15 @@
-d3.json("data/test.json", function(err, info){  
-  
+/**************** DATA SOURCE ***********************************************/
+// The data is streamed by `commu serve` page by page: the viewer is opened as
+// /table/?model=<model>&bound=<bound>
+var params = new URLSearchParams(window.location.search);
+var api    = "/api/"+encodeURIComponent(params.get("model"))+"/"+params.get("bound");
+var PAGE   = 200;
+
+// the communities currently highlighted
+var active = {};
+
+d3.json(api+"/table?offset=0&limit="+PAGE, function(err, info){
+
   /**************** SCENE SETUP *********************************************/
   var selection = d3.select("#selection")
                     .append("table")
@@ -9,49 +19,66 @@ d3.json("data/test.json", function(err, info){
                     .enter()
                     .append("td")
                     .attr("class", function(e){ return "commu-"+e;} )
-                    .text(function(e){ return e; });
-  
+                    .text(function(e){
+                      // the lineage is only known when the evolution is tracked
+                      return info.lineage ? e+" ("+info.lineage[e-1]+")" : e;
+                    });
+
   var table = d3.select("#table")
                 .append("table");
-  
+
   var thead = table.append("thead");
   thead.append("th").text("Variable");
-  
-  for( var i = -1; i <= info.bound; i++ ){
-    thead.append("th").text(i);
-  }
-  
-  var rows = table.append("tbody")
-       .selectAll("tr")
-       .data(  d3.entries(info.data) )
-       .enter()
-       .append("tr")
-  
-  var cells = rows.selectAll("td")
-        .data( function(row){ 
-          var key = [ row.key ];
-          var cols= d3.values(row.value); 
-          var all = key.concat(cols);
-          return all;
-        }  )
+
+  info.frames.forEach(function(f){
+    thead.append("th").text(f);
+  });
+
+  var tbody = table.append("tbody");
+
+  /**************** INCREMENTAL LOADING *************************************/
+  // appends the rows of one page and fetches the next one (if any)
+  function append(page){
+    var rows = tbody.selectAll("tr.page-"+page.offset)
+         .data( page.rows )
+         .enter()
+         .append("tr")
+         .attr("class", "page-"+page.offset);
+
+    rows.selectAll("td")
+        .data( function(row){ return [ row[0] ].concat(row[1]); } )
         .enter()
         .append("td")
-        .attr("class", function(e){ 
+        .attr("class", function(e){
           if( Array.isArray(e) ){
             return e.map(function(v){return "commu-"+v}).join(" ");
           } else {
             return ""
           }
         })
+        .attr("bgcolor", function(e){
+          var on = Array.isArray(e) && e.some(function(v){ return active[v]; });
+          return on ? "red" : null;
+        })
         .text( function(e) { return e; } );
-  
+
+    var next = page.offset + page.rows.length;
+    if( page.rows.length > 0 && next < page.total ){
+      d3.json(api+"/table?offset="+next+"&limit="+PAGE, function(err, page){
+        if( !err ){ append(page); }
+      });
+    }
+  }
+  append(info);
+
   /**************** DYNAMIC BEHAVIOR ****************************************/
   selection.on("click", function(commu){
-    
-    var active   = d3.select(this).classed("active");
-    d3.select(this).classed("active", !active);
-    
-    d3.selectAll(".commu-"+commu).attr("bgcolor", active ? "white" : "red" );
+
+    var on = !d3.select(this).classed("active");
+    d3.select(this).classed("active", on);
+    active[commu] = on;
+
+    d3.selectAll(".commu-"+commu).attr("bgcolor", on ? "red" : "white" );
   });
-  
-});
\ No newline at end of file
+
+});
@@ -35,6 +35,16 @@ def mapping(model, bound, cnf):
                     
                     print("{:3d} ; {}".format(literal, repres), file=f)
                 
+def community_label(graph, counter):
+    '''
+    :return: the label of the `counter`-th (1-based) community of the `graph`
+        in the text dumps. It includes the lineage of that community when the
+        evolution of the communities is tracked (see `evolution`).
+    '''
+    if getattr(graph, 'lineage', None) is None:
+        return "{:03d}".format(counter)
+    return "{:03d} (lineage {})".format(counter, graph.lineage[counter-1])
+
 def communities_raw(model, bound, clusters, graph):
     '''
     Saves text file dumps for the communities stored in the `clusters` of the 
@@ -50,7 +60,7 @@ def communities_raw(model, bound, clusters, graph):
             counter += 1
             # raw information
             text = " ".join([str(x) for x in sorted(l)])
-            print( "{:03d} -> {}\n".format(counter, text) , file=f )
+            print( "{} -> {}\n".format(community_label(graph, counter), text) , file=f )
 
 
 def communities_semantic(model, bound, clusters, graph):
@@ -69,7 +79,7 @@ def communities_semantic(model, bound, clusters, graph):
             counter += 1
             # not-curated info
             text = " ".join(sorted(s))
-            print( "{:03d} -> {}\n".format(counter, text) , file=f )
+            print( "{} -> {}\n".format(community_label(graph, counter), text) , file=f )
             
 def communities_curated(model, bound, clusters, graph):
     '''
@@ -87,7 +97,7 @@ def communities_curated(model, bound, clusters, graph):
             counter += 1
             # not-curated info
             text = " ".join(sorted(filter(lambda x: x!="???", s)))
-            print( "{:03d} -> {}\n".format(counter, text) , file=f )
+            print( "{} -> {}\n".format(community_label(graph, counter), text) , file=f )
 
 def statistics(model, data):
     '''
@@ -98,6 +108,20 @@ def statistics(model, data):
     
     data.to_csv("{}/stats/data.csv".format(model), sep=';')
 
+def hierarchy(model, bound, hierarchy):
+    '''
+    Dumps the complete `hierarchy` of communities (all the levels of the 
+    multilevel algorithm) of `model` unrolled `bound` times. The membership
+    of each level is stored as a row of an int32 matrix in a compressed numpy
+    archive which can be loaded back with `core.load_hierarchy`.
+    '''
+    import numpy
+    
+    os.makedirs("{}/hierarchy/".format(model), exist_ok=True)
+    numpy.savez_compressed("{}/hierarchy/{:03d}.npz".format(model, bound),
+                           membership = hierarchy.membership,
+                           modularity = hierarchy.modularity)
+
 def json_cluster_graph(model, bound, clusters, graph):
     '''
     Dumps a json file containing information to visualize the cluster graph.
@@ -108,20 +132,23 @@ def json_cluster_graph(model, bound, clusters, graph):
     '''
     os.makedirs("{}/json/{:03d}/".format(model, bound), exist_ok=True)
     
-    # set cluster size and id on all vs
-    counter = 0
-    for cluster in clusters:
-        counter += 1
-        size     = len(cluster)
-        for vertex in cluster:
-            graph.vs[vertex]['size'] = size
-            graph.vs[vertex]['community'] = counter;
-    # set equal weight for all connections so that it becomes visible in
-    # the output diagram
-    graph.es['weight'] = [ 1 for _ in graph.es]
-    
-    cg = clusters.cluster_graph(combine_vertices={'size': 'first', 'community': 'first'},
-                                combine_edges={'weight': 'sum'})
+    cg = core.cluster_graph(clusters, graph)
     
     with open("{}/json/{:03d}/cluster_graph.json".format(model, bound), 'w') as f: 
-        print(core.graph_to_json(cg), file=f)
\ No newline at end of file
+        print(core.graph_to_json(cg), file=f)
+
+def edgelist(model, bound, clusters, graph):
+    '''
+    Dumps the `graph` as a binary edge list (see `core.export_edgelist`) so 
+    that it can be clustered by some external tool.
+    '''
+    os.makedirs("{}/graph".format(model), exist_ok=True)
+    core.export_edgelist(graph, "{}/graph/{:03d}.edges".format(model, bound))
+
+def metis(model, bound, clusters, graph):
+    '''
+    Dumps the `graph` in the METIS format (see `core.export_metis`) so that 
+    it can be clustered by some external tool.
+    '''
+    os.makedirs("{}/graph".format(model), exist_ok=True)
+    core.export_metis(graph, "{}/graph/{:03d}.metis".format(model, bound))
@@ -0,0 +1,263 @@
+'''
+This module contains the ensemble clustering of a VIG. The result of one run
+of the multilevel (Louvain) algorithm depends on the order of the vertices;
+hence a single run says nothing about how stable the reported communities and
+modularity are. The ensemble mode runs N clusterings of the same graph (each
+one on a different, seeded, permutation of the vertices) in parallel worker
+processes and derives:
+
+    + the mean and standard deviation of the modularity of the runs
+    + the co-assignment frequency of each pair of adjacent vertices (the
+      fraction of the runs placing both ends of an edge in the same community)
+    + a consensus partition (the clustering of the co-assignment graph)
+    + the stability of each community of the consensus partition (the mean
+      co-assignment frequency of the edges inside that community).
+
+.. note::
+    The workers never receive a copy of the edges: the edge (and weight)
+    arrays are placed in shared memory -- or left in their spill file when the
+    edge buffer was spilled to disk -- and mapped read-only by each worker.
+'''
+import random
+
+from collections import namedtuple
+
+import numpy
+
+# The default number of runs of the ensemble
+DEFAULT_RUNS        = 10
+# The min co-assignment frequency of an edge to be kept in the consensus graph
+CONSENSUS_THRESHOLD = 0.25
+
+# The result of an ensemble clustering
+Ensemble = namedtuple('Ensemble', 'consensus modularity pairs coassignment stability')
+Ensemble.__doc__ = '''
+    + `consensus`   : the consensus partition (igraph `VertexClustering`)
+    + `modularity`  : the modularity of each run
+    + `pairs`       : the (p, 2) array of the (distinct) pairs of adjacent vertices
+    + `coassignment`: the co-assignment frequency of each of these pairs
+    + `stability`   : the stability of each community of the consensus
+'''
+
+# A read-only array shared with the workers
+Shared = namedtuple('Shared', 'path shm shape dtype')
+
+############### SHARED ARRAYS #################################################
+
+def share(array, spill=None):
+    '''
+    Makes `array` available to the worker processes.
+
+    :param array: the array to share
+    :param spill: the file holding `array` (when it is memory mapped)
+    :return: a tuple (Shared, handle) where the handle must be closed (if not
+        None) once the workers are done.
+    '''
+    if spill is not None:
+        return (Shared(spill, None, array.shape, array.dtype.str), None)
+
+    from multiprocessing import shared_memory
+
+    handle = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    numpy.ndarray(array.shape, dtype=array.dtype, buffer=handle.buf)[...] = array
+    return (Shared(None, handle.name, array.shape, array.dtype.str), handle)
+
+def attach(shared):
+    '''
+    :return: a tuple (array, handle) giving read-only access to a `Shared` array
+    '''
+    if shared.path is not None:
+        array = numpy.memmap(shared.path, dtype=shared.dtype, mode='r', shape=shared.shape)
+        return (array, None)
+
+    from multiprocessing import shared_memory
+
+    handle = shared_memory.SharedMemory(name=shared.shm)
+    array  = numpy.ndarray(shared.shape, dtype=shared.dtype, buffer=handle.buf)
+    array.flags.writeable = False
+    return (array, handle)
+
+############### WORKERS #######################################################
+
+# The graph clustered by this worker
+__VERTICES = 0
+__EDGES    = None
+__WEIGHTS  = None
+__HANDLES  = []
+
+def _init_worker(vertices, edges, weights):
+    '''
+    Maps the shared edges (and weights) of the graph to cluster in this worker
+    '''
+    global __VERTICES, __EDGES, __WEIGHTS, __HANDLES
+
+    __VERTICES        = vertices
+    __EDGES, handle   = attach(edges)
+    __HANDLES         = [ handle ]
+    if weights is not None:
+        __WEIGHTS, handle = attach(weights)
+        __HANDLES.append(handle)
+
+def _release_worker():
+    global __EDGES, __WEIGHTS, __HANDLES
+
+    __EDGES, __WEIGHTS = None, None
+    for handle in __HANDLES:
+        if handle is not None:
+            handle.close()
+    __HANDLES = []
+
+def cluster_once(seed):
+    '''
+    Clusters the graph mapped in this worker after having permuted its vertices
+    with the given `seed`.
+
+    :return: a tuple (membership, modularity) where the membership is expressed
+        in terms of the original (not permuted) vertices
+    '''
+    import igraph
+
+    rng  = numpy.random.default_rng(seed)
+    perm = rng.permutation(__VERTICES).astype(numpy.int32)
+
+    graph = igraph.Graph(n=__VERTICES, edges=perm[__EDGES])
+
+    # igraph draws its random numbers from python's generator
+    random.seed(seed)
+    weights  = None if __WEIGHTS is None else __WEIGHTS.tolist()
+    clusters = graph.community_multilevel(weights=weights)
+
+    membership = numpy.asarray(clusters.membership, dtype=numpy.int32)[perm]
+    return (membership, clusters.modularity)
+
+############### ENSEMBLE ######################################################
+
+def distinct_pairs(edges, vertices):
+    '''
+    :return: a tuple (pairs, index) where pairs is the (p, 2) array of the
+        distinct pairs of adjacent vertices (smallest vertex first, self loops
+        excluded) and index maps each edge to its pair (-1 for the loops)
+    '''
+    lo   = numpy.minimum(edges[:, 0], edges[:, 1]).astype(numpy.int64)
+    hi   = numpy.maximum(edges[:, 0], edges[:, 1]).astype(numpy.int64)
+    loop = lo == hi
+
+    keys, index = numpy.unique(lo[~loop] * vertices + hi[~loop], return_inverse=True)
+    mapping     = numpy.full(len(edges), -1, dtype=numpy.int64)
+    mapping[~loop] = index
+    pairs = numpy.stack([keys // vertices, keys % vertices], axis=1)
+    return (pairs, mapping)
+
+def consensus(graph, pairs, coassignment, seed=None, threshold=CONSENSUS_THRESHOLD):
+    '''
+    :return: the consensus partition (an igraph `VertexClustering` of `graph`)
+        obtained by clustering the graph of the pairs that are co-assigned in
+        at least `threshold` of the runs (weighted by their co-assignment).
+    '''
+    import igraph
+
+    keep  = coassignment >= threshold
+    agree = igraph.Graph(n=len(graph), edges=pairs[keep].tolist())
+
+    random.seed(seed)
+    membership = agree.community_multilevel(weights=coassignment[keep].tolist()).membership
+    return igraph.VertexClustering(graph.graph, membership,
+                                   modularity_params={'weights': graph.weights})
+
+def run(graph, runs=DEFAULT_RUNS, jobs=1, seed=None):
+    '''
+    Runs an ensemble of `runs` clusterings of the `graph` on `jobs` worker
+    processes.
+
+    :param graph: the `VIG` to cluster
+    :param runs: the number of clusterings in the ensemble
+    :param jobs: the number of worker processes (1 = run everything in the
+        current process)
+    :param seed: the seed from which the seeds of the runs are derived
+    :return: an `Ensemble`
+    
+    .. note::
+        A daemonic process (ie. a worker of `commu batch`) can't start any 
+        child process: there, the runs are all performed inline.
+    '''
+    import multiprocessing
+    from pynusmv_community.vig import EdgeBuffer
+
+    edges     = graph.edges
+    vertices  = len(graph)
+    seeds     = numpy.random.SeedSequence(seed).generate_state(runs).tolist()
+
+    spill     = graph.buffer.spill if isinstance(graph.buffer, EdgeBuffer) else None
+    handles   = []
+    try:
+        s_edges, handle = share(edges, spill)
+        handles.append(handle)
+        s_weight = None
+        if graph.weight is not None:
+            s_weight, handle = share(graph.weight)
+            handles.append(handle)
+
+        if (jobs is not None and jobs <= 1) or multiprocessing.current_process().daemon:
+            _init_worker(vertices, s_edges, s_weight)
+            try:
+                results = [ cluster_once(s) for s in seeds ]
+            finally:
+                _release_worker()
+        else:
+            with multiprocessing.Pool(jobs, _init_worker, (vertices, s_edges, s_weight)) as pool:
+                results = pool.map(cluster_once, seeds)
+    finally:
+        for handle in handles:
+            if handle is not None:
+                handle.close()
+                handle.unlink()
+
+    # sparse co-assignment accumulator: one counter per pair of adjacent vertices
+    pairs, _ = distinct_pairs(edges, vertices)
+    together = numpy.zeros(len(pairs), dtype=numpy.int32)
+    for membership, _ in results:
+        together += membership[pairs[:, 0]] == membership[pairs[:, 1]]
+    coassignment = together / max(1, runs)
+
+    clusters   = consensus(graph, pairs, coassignment, seed)
+    stability  = community_stability(clusters, pairs, coassignment)
+    modularity = numpy.array([ q for _, q in results ])
+    return Ensemble(clusters, modularity, pairs, coassignment, stability)
+
+def community_stability(clusters, pairs, coassignment):
+    '''
+    :return: the stability of each community of `clusters`: the mean 
+        co-assignment of the pairs of adjacent vertices inside of it (1 for 
+        the communities without any such pair)
+    '''
+    membership = numpy.asarray(clusters.membership, dtype=numpy.int64)
+    inside     = membership[pairs[:, 0]] == membership[pairs[:, 1]]
+    commu      = membership[pairs[inside, 0]]
+    count      = numpy.bincount(commu, minlength=len(clusters))
+    total      = numpy.bincount(commu, weights=coassignment[inside], minlength=len(clusters))
+    stability  = numpy.ones(len(clusters))
+    stability[count > 0] = total[count > 0] / count[count > 0]
+    return stability
+
+def regroup(ensemble, clusters):
+    '''
+    :return: the `ensemble` whose consensus is replaced by `clusters` (the 
+        same partition, possibly renumbered by `core.exclude_virtual`) and 
+        whose stability by community is computed anew accordingly
+    '''
+    stability = community_stability(clusters, ensemble.pairs, ensemble.coassignment)
+    return ensemble._replace(consensus=clusters, stability=stability)
+
+def record(ensemble):
+    '''
+    :return: the ensemble statistics to add to the record of one bound. The
+        overall stability is the mean co-assignment of all the pairs of
+        adjacent vertices.
+    '''
+    return {
+        '#runs'                  : [len(ensemble.modularity)],
+        'modularity_mean'        : [float(ensemble.modularity.mean())],
+        'modularity_std'         : [float(ensemble.modularity.std())],
+        'stability'              : [float(ensemble.coassignment.mean()) if len(ensemble.coassignment) else 1.0],
+        'stability_by_community' : [' '.join('{:.4f}'.format(s) for s in ensemble.stability)]
+    }
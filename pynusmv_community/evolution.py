@@ -0,0 +1,318 @@
+'''
+This module contains the tracking of the evolution of the communities across
+the analyzed bounds. The communities of each bound are numbered independently
+from those of the other bounds; this module links them together by matching
+the communities of each analyzed bound with these of its nearest (lower, if
+any) analyzed bound based on the Jaccard overlap of the literals they contain.
+(The bounds are not necessarily analyzed in increasing order, see `sampling`)
+
+The overlaps are computed exactly, as a sparse contingency matrix (previous
+community x current community -> number of shared literals). This costs
+O(#literals) whatever the number of communities.
+
+From these matches, the following events are derived:
+
+    + birth    : a community without any predecessor
+    + death    : a community without any successor
+    + split    : a community having several successors
+    + merge    : a community having several predecessors
+    + continue : a one-to-one match
+
+and each community gets a stable lineage identifier: a community inherits the
+lineage of its best predecessor when they are each other's best match, and
+starts a new lineage otherwise.
+
+The results are saved in `{model}/evolution/`:
+
+    + 'events.csv'         : the events of all the bounds
+    + 'lineage/{bound}.csv': the lineage of each community of the bound
+    + 'state-{bound}.npz'  : the partition of each tracked bound (to match the
+                             bounds analyzed later and to resume the tracking)
+'''
+import os
+import csv
+import glob
+import bisect
+
+import numpy
+
+# The min Jaccard index for two communities to be considered a match
+DEFAULT_THRESHOLD = 0.3
+
+# The number of partitions kept in memory by a tracker (the others are loaded
+# from disk when needed)
+CACHED_PARTITIONS = 2
+
+class Partition:
+    '''
+    A partition of the literals of one bound in communities
+    '''
+
+    def __init__(self, bound, literals, membership, lineage=None):
+        '''
+        :param bound: the bound at which this partition was computed
+        :param literals: the int array of the (non virtual) literals
+        :param membership: the (0-based) community of each literal
+        :param lineage: the lineage identifier of each community
+        '''
+        self.bound      = bound
+        self.literals   = numpy.asarray(literals,   dtype=numpy.int64)
+        self.membership = numpy.asarray(membership, dtype=numpy.int64)
+        self.count      = int(self.membership.max()) + 1 if len(self.membership) else 0
+        self.sizes      = numpy.bincount(self.membership, minlength=self.count)
+        self.lineage    = lineage
+
+    @staticmethod
+    def of(bound, clusters, graph):
+        '''
+        :return: the partition of the literals of `graph` in `clusters`
+        '''
+        membership = numpy.asarray(clusters.membership, dtype=numpy.int64)
+        real       = graph.lit != 0
+        partition  = Partition(bound, graph.lit[real], membership[real])
+        # the communities made of virtual vertices only are still counted
+        partition.count = len(clusters)
+        partition.sizes = numpy.bincount(partition.membership, minlength=len(clusters))
+        return partition
+
+############### OVERLAPS ######################################################
+
+def contingency(prev, cur):
+    '''
+    :return: a sparse (csr) matrix whose entry (i, j) is the number of literals
+        shared by the community i of `prev` and the community j of `cur`
+    '''
+    from scipy import sparse
+
+    _, i_prev, i_cur = numpy.intersect1d(prev.literals, cur.literals,
+                                         assume_unique=True, return_indices=True)
+    counts = numpy.ones(len(i_prev), dtype=numpy.int64)
+    matrix = sparse.coo_matrix((counts, (prev.membership[i_prev], cur.membership[i_cur])),
+                               shape=(prev.count, cur.count))
+    # duplicate entries are summed up by the conversion
+    return matrix.tocsr()
+
+def jaccard(prev, cur):
+    '''
+    :return: a sparse (coo) matrix of the Jaccard index of all the pairs of
+        communities (of `prev` and `cur`) sharing at least one literal
+    '''
+    from scipy import sparse
+
+    inter = contingency(prev, cur).tocoo()
+    union = prev.sizes[inter.row] + cur.sizes[inter.col] - inter.data
+    return sparse.coo_matrix((inter.data / union, (inter.row, inter.col)),
+                             shape=(prev.count, cur.count))
+
+############### MATCHING ######################################################
+
+def match(prev, cur, threshold=DEFAULT_THRESHOLD, next_lineage=0):
+    '''
+    Matches the communities of `prev` with those of `cur` and assigns a lineage
+    to the communities of `cur`.
+
+    :return: a tuple (lineage, events, next_lineage) where lineage is the int
+        array of the lineage of each community of `cur`, events is a list of
+        (event, previous communities, current communities) and next_lineage is
+        the next free lineage identifier.
+    '''
+    overlap = jaccard(prev, cur)
+    keep    = overlap.data >= threshold
+    rows, cols, values = overlap.row[keep], overlap.col[keep], overlap.data[keep]
+
+    successors   = [ [] for _ in range(prev.count) ]
+    predecessors = [ [] for _ in range(cur.count)  ]
+    for i, j, v in zip(rows.tolist(), cols.tolist(), values.tolist()):
+        successors[i].append((v, j))
+        predecessors[j].append((v, i))
+
+    best_succ = [ max(s)[1] if s else -1 for s in successors   ]
+    best_pred = [ max(p)[1] if p else -1 for p in predecessors ]
+
+    events  = []
+    lineage = numpy.full(cur.count, -1, dtype=numpy.int64)
+
+    for j in range(cur.count):
+        i = best_pred[j]
+        if i >= 0 and best_succ[i] == j:
+            lineage[j] = prev.lineage[i]
+        else:
+            lineage[j]    = next_lineage
+            next_lineage += 1
+
+        preds = sorted(i for _, i in predecessors[j])
+        if not preds:
+            events.append(('birth', [], [j]))
+        elif len(preds) > 1:
+            events.append(('merge', preds, [j]))
+
+    for i in range(prev.count):
+        succs = sorted(j for _, j in successors[i])
+        if not succs:
+            events.append(('death', [i], []))
+        elif len(succs) > 1:
+            events.append(('split', [i], succs))
+        elif len(predecessors[succs[0]]) == 1:
+            events.append(('continue', [i], succs))
+
+    return (lineage, events, next_lineage)
+
+############### TRACKING ######################################################
+
+class Tracker:
+    '''
+    Tracks the evolution of the communities of one model across the bounds.
+    The partition of each tracked bound is persisted so that the bounds
+    analyzed later (in any order, possibly by some other process) can be 
+    matched with their nearest neighbour.
+
+    .. note::
+        A tracker always builds on the persisted state: it is up to the process
+        that starts a run to wipe the state of the previous runs (see `reset`).
+        This way, the workers of a batch never delete each other's state.
+    '''
+
+    def __init__(self, model, threshold=DEFAULT_THRESHOLD):
+        '''
+        :param model: the name of the model whose communities are tracked
+        :param threshold: the min jaccard index of two matching communities
+        '''
+        self.model        = model
+        self.threshold    = threshold
+        self.folder       = "{}/evolution".format(model)
+        self.bounds       = []
+        self.cache        = {}
+        self.next_lineage = 0
+
+    def state(self, bound):
+        ''':return: the path of the persisted partition of `bound`'''
+        if bound == '*':
+            return "{}/state-*.npz".format(self.folder)
+        return "{}/state-{:03d}.npz".format(self.folder, bound)
+
+    def refresh(self):
+        '''
+        Reloads the list of the tracked bounds from the persisted state (other
+        processes may have tracked some bounds of the same model meanwhile)
+        '''
+        bounds = []
+        for path in glob.glob(self.state('*')):
+            with numpy.load(path) as data:
+                bounds.append(int(data['bound']))
+                self.next_lineage = max(self.next_lineage, int(data['next_lineage']))
+        self.bounds = sorted(bounds)
+
+    def _save(self, partition):
+        # the name of the temporary file is private to this process
+        tmp = "{}/tmp-{:03d}-{}.npz".format(self.folder, partition.bound, os.getpid())
+        numpy.savez(tmp, bound=partition.bound, literals=partition.literals,
+                    membership=partition.membership, lineage=partition.lineage,
+                    next_lineage=self.next_lineage)
+        os.replace(tmp, self.state(partition.bound))
+        
+        if partition.bound not in self.bounds:
+            bisect.insort(self.bounds, partition.bound)
+        self._cache(partition)
+
+    def _cache(self, partition):
+        self.cache.pop(partition.bound, None)
+        self.cache[partition.bound] = partition
+        while len(self.cache) > CACHED_PARTITIONS:
+            del self.cache[next(iter(self.cache))]
+
+    def partition(self, bound):
+        ''':return: the (persisted) partition of the tracked `bound`'''
+        if bound not in self.cache:
+            with numpy.load(self.state(bound)) as data:
+                partition         = Partition(bound, data['literals'], data['membership'], data['lineage'])
+                # the communities made of virtual vertices only are still counted
+                partition.count   = len(data['lineage'])
+                partition.sizes   = numpy.bincount(partition.membership, minlength=partition.count)
+            self._cache(partition)
+        return self.cache[bound]
+
+    def neighbour(self, bound):
+        '''
+        :return: the tracked bound the communities of `bound` are matched with:
+            the greatest tracked bound below `bound` or, when there is none, the
+            smallest one above it (None if no other bound is tracked yet)
+        '''
+        index = bisect.bisect_left(self.bounds, bound)
+        if index > 0:
+            return self.bounds[index-1]
+        if index < len(self.bounds) and self.bounds[index] == bound:
+            index += 1
+        return self.bounds[index] if index < len(self.bounds) else None
+
+    def update(self, bound, clusters, graph):
+        '''
+        Matches the communities of `bound` with those of its nearest tracked
+        bound (see `neighbour`), dumps the events and lineage and returns the
+        lineage of each community of `clusters`.
+        '''
+        os.makedirs("{}/lineage".format(self.folder), exist_ok=True)
+        self.refresh()
+        current   = Partition.of(bound, clusters, graph)
+        neighbour = self.neighbour(bound)
+
+        if neighbour is None:
+            current.lineage   = numpy.arange(self.next_lineage, self.next_lineage + current.count)
+            self.next_lineage = self.next_lineage + current.count
+            events            = [ ('birth', [], [j]) for j in range(current.count) ]
+            previous, previous_bound = None, ''
+        else:
+            previous          = self.partition(neighbour)
+            current.lineage, events, self.next_lineage = match(previous, current,
+                                                               self.threshold, self.next_lineage)
+            previous_bound    = neighbour
+
+        with open("{}/events.csv".format(self.folder), 'a', newline='') as f:
+            writer = csv.writer(f, delimiter=';')
+            if f.tell() == 0:
+                writer.writerow(['from_bound', 'to_bound', 'event', 'from', 'to', 'lineage'])
+            for event, preds, succs in events:
+                # communities are numbered from 1 (as in the dumps)
+                lineage = ' '.join(str(current.lineage[j]) for j in succs) if succs else \
+                          ' '.join(str(previous.lineage[i]) for i in preds)
+                writer.writerow([previous_bound, bound, event,
+                                 ' '.join(str(i+1) for i in preds),
+                                 ' '.join(str(j+1) for j in succs),
+                                 lineage])
+
+        with open("{}/lineage/{:03d}.csv".format(self.folder, bound), 'w', newline='') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(['community', 'lineage'])
+            for j, l in enumerate(current.lineage.tolist()):
+                writer.writerow([j+1, l])
+
+        self._save(current)
+        return current.lineage
+
+def reset(model):
+    '''
+    Wipes the persisted state and events of the evolution of `model` so that 
+    the next tracked bounds start from scratch. This must be called once, by
+    the process which starts the run (never by the workers of a batch).
+    '''
+    folder = "{}/evolution".format(model)
+    for path in glob.glob("{}/state-*.npz".format(folder)) + ["{}/events.csv".format(folder)]:
+        if os.path.exists(path):
+            os.remove(path)
+
+# The trackers of the models analyzed in this process
+__TRACKERS = {}
+
+def track(model, bound, clusters, graph, flags=None):
+    '''
+    Tracks the evolution of the communities of `model` between `bound` and its
+    nearest previously analyzed bound (this is the implementation of the
+    `--track-evolution` stage). The lineage of each community is stored in the
+    `lineage` attribute of the `graph` so that the stages executed afterwards
+    (dumps, table visualisation) can use it.
+    '''
+    if model not in __TRACKERS:
+        threshold         = getattr(flags, 'evolution_threshold', None)
+        __TRACKERS[model] = Tracker(model, DEFAULT_THRESHOLD if threshold is None else threshold)
+
+    graph.lineage = __TRACKERS[model].update(bound, clusters, graph)
+    return graph.lineage
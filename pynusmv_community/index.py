@@ -0,0 +1,210 @@
+'''
+This module contains the inverted semantic index of a model. This index maps
+each semantic variable name (ie. 'v211.U_KM_07M.st') -- and each token of
+these names (ie. 'U_KM_07M') -- to the (bound, vertex, community) where that
+variable occurs. The index is built while the bounds are analyzed (see the
+`--build-index` flag) and is persisted in a SQLite database
+(`{model}/index.sqlite`) so that questions like "which communities does
+`v211.U_KM_07M.st` fall into at each bound?" get answered in milliseconds
+across a whole sweep, without grepping through the text dumps.
+
+The index can be queried with the `commu query` subcommand or through the
+`SemanticIndex` class.
+'''
+import os
+import sys
+import sqlite3
+import argparse
+
+from collections import OrderedDict
+
+from pynusmv_community import core
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS postings (
+        name      TEXT    NOT NULL,
+        bound     INTEGER NOT NULL,
+        vertex    INTEGER NOT NULL,
+        community INTEGER NOT NULL,
+        literal   INTEGER NOT NULL,
+        repr      TEXT    NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS tokens (
+        token     TEXT    NOT NULL,
+        name      TEXT    NOT NULL,
+        PRIMARY KEY (token, name)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS postings_by_name  ON postings (name, bound);
+    CREATE INDEX IF NOT EXISTS postings_by_bound ON postings (bound);
+'''
+
+def tokens_of(name):
+    '''
+    :return: the tokens of a semantic variable name
+    '''
+    return [ t for t in name.split('.') if t ]
+
+class SemanticIndex:
+    '''
+    The persisted inverted index semantic name -> (bound, vertex, community)
+    of one model.
+    '''
+
+    def __init__(self, model, readonly=False):
+        '''
+        :param model: the name of the model whose index is opened
+        :param readonly: open an existing index for querying only
+        '''
+        self.model = model
+        self.path  = "{}/index.sqlite".format(model)
+
+        if readonly:
+            if not os.path.exists(self.path):
+                raise FileNotFoundError("No semantic index for model '{}' ({})".format(model, self.path))
+            self.db = sqlite3.connect('file:{}?mode=ro'.format(self.path), uri=True)
+        else:
+            os.makedirs(model, exist_ok=True)
+            self.db = sqlite3.connect(self.path)
+            self.db.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    ############### BUILDING THE INDEX ########################################
+
+    def add_bound(self, bound, clusters, graph):
+        '''
+        Indexes all the (semantic) vertices of the `graph` analyzed at `bound`.
+        The previous postings of that bound (if any) are replaced.
+        '''
+        postings = []
+        names    = set()
+
+        counter  = 0
+        for community in clusters:
+            counter += 1
+            for vertex in community:
+                repres = core.vertex_repr(graph, vertex)
+                if repres == '???':
+                    continue
+
+                name = core.semantic_name(repres)
+                names.add(name)
+                postings.append((name, bound, vertex, counter, core.vertex_to_lit(graph, vertex), repres))
+
+        with self.db:
+            self.db.execute('DELETE FROM postings WHERE bound = ?', (bound,))
+            self.db.executemany('INSERT INTO postings VALUES (?, ?, ?, ?, ?, ?)', postings)
+            self.db.executemany('INSERT OR IGNORE INTO tokens VALUES (?, ?)',
+                                [ (t, n) for n in names for t in tokens_of(n) ])
+
+    ############### QUERYING THE INDEX ########################################
+
+    def names(self, token):
+        '''
+        :return: the sorted list of the semantic names containing `token`
+        '''
+        rows = self.db.execute('SELECT name FROM tokens WHERE token = ? ORDER BY name', (token,))
+        return [ r[0] for r in rows ]
+
+    def bounds(self):
+        '''
+        :return: the sorted list of the bounds that have been indexed
+        '''
+        return [ r[0] for r in self.db.execute('SELECT DISTINCT bound FROM postings ORDER BY bound') ]
+
+    def lookup(self, name, bound=None):
+        '''
+        :return: the list of (bound, vertex, community, repr) where the variable
+            `name` occurs (possibly restricted to one `bound`)
+        '''
+        query = 'SELECT bound, vertex, community, repr FROM postings WHERE name = ?'
+        args  = (name,)
+        if bound is not None:
+            query += ' AND bound = ?'
+            args  += (bound,)
+        return list(self.db.execute(query + ' ORDER BY bound, community, vertex', args))
+
+    def communities(self, name, bound=None):
+        '''
+        :return: an ordered dictionary bound -> sorted list of the communities
+            the variable `name` falls into at that bound
+        '''
+        query = 'SELECT DISTINCT bound, community FROM postings WHERE name = ?'
+        args  = (name,)
+        if bound is not None:
+            query += ' AND bound = ?'
+            args  += (bound,)
+
+        result = OrderedDict()
+        for b, c in self.db.execute(query + ' ORDER BY bound, community', args):
+            result.setdefault(b, []).append(c)
+        return result
+
+    def members(self, bound, community):
+        '''
+        :return: the sorted list of the semantic names occurring in the given
+            `community` at the given `bound`
+        '''
+        rows = self.db.execute('SELECT DISTINCT name FROM postings WHERE bound = ? AND community = ? ORDER BY name',
+                               (bound, community))
+        return [ r[0] for r in rows ]
+
+def build(model, bound, clusters, graph):
+    '''
+    Adds the postings of one analyzed bound to the semantic index of `model`
+    (this is the implementation of the `--build-index` stage)
+    '''
+    with SemanticIndex(model) as index:
+        index.add_bound(bound, clusters, graph)
+
+############### COMMAND LINE ##################################################
+
+def arguments():
+    args = argparse.ArgumentParser(prog="commu query", description="""
+        Queries the semantic index of a model (built with --build-index)
+    """)
+
+    model             = args.add_argument("model")
+    model.help        = "The model whose index is queried"
+
+    name              = args.add_argument("name")
+    name.help         = "The semantic variable name (or token, with --token) to look for"
+
+    token             = args.add_argument("-t", "--token", action="store_true")
+    token.help        = "Look for all the variables whose name contains the given token"
+
+    bound             = args.add_argument("-b", "--bound", type=int)
+    bound.help        = "Restrict the answer to one bound"
+
+    detail            = args.add_argument("-d", "--details", action="store_true")
+    detail.help       = "List the individual vertices rather than the communities only"
+
+    return args
+
+def main(argv=None):
+    '''
+    The entry point of the `commu query` subcommand.
+    '''
+    args = arguments().parse_args(argv)
+
+    with SemanticIndex(args.model, readonly=True) as index:
+        names = index.names(args.name) if args.token else [ args.name ]
+
+        for name in names:
+            print(name)
+            if args.details:
+                for bound, vertex, community, repres in index.lookup(name, args.bound):
+                    print("  {:03d} | commu-{:03d} | {:6d} | {}".format(bound, community, vertex, repres))
+            else:
+                for bound, communities in index.communities(name, args.bound).items():
+                    print("  {:03d} | {}".format(bound, ' '.join('commu-{:03d}'.format(c) for c in communities)))
+
+        if not names:
+            print("No variable contains the token '{}'".format(args.name), file=sys.stderr)
@@ -2,23 +2,44 @@
 This is the main module that is used to kickstart the problem generation and
 analysis.
 '''
-import pandas
-
-from pynusmv.init      import init_nusmv
-from pynusmv.glob      import load
-from pynusmv.bmc.glob  import BmcSupport
+import sys
+import importlib
+import contextlib
 
 from pynusmv_community import cmdline
 from pynusmv_community import core
-from pynusmv_community import dump
-from pynusmv_community import visualization
-from pynusmv_community import mining
+from pynusmv_community import cost
+from pynusmv_community import stages
+
+
+# The flags where all the options have their default value. These are only 
+# built when they are first needed (see `idle`): building them parses a command
+# line, which scans the entry points of the stages.
+__IDLE = None
 
+def idle(flags=None):
+    '''
+    :return: the given `flags`, or the idle flags (see 
+        `cmdline.do_nothing_flags`) when `flags` is None
+    '''
+    global __IDLE
+    
+    if flags is not None:
+        return flags
+    if __IDLE is None:
+        __IDLE = cmdline.do_nothing_flags()
+    return __IDLE
 
-IDLE = cmdline.do_nothing_flags()
+# The subcommands of the tool (lazily loaded, just like the stages)
+SUBCOMMANDS = {
+    'batch'   : 'pynusmv_community.batch:main',
+    'query'   : 'pynusmv_community.index:main',
+    'serve'   : 'pynusmv_community.serve:main',
+    'extract' : 'pynusmv_community.archive:main'
+}
 
 @cmdline.log_verbose
-def analyze_one(model, bound, formula=None, flags = IDLE):
+def analyze_one(model, bound, formula=None, flags = None):
     '''
     Analyzes the `model` for one given depth and one given `formula`. This step
     generates one dataframe of statistics corresponding to a shallow analysis
@@ -48,66 +69,274 @@ def analyze_one(model, bound, formula=None, flags = IDLE):
         bound and the number of communities and the graph modularity. This can
         be later collected into a dataframe to build evolution statistics
     '''
-    cnf      = core.mk_cnf(bound, formula)
-    graph    = core.mk_graph(cnf)
-    clusters = graph.community_multilevel()
+    flags = idle(flags)
+    with cost.phase('cnf'):
+        cnf  = core.mk_cnf(bound, formula)
     
-    # generate the dumps
-    if flags.dump_cnf:
-        dump.dimacs(model, bound, cnf)
-        
-    if flags.dump_mapping:
-        dump.mapping(model, bound, cnf)
-        
-    if flags.dump_communities:
-        dump.communities_curated(model, bound, clusters, graph)
-        
-    if flags.dump_raw_communities:
-        dump.communities_raw(model, bound, clusters, graph)
-        
-    if flags.dump_semantic_communities:
-        dump.communities_semantic(model, bound, clusters, graph)
-        
-    if flags.dump_json_cluster_graph:
-        dump.json_cluster_graph(model, bound, clusters, graph)
+    # the graph is built from the simplified cnf (the dumps use the original)
+    with cost.phase('graph'):
+        graph_cnf, simplification = simplify_cnf(cnf, flags)
+        graph = core.mk_graph(graph_cnf, **graph_options(flags))
+    
+    return analyze_graph(model, bound, cnf, graph, simplification, flags)
 
+def analyze_graph(model, bound, cnf, graph, simplification=None, flags = None):
+    '''
+    Clusters the VIG `graph` of the `cnf` and runs the stages enabled by the 
+    `flags` on it (see `analyze_one`). The graph is closed when done.
     
-    # generate the visualization artifacts
-    if flags.show_vig:
-        visualization.vig(model, bound, clusters, graph)
+    :param simplification: the statistics of the simplification of the `cnf`
+        (None when the graph was built from the original cnf)
+    :return: the record of statistics of the analysis
+    '''
+    flags = idle(flags)
+    try:
+        # all the stages work on the projected graph
+        with cost.phase('graph'):
+            graph, projection_stats = project_graph(graph, flags)
         
-    if flags.show_cluster_graph:
-        visualization.cluster_graph(model, bound, clusters, graph)
-    
-    if flags.show_d3_cluster_graph: 
-        visualization.d3_visualisation(model, bound, clusters, graph)
+        with cost.phase('clustering'):
+            clusters, hierarchy, result = cluster(model, bound, graph, flags)
         
-    if flags.show_clouds:
-        visualization.clouds(model, bound, clusters, graph)
+        # generate the artifacts (dumps, visualizations, mining)
+        with cost.phase('stages'):
+            stages.run(flags, model=model, bound=bound, cnf=cnf, clusters=clusters, 
+                       graph=graph, hierarchy=hierarchy)
+    finally:
+        graph.close()
     
-    if flags.show_time_table:
-        visualization.table_visualisation(model, bound, clusters, graph)
-    
-    if flags.show_formal_concepts:
-        mining.mine_concept(model, bound, clusters, graph)
+    return mk_record(model, bound, cnf, graph, clusters, hierarchy, 
+                     simplification, projection_stats, result)
+
+############### ANALYSIS STEPS ################################################
+
+def graph_options(flags = None):
+    '''
+    :return: the keyword arguments of `core.mk_graph` set by the `flags`
+    '''
+    flags = idle(flags)
+    return dict(chunk_size= flags.chunk_size,
+                ram_cap   = flags.ram_cap and flags.ram_cap << 20,
+                spill_dir = flags.spill_dir,
+                expansion = flags.expansion,
+                sample_degree = flags.sample_degree,
+                seed      = flags.seed)
+
+def simplify_cnf(cnf, flags = None):
+    '''
+    :return: a tuple (cnf, stats) with the cnf the graph is built from and the
+        statistics of its simplification (None unless `flags.simplify` is set)
+    '''
+    flags = idle(flags)
+    if not flags.simplify:
+        return (cnf, None)
     
-    # mine frequent_patterns
-    if flags.mine_patterns:
-        mining.dump_frequent_patterns(model, bound, clusters, graph)
+    from pynusmv_community import simplify
+    return simplify.simplify(cnf)
+
+def project_graph(graph, flags = None):
+    '''
+    :return: a tuple (graph, stats) with the semantic projection of the `graph`
+        and the statistics of that projection when `flags.project_semantic` is
+        set; the `graph` itself and None otherwise. The original graph is 
+        closed when it is projected.
+    '''
+    flags = idle(flags)
+    if not flags.project_semantic:
+        return (graph, None)
     
-    # mine frequent sequences    
-    if flags.mine_sequences:
-        mining.dump_frequent_sequences(model, bound, clusters, graph)
+    from pynusmv_community import projection
+    projected, stats = projection.project(graph, flags.projection_hops)
+    graph.close()
+    return (projected, stats)
+
+def cluster(model, bound, graph, flags = None):
+    '''
+    Computes the community structure of the `graph` (an external membership,
+    an ensemble clustering or a multilevel clustering depending on the `flags`)
+    and attaches it to the graph.
     
-    return  {
+    :return: a tuple (clusters, hierarchy, ensemble) where the hierarchy (resp.
+        ensemble) is None unless the clusters were obtained that way
+    '''
+    flags = idle(flags)
+    if flags.import_membership:
+        result    = None
+        clusters  = core.import_membership(graph, flags.import_membership.format(model=model, bound=bound))
+        hierarchy = None
+    elif flags.ensemble:
+        from pynusmv_community import ensemble
+        result    = ensemble.run(graph, flags.ensemble, flags.ensemble_jobs, flags.seed)
+        clusters  = result.consensus
+        hierarchy = None
+    else:
+        result    = None
+        clusters, hierarchy = core.mk_clusters(graph, flags.keep_levels, flags.level)
+    # the star centres take no part in the communities (see `vig.RealClustering`)
+    clusters = core.exclude_virtual(graph, clusters)
+    if result is not None:
+        # the communities may have been renumbered
+        from pynusmv_community import ensemble
+        result = ensemble.regroup(result, clusters)
+    graph.set_membership(clusters)
+    return (clusters, hierarchy, result)
+
+def mk_record(model, bound, cnf, graph, clusters, hierarchy=None, simplification=None, 
+              projection_stats=None, result=None):
+    '''
+    :return: the record of statistics of the analysis of `model` at `bound` 
+        (see `analyze_one`)
+    '''
+    record = {
             'instance'     : [model], 
             'bound'        : [bound],
             '#communities' : [core.community_count(clusters)],
-            'modularity'   : [clusters.modularity]
+            'modularity'   : [clusters.modularity],
+            '#clauses'     : [cnf.clauses_number],
+            '#vertices'    : [len(graph)],
+            '#edges'       : [graph.ecount()]
             }
     
+    # modularity and #communities at each level of the hierarchy
+    if hierarchy is not None:
+        counts = core.hierarchy_community_counts(hierarchy, graph.virtual)
+        record['#levels']              = [len(counts)]
+        record['modularity_by_level']  = [' '.join('{:.6f}'.format(q) for q in hierarchy.modularity)]
+        record['communities_by_level'] = [' '.join(str(c) for c in counts)]
+    
+    # sizes of the formula before/after the simplification
+    if simplification is not None:
+        record.update({ k: [v] for k,v in simplification.items() })
+    
+    # sizes of the graph before/after the semantic projection
+    if projection_stats is not None:
+        record.update({ k: [v] for k,v in projection_stats.items() })
+    
+    # modularity and stability of the ensemble of clusterings
+    if result is not None:
+        from pynusmv_community import ensemble
+        record.update(ensemble.record(result))
+    
+    # how many clauses were expanded with each strategy
+    for strategy, count in graph.expansion.items():
+        record['#clauses_'+strategy] = [count]
+    
+    return record
+
+############### MULTIPLE FORMULAS #############################################
+
+def formula_key(index):
+    '''
+    :return: the key identifying the `index`-th formula of a formula file. The
+        outputs of that formula are placed in the `{model}/{key}` folder.
+    '''
+    return "f{:03d}".format(index)
 
-def analyze_all(model, formula = None, depths = range(10), flags = IDLE):
+def read_formulas(path):
+    '''
+    :return: the list of the LTL formulas listed in the file at `path` (one 
+        formula per line, the blank lines and the lines starting with '#' are 
+        ignored)
+    '''
+    with open(path) as f:
+        lines = [ l.strip() for l in f ]
+    return [ l for l in lines if l and not l.startswith('#') ]
+
+@cmdline.log_verbose
+def analyze_formulas(model, bound, formulas, flags = None):
+    '''
+    Analyzes the `model` for one given depth and each of the given `formulas`.
+    
+    .. note::
+        The unrolled model (path) is the same for all the formulas: its cnf is
+        only generated once, its clauses are only expanded once (each formula
+        then extends a copy of the edges of the path) and the semantic info of
+        its variables is only looked up once in NuSMV.
+    
+    .. note::
+        With the `simplify` flag, the edges of the path cannot be reused (the
+        simplification depends on the formula) and each formula is handled as
+        in `analyze_one`.
+    
+    :param model: the name of the model being treated
+    :param bound: the number of time steps to generate on the problem path
+    :param formulas: the list of the LTL formulas to check
+    :return: the list of the records of each formula (see `analyze_one`). 
+        These records have a 'formula_id' and 'formula' column.
+    '''
+    flags = idle(flags)
+    semantic = {}
+    builder  = None
+    options  = graph_options(flags)
+    
+    with cost.phase('cnf'):
+        path = core.mk_cnf_no_formula(bound)
+    
+    records = []
+    try:
+        if not flags.simplify:
+            with cost.phase('graph'):
+                builder = core.mk_builder(path, **options)
+        
+        for index, formula in enumerate(formulas):
+            key      = formula_key(index)
+            with cost.phase('cnf'):
+                prop = core.mk_property_cnf(formula, bound)
+                cnf  = core.Conjunction(path, prop)
+            
+            with cost.phase('graph'):
+                if builder is None:
+                    graph_cnf, simplification = simplify_cnf(cnf, flags)
+                    graph = core.mk_graph(graph_cnf, **options)
+                else:
+                    simplification = None
+                    graph = core.extend_graph(builder, prop, flags.chunk_size)
+            graph.semantic_table = semantic
+            
+            record = analyze_graph("{}/{}".format(model, key), bound, cnf, graph, simplification, flags)
+            record['instance']   = [model]
+            record['formula_id'] = [key]
+            record['formula']    = [formula]
+            records.append(record)
+    finally:
+        if builder is not None:
+            builder.close()
+    return records
+
+def dump_formula_keys(model, formulas):
+    '''
+    Writes the `{model}/formulas.txt` file mapping the key of each formula 
+    (the name of the folder holding its outputs) to that formula.
+    '''
+    import os
+    
+    os.makedirs(model, exist_ok=True)
+    with open("{}/formulas.txt".format(model), 'w') as f:
+        for index, formula in enumerate(formulas):
+            f.write("{}\t{}\n".format(formula_key(index), formula))
+
+def mean_record(records):
+    '''
+    :return: a record whose modularity and #communities are the mean of these
+        of the given `records` (this is what drives an adaptive sweep when 
+        several formulas are analyzed per bound). The sizes (#clauses, 
+        #vertices, #edges) are these of the largest problem and the costs 
+        (time, memory) are these of the whole bound.
+    '''
+    count   = len(records)
+    summary = {
+        'bound'        : records[0]['bound'],
+        '#communities' : [sum(r['#communities'][0] for r in records) / count],
+        'modularity'   : [sum(r['modularity'][0]   for r in records) / count]
+    }
+    for column in ('#clauses', '#vertices', '#edges'):
+        summary[column] = [max(r[column][0] for r in records)]
+    for column in records[0]:
+        if column.startswith('seconds') or column == 'peak_rss_mb':
+            summary[column] = records[0][column]
+    return summary
+
+def analyze_all(model, formula = None, depths = range(10), flags = None):
     '''
     Repeatedly performs the analysis of `model` for all `depth`. By default,
     this analysis generates no output. However the following flags can be 
@@ -124,6 +353,15 @@ def analyze_all(model, formula = None, depths = range(10), flags = IDLE):
            statistical data alongside with two charts plotting the evolution of
            the #communities and modulatity over time
     
+    .. note::
+        With the `adaptive` flag, not all `depths` are analyzed: only a coarse
+        grid of bounds, refined where the metrics change (see `sampling`).
+    
+    .. note::
+        The statistics are streamed to disk (see `sink.StatsSink`) as soon as
+        the analysis of each bound is over, and the charts are refreshed 
+        after each bound.
+    
     .. note::
         It is assumed that pynusmv is initialized, the model is loaded and 
         the bmc sub system is ready to operate too.
@@ -135,22 +373,82 @@ def analyze_all(model, formula = None, depths = range(10), flags = IDLE):
     :param depths: a range of path lengths for which to generate and analyze
         SAT problems.
     '''
-    frames = []
-    for bound in depths:
-        record = analyze_one(model, bound, formula, flags)
-        frames.append( pandas.DataFrame.from_dict(record) )
+    flags = idle(flags)
+    from pynusmv_community import sink, sampling, render, archive
     
-    if frames:
-        data = pandas.concat(frames)
-        
-        if flags.dump_stats:
-            dump.statistics(model, data)
-        
-        if flags.show_stats:
-            visualization.statistics(model, data)
+    streamed = flags.dump_stats or flags.show_stats
+    # with --show-stats only, the records are kept in memory (for the charts)
+    formats  = flags.stats_format.split(',') if flags.dump_stats else ()
+    sweep    = sampling.mk_sweep(depths, flags)
+    formulas = read_formulas(flags.formula_file) if flags.formula_file else None
+    
+    # the folders holding the per-bound outputs (one per formula)
+    folders  = [ "{}/{}".format(model, formula_key(i)) for i in range(len(formulas)) ] \
+               if formulas else [ model ]
+    if formulas:
+        dump_formula_keys(model, formulas)
+    
+    if flags.track_evolution:
+        # the lineage of a run never builds on these of the previous runs
+        from pynusmv_community import evolution
+        for folder in folders:
+            evolution.reset(folder)
+    
+    guard    = cost.Guard(flags)
+    analyzed = []
+    
+    with (sink.StatsSink(model, formats) if streamed else contextlib.ExitStack()) as stats:
+        for bound in sweep:
+            # check the limits (and degrade the analysis) before starting
+            stop = guard.admit(bound)
+            if stop is not None:
+                print("Sweep stopped before bound {}: {}".format(bound, stop), file=sys.stderr)
+                break
+            
+            cost.start_bound()
+            try:
+                if formulas:
+                    records = analyze_formulas(model, bound, formulas, guard.flags)
+                else:
+                    records = [ analyze_one(model, bound, formula, guard.flags) ]
+            except cost.PhaseTimeout as error:
+                stop = guard.timed_out(bound, error)
+                if stop is not None:
+                    print("Sweep stopped: {}".format(stop), file=sys.stderr)
+                    break
+                continue
+            
+            measures = cost.measures()
+            measures['degradation'] = [guard.degradation]
+            for record in records:
+                record.update(measures)
+            
+            summary  = mean_record(records)
+            sweep.report(bound, summary)
+            guard.observe(bound, summary)
+            guard.report(bound, summary, sweep.pending())
+            
+            if streamed:
+                for record in records:
+                    stats.append(record)
+            
+            analyzed.append(bound)
+            if flags.archive:
+                for folder in folders:
+                    archive.pack(folder, [bound])
+            
+            if flags.show_stats:
+                from pynusmv_community import visualization
+                visualization.statistics(model, stats.data())
+    
+    # the images are drawn in the background: wait for the last ones
+    render.wait()
+    if flags.archive:
+        for folder in folders:
+            archive.pack(folder, analyzed)
         
 
-def process(path_to, model, formula = None, depths = range(10), flags = IDLE):
+def process(path_to, model, formula = None, depths = range(10), flags = None):
     '''
     Initializes PyNuSMV and loads the model, then proceeds to the bulk of the
     analysis. See `analyze_one` and `analyze_all` for further details about 
@@ -170,19 +468,44 @@ def process(path_to, model, formula = None, depths = range(10), flags = IDLE):
            statistical data alongside with two charts plotting the evolution of
            the #communities and modulatity over time
     '''
+    flags = idle(flags)
+    
+    with loaded_model(path_to, model):
+        analyze_all(model, formula, depths, flags)
+
+@contextlib.contextmanager
+def loaded_model(path_to, model):
+    '''
+    Context manager that initializes PyNuSMV, loads the `model` (found in the 
+    `path_to` folder) and sets up the BMC sub system for the duration of the
+    block.
+    '''
+    from pynusmv.init      import init_nusmv
+    from pynusmv.glob      import load
+    from pynusmv.bmc.glob  import BmcSupport
     
     with init_nusmv():
         load(core.merge_model_text(path_to, model+".smv"))
         
         with BmcSupport():
-            analyze_all(model, formula, depths, flags)
+            yield
             
-def main():
+def main(argv=None):
     '''
     The main entry point of the tool. See --help for the full details of what
     it can do.
+    
+    .. note::
+        When the first argument is the name of a subcommand (ie. `batch`), the
+        rest of the command line is handed over to that subcommand.
     '''
-    args = cmdline.parse_args()
+    argv = sys.argv[1:] if argv is None else argv
+    
+    if argv and argv[0] in SUBCOMMANDS:
+        module, func = SUBCOMMANDS[argv[0]].split(':')
+        return getattr(importlib.import_module(module), func)(argv[1:])
+    
+    args = cmdline.parse_args(argv)
     rng  = range(args.min_bound, 1+args.max_bound)
     process(args.path, args.model, args.formula, rng, args)
     
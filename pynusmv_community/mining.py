@@ -5,11 +5,396 @@ core to do the heavy lifting.
 '''
 
 import os
+import re
+import heapq
+import numpy
 import pandas
 
+from collections import namedtuple
+
 from pynusmv_community import core
 
-def mine_frequent_patterns(clusters, graph):
+# The default max size (in MB) of the cache of the mined patterns/sequences
+DEFAULT_CACHE_SIZE = 64
+
+# The version of the cached results (bump it when the miners change)
+CACHE_VERSION      = 2
+
+# The token giving the time frame of a variable (see `core.short_var_repr`)
+TIME_TOKEN         = re.compile(r'^at_(-?\d+)$')
+
+# The time of the tokens which are not time tokens
+NO_TIME            = numpy.iinfo(numpy.int64).min
+
+# Transactions encoded as NumPy arrays: the token ids of the i-th transaction 
+# are ids[offsets[i]:offsets[i+1]]
+Transactions = namedtuple('Transactions', 'offsets ids')
+
+############### TOKENS ########################################################
+
+def tokens_of(repres):
+    '''
+    :return: the tuple of the tokens of a semantic representation
+    '''
+    return tuple(re.split(r'[\.\*]+', repres))
+
+class Vocabulary:
+    '''
+    The interned tokens of one model: each token gets an integer id which is
+    stable across the bounds (and the runs) when the vocabulary is persisted 
+    in a database (see `connect`).
+    '''
+    
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS tokens (
+            id      INTEGER PRIMARY KEY,
+            token   TEXT    NOT NULL UNIQUE
+        );
+    '''
+    
+    def __init__(self, db=None):
+        '''
+        :param db: the sqlite connection where the vocabulary is persisted 
+            (None for an in-memory vocabulary)
+        '''
+        self.db     = db
+        self.ids    = {}
+        self.tokens = {}
+        self._times = None
+        if db is not None:
+            db.executescript(self.SCHEMA)
+            for i, token in db.execute('SELECT id, token FROM tokens'):
+                self.ids[token] = i
+                self.tokens[i]  = token
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def intern(self, token):
+        '''
+        :return: the id of `token` (a new one is allocated for unknown tokens)
+        '''
+        i = self.ids.get(token)
+        if i is not None:
+            return i
+        
+        if self.db is None:
+            i = len(self.ids) + 1
+        else:
+            # an other process may have interned the same token meanwhile
+            self.db.execute('INSERT OR IGNORE INTO tokens (token) VALUES (?)', (token,))
+            i = self.db.execute('SELECT id FROM tokens WHERE token = ?', (token,)).fetchone()[0]
+        self.ids[token] = i
+        self.tokens[i]  = token
+        self._times     = None
+        return i
+    
+    def encode(self, tokens):
+        ''':return: the list of the ids of the given `tokens`'''
+        return [ self.intern(t) for t in tokens ]
+    
+    def decode(self, ids):
+        ''':return: the list of the tokens of the given `ids`'''
+        return [ self.tokens[i] for i in ids ]
+    
+    def times(self):
+        '''
+        :return: an array mapping each token id to the time frame of the token
+            (`NO_TIME` for the tokens which are not time tokens)
+        '''
+        if self._times is None:
+            times = numpy.full(max(self.tokens, default=0) + 1, NO_TIME, dtype=numpy.int64)
+            for token, i in self.ids.items():
+                found = TIME_TOKEN.match(token)
+                if found:
+                    times[i] = int(found.group(1))
+            self._times = times
+        return self._times
+
+def connect(model):
+    '''
+    :return: a connection to the mining database of `model` (holding its 
+        vocabulary and the cache of the mined results)
+    '''
+    import sqlite3
+    
+    os.makedirs("{}/mining".format(model), exist_ok=True)
+    return sqlite3.connect("{}/mining/mining.sqlite".format(model), timeout=60)
+
+############### TRANSACTIONS ##################################################
+
+def encode_graph(graph, vocabulary):
+    '''
+    :return: the `Transactions` of all the vertices of the `graph`: the token 
+        ids of the semantic representation of each vertex (the transactions of
+        the auxiliary vertices are empty)
+    
+    .. note::
+        Each distinct representation is only split and encoded once per call
+        (the memo is dropped with the call, it never outgrows one graph).
+    '''
+    lengths = numpy.zeros(len(graph), dtype=numpy.int64)
+    ids     = []
+    memo    = {}
+    for vertex, repres in enumerate(graph.semantics):
+        if repres != '???':
+            encoded = memo.get(repres)
+            if encoded is None:
+                encoded = memo[repres] = vocabulary.encode(tokens_of(repres))
+            lengths[vertex] = len(encoded)
+            ids.extend(encoded)
+    
+    offsets = numpy.zeros(len(graph) + 1, dtype=numpy.int64)
+    numpy.cumsum(lengths, out=offsets[1:])
+    return Transactions(offsets, numpy.array(ids, dtype=numpy.int32))
+
+def select(transactions, rows):
+    '''
+    :return: the `Transactions` made of the given (non empty) `rows` of the
+        `transactions`
+    '''
+    rows    = numpy.asarray(rows, dtype=numpy.int64)
+    lengths = transactions.offsets[rows+1] - transactions.offsets[rows]
+    rows    = rows[lengths > 0]
+    lengths = lengths[lengths > 0]
+    
+    offsets = numpy.zeros(len(rows) + 1, dtype=numpy.int64)
+    numpy.cumsum(lengths, out=offsets[1:])
+    gather  = numpy.repeat(transactions.offsets[rows] - offsets[:-1], lengths) + numpy.arange(offsets[-1])
+    return Transactions(offsets, transactions.ids[gather])
+
+def to_lists(transactions):
+    ''':return: the transactions as a list of lists of ids (the miners input)'''
+    ids = transactions.ids.tolist()
+    off = transactions.offsets.tolist()
+    return [ ids[off[i]:off[i+1]] for i in range(len(off) - 1) ]
+
+def from_lists(items):
+    ''':return: the `Transactions` of a list of lists of ids'''
+    offsets = numpy.zeros(len(items) + 1, dtype=numpy.int64)
+    numpy.cumsum([ len(i) for i in items ], out=offsets[1:])
+    ids     = numpy.fromiter(( i for t in items for i in t ), dtype=numpy.int32, count=offsets[-1])
+    return Transactions(offsets, ids)
+
+############### MINERS ########################################################
+
+def mine_patterns(transactions):
+    '''
+    :return: the list of the frequent patterns (items, count) of the given 
+        `transactions` (RELIM), the most frequent first
+    '''
+    import pymining.itemmining as _mine
+    
+    # returns a dictionary {frozenset} -> {count}
+    patterns = _mine.relim(_mine.get_relim_input(transactions))
+    patterns = sorted(patterns.items(), reverse=True, key=lambda t: t[1])
+    return [ (tuple(sorted(items)), cnt) for items, cnt in patterns ]
+
+def mine_sequences(transactions):
+    '''
+    :return: the list of the frequent sequences (items, count) of the given
+        `transactions` ("a priori"), the most frequent (and longest) first
+    '''
+    import pymining.seqmining as _mine
+    
+    freq_seqs = _mine.freq_seq_enum(transactions, 2)
+    freq_seqs = sorted(freq_seqs, reverse=True, key=lambda x: (x[1], len(x[0])))
+    return [ (tuple(seq), cnt) for seq, cnt in freq_seqs ]
+
+############### CONTENT CACHE #################################################
+
+def normalize_time(transactions, vocabulary):
+    '''
+    Shifts the time frames of the `transactions` so that the earliest one is 0
+    (this way, the same subsystem gets the same transactions at all the time
+    frames where it appears).
+    
+    :return: a tuple (transactions, offset) where offset is the time frame 
+        that was shifted to 0
+    '''
+    times  = vocabulary.times()[transactions.ids]
+    timed  = times != NO_TIME
+    offset = int(times[timed].min()) if timed.any() else 0
+    return (shift_time(transactions, -offset, vocabulary), offset)
+
+def shift_time(transactions, offset, vocabulary):
+    '''
+    :return: the given `transactions` where the time frame of each 'at_t' 
+        token is shifted by `offset`
+    '''
+    if not offset:
+        return transactions
+    
+    ids   = transactions.ids.copy()
+    times = vocabulary.times()[ids]
+    for time in numpy.unique(times[times != NO_TIME]).tolist():
+        ids[times == time] = vocabulary.intern("at_{}".format(time + offset))
+    return Transactions(transactions.offsets, ids)
+
+def content_hash(kind, transactions, normalized=False):
+    '''
+    :return: the canonical hash of a multiset of `transactions` (a list of 
+        lists of token ids) to be mined by the miner `kind` (the order of the
+        transactions does not matter)
+    '''
+    import json
+    import hashlib
+    
+    canonical = sorted(transactions)
+    text      = json.dumps([kind, CACHE_VERSION, normalized, canonical], separators=(',', ':'))
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+class MiningCache:
+    '''
+    A persistent cache (SQLite) content hash -> mined patterns/sequences. The
+    size of the cached results is capped: the least recently used entries are
+    evicted when the cache grows over `max_size` bytes.
+    
+    .. note::
+        The results are cached as token ids: the cache must live in the same
+        database as the `Vocabulary` that encoded them.
+    
+    .. note::
+        The cache is shared by all the processes analyzing the model: each 
+        read and write is a short transaction of its own, and the size and 
+        clock of the cache are always read from the database.
+    '''
+    
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS results (
+            key     TEXT    PRIMARY KEY,
+            payload TEXT    NOT NULL,
+            size    INTEGER NOT NULL,
+            used    INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS results_by_use ON results (used);
+    '''
+    
+    def __init__(self, db, max_size=DEFAULT_CACHE_SIZE << 20):
+        '''
+        :param db: the sqlite connection holding the cache (see `connect`)
+        :param max_size: the max size (in bytes) of the cached results
+        '''
+        self.db       = db
+        self.max_size = max_size
+        self.db.executescript(self.SCHEMA)
+        self.hits     = 0
+        self.misses   = 0
+    
+    def get(self, key):
+        '''
+        :return: the cached result for `key` (None if it is not cached)
+        '''
+        import json
+        
+        row = self.db.execute('SELECT payload FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        
+        self.hits  += 1
+        with self.db:
+            self.db.execute('UPDATE results SET used = (SELECT MAX(used) + 1 FROM results) WHERE key = ?', (key,))
+        return [ (tuple(items), cnt) for items, cnt in json.loads(row[0]) ]
+    
+    def put(self, key, result):
+        '''
+        Caches the `result` mined for `key` (and evicts the least recently 
+        used entries if the cache is full)
+        '''
+        import json
+        
+        payload     = json.dumps(result, separators=(',', ':'))
+        if len(payload) > self.max_size:
+            return
+        
+        with self.db:
+            if not self.db.in_transaction:
+                self.db.execute('BEGIN IMMEDIATE')
+            self.db.execute('INSERT OR REPLACE INTO results VALUES '
+                            '(?, ?, ?, (SELECT COALESCE(MAX(used), 0) + 1 FROM results))', 
+                            (key, payload, len(payload)))
+            self.evict()
+    
+    def evict(self):
+        '''
+        Evicts the least recently used entries until the cache is filled to no
+        more than 3/4 of its max size (if it is over its max size).
+        
+        .. note::
+            This must be called in a write transaction: the size of the cache
+            is read in that same transaction.
+        '''
+        size = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        if size <= self.max_size:
+            return
+        
+        target = self.max_size * 3 // 4
+        for key, entry in self.db.execute('SELECT key, size FROM results ORDER BY used').fetchall():
+            if size <= target:
+                break
+            self.db.execute('DELETE FROM results WHERE key = ?', (key,))
+            size -= entry
+
+def mine_cached(kind, transactions, vocabulary, cache=None, normalize=False):
+    '''
+    Mines the `transactions` with the miner `kind` ('patterns' or 'sequences')
+    unless the result of the same content is found in the `cache`.
+    
+    :param transactions: the (encoded) `Transactions` to mine
+    :param vocabulary: the `Vocabulary` that encoded the transactions
+    :param cache: the `MiningCache` to use (None = no caching)
+    :param normalize: normalize the time frames of the `transactions` before 
+        hashing them (the time frames of the cached result are shifted back)
+    :return: the mined (ids, count) pairs
+    '''
+    miner  = { 'patterns': mine_patterns, 'sequences': mine_sequences }[kind]
+    offset = 0
+    if normalize:
+        transactions, offset = normalize_time(transactions, vocabulary)
+    
+    # the order of the transactions does not matter: sorting them makes the
+    # result only depend on the content
+    lists  = sorted(to_lists(transactions))
+    key    = content_hash(kind, lists, normalize) if cache is not None else None
+    result = cache.get(key) if cache is not None else None
+    if result is None:
+        result = miner(lists)
+        if cache is not None:
+            cache.put(key, result)
+    
+    if offset:
+        shifted = shift_time(from_lists([ items for items, _ in result ]), offset, vocabulary)
+        result  = [ (tuple(items), cnt) for items, (_, cnt) in zip(to_lists(shifted), result) ]
+    return result
+
+############### MINING ########################################################
+
+def mine_encoded(kind, clusters, encoded, vocabulary, cache=None, normalize=False):
+    '''
+    Mines the frequent patterns or sequences (`kind`) of each of the `clusters`
+    without decoding them.
+    
+    :param encoded: the `Transactions` of the vertices of the graph (see 
+        `encode_graph`)
+    :return: the list of the mined (community, count, ids) triples
+    '''
+    rows    = []
+    for counter, community in enumerate(clusters, 1):
+        transactions = select(encoded, community)
+        for items, cnt in mine_cached(kind, transactions, vocabulary, cache, normalize):
+            rows.append((counter, cnt, items))
+    return rows
+
+def decode(rows, vocabulary, column, separator):
+    '''
+    :return: a pandas DataFrame of the mined `rows` (see `mine_encoded`) where
+        the items are decoded and joined by `separator` in the given `column`
+    '''
+    text = [ (c, n, separator.join(vocabulary.decode(items))) for c, n, items in rows ]
+    return pandas.DataFrame(text, columns=['CommunityNo', 'Count', column])
+
+def mine_frequent_patterns(clusters, graph, cache=None, normalize=False, vocabulary=None):
     '''
     Mines the most frequent patterns in each of the `clusters` of the `graph`
     (based on their semantic value in the problem defined by `model` unrolled
@@ -19,140 +404,298 @@ def mine_frequent_patterns(clusters, graph):
     .. note::
         Mining the patterns is somewhat weaker than mining the sequences. You
         might want to call that instead.
-    '''
-    import re
-    import pymining.itemmining as _mine
     
-    # represent a vertex
-    reprs= lambda v: core.vertex_repr(graph, v)
-    #  curate the communities
-    curat= lambda c: [ reprs(v) for v in c if reprs(v) != '???' ]
-    # represent a community as a set of transactions
-    trans= lambda c: [ re.split('[\.\*]+', v) for v in curat(c) ]
-    
-    # mine the patterns of a community
-    def _do_mine(community):
-        # returns a dictionary {frozenset} -> {count}
-        relim_in = _mine.get_relim_input(trans(community))
-        patterns = _mine.relim(relim_in)
-        return patterns
-    
-    def _mine_by_frequence(x):
-        return sorted(_do_mine(x).items(), reverse=True, key=lambda t: t[1])
-    
-    counter= 0
-    frames = []
-    for community in clusters:
-        counter += 1
-        for items,cnt in _mine_by_frequence(community):
-            text = ' '.join(items)
-            frames.append(pandas.DataFrame.from_dict({
-                'CommunityNo' : [counter], 
-                'Count'       : [cnt],
-                'Pattern'     : [text]
-            }))
-    
-    return pandas.concat(frames)
-
-def mine_frequent_sequences(clusters, graph):
+    :param cache: the `MiningCache` of the results (None = no caching)
+    :param normalize: hash the communities regardless of their time frames
+    :param vocabulary: the `Vocabulary` used to encode the tokens (it must be
+        the one of the cache, an in-memory vocabulary is used when omitted)
+    '''
+    vocabulary = Vocabulary() if vocabulary is None else vocabulary
+    encoded    = encode_graph(graph, vocabulary)
+    rows       = mine_encoded('patterns', clusters, encoded, vocabulary, cache, normalize)
+    return decode(rows, vocabulary, 'Pattern', ' ')
+
+def mine_frequent_sequences(clusters, graph, cache=None, normalize=False, vocabulary=None):
     '''
     Mines the most frequent sequences in each of the `clusters` of the `graph`
     (based on their semantic value in the problem defined by `model` unrolled
     `bound` times) and returns a pandas DataFrame
+    
+    :param cache: the `MiningCache` of the results (None = no caching)
+    :param normalize: hash the communities regardless of their time frames
+    :param vocabulary: the `Vocabulary` used to encode the tokens (it must be
+        the one of the cache, an in-memory vocabulary is used when omitted)
     '''
-    import re
-    import pymining.seqmining as _mine
+    vocabulary = Vocabulary() if vocabulary is None else vocabulary
+    encoded    = encode_graph(graph, vocabulary)
+    rows       = mine_encoded('sequences', clusters, encoded, vocabulary, cache, normalize)
+    return decode(rows, vocabulary, 'Sequence', '.')
+
+def dump_mined(kind, model, bound, clusters, graph, flags=None):
+    '''
+    Mines the frequent patterns or sequences (`kind`) of the `clusters` and
+    dumps them to `{model}/mining/{bound}/{kind}.csv`. 
+    
+    The tokens are interned in the vocabulary of the model and the results are
+    cached (unless the cache size is 0) in `{model}/mining/mining.sqlite`. The
+    results are only decoded when they are written.
     
+    .. note::
+        The new tokens are committed before the mining starts: no write 
+        transaction is held open while mining (see `MiningCache`).
+    '''
+    os.makedirs("{}/mining/{:03d}".format(model, bound), exist_ok=True)
     
-    # represent a vertex
-    reprs= lambda v: core.vertex_repr(graph, v)
-    #  curate the communities
-    curat= lambda c: [ reprs(v) for v in c if reprs(v) != '???' ]
-    # represent a community as a set of transactions
-    trans= lambda c: [ re.split('[\.\*]+', v) for v in curat(c) ]
+    size       = getattr(flags, 'mining_cache_size', None)
+    size       = DEFAULT_CACHE_SIZE if size is None else size
+    normalize  = getattr(flags, 'mining_time_normalize', False)
+    column     = { 'patterns': ('Pattern', ' '), 'sequences': ('Sequence', '.') }[kind]
     
-    # symbol table -> one integer represent one symbol
-    def symbolic(transactions_list):
-        sym_2_id = dict()
-        id_2_sym = dict()
-        counter  = 0
-        
-        # memoize tokens and ids
-        for transaction in transactions_list:
-            for token in transaction:
-                if token not in sym_2_id:
-                    counter         += 1
-                    sym_2_id[token]  = counter
-                    id_2_sym[counter]= token
-        
-        # convert tokens to id
-        converted = [[sym_2_id[tok] for tok in transaction] for transaction in transactions_list ]
+    db         = connect(model)
+    try:
+        vocabulary = Vocabulary(db)
+        encoded    = encode_graph(graph, vocabulary)
+        db.commit()
         
-        return (converted, id_2_sym)
-    
-    # define what can be mined
-    minable = lambda c: symbolic(trans(c))
-    
-    counter= 0
-    frames = []
-    for community in clusters:
-        counter += 1
-        seqs, conv = minable(community)
-        freq_seqs  = _mine.freq_seq_enum(seqs, 2)
-        freq_seqs  = sorted(freq_seqs, reverse=True, key=lambda x: (x[1], len(x[0])))
-            
-        for seq,cnt in freq_seqs:
-            items= [conv[i] for i in seq]
-            text = '.'.join(items)
-            frames.append(pandas.DataFrame.from_dict({
-                'CommunityNo' : [counter], 
-                'Count'       : [cnt],
-                'Sequence'    : [text]
-            }))
+        cache      = MiningCache(db, size << 20) if size > 0 else None
+        rows       = mine_encoded(kind, clusters, encoded, vocabulary, cache, normalize)
+    finally:
+        db.close()
     
-    return pandas.concat(frames)
-
+    decode(rows, vocabulary, *column).to_csv("{}/mining/{:03d}/{}.csv".format(model, bound, kind))
 
-def dump_frequent_patterns(model, bound, clusters, graph):
+def dump_frequent_patterns(model, bound, clusters, graph, flags=None):
     '''
     Mines the most frequent patterns in each of the `clusters` of the `graph`
     (based on their semantic value in the problem defined by `model` unrolled
-    `bound` times) and dumps them to CSV file
+    `bound` times) and dumps them to CSV file (see `dump_mined`)
     
     .. note::
         Mining the patterns is somewhat weaker than mining the sequences. You
         might want to call that instead.
     '''
-    os.makedirs("{}/mining/{:03d}".format(model, bound), exist_ok=True)
-    
-    data = mine_frequent_patterns(clusters, graph)
-    data.to_csv("{}/mining/{:03d}/patterns.csv".format(model, bound))
+    dump_mined('patterns', model, bound, clusters, graph, flags)
 
 
-def dump_frequent_sequences(model, bound, clusters, graph):
+def dump_frequent_sequences(model, bound, clusters, graph, flags=None):
     '''
     Mines the most frequent sequences in each of the `clusters` of the `graph`
     (based on their semantic value in the problem defined by `model` unrolled
-    `bound` times) and dump them to a CSV file.
+    `bound` times) and dump them to a CSV file (see `dump_mined`)
     '''
-    os.makedirs("{}/mining/{:03d}".format(model, bound), exist_ok=True)
+    dump_mined('sequences', model, bound, clusters, graph, flags)
+
+############### FORMAL CONCEPT ANALYSIS #######################################
+
+# The default (relative) support threshold of the iceberg lattices
+DEFAULT_MIN_SUPPORT  = 0.1
+
+# The default max number of concepts computed per community
+DEFAULT_MAX_CONCEPTS = 256
+
+def iceberg_concepts(context, min_support=DEFAULT_MIN_SUPPORT, max_concepts=DEFAULT_MAX_CONCEPTS):
+    '''
+    Computes the iceberg lattice of the given (deduplicated) `context`: that is
+    the concepts whose support is at least `min_support`. The concepts are
+    enumerated with the Close-by-One algorithm, using bitsets for the extents
+    and intents. Since the support can only decrease when an attribute is 
+    added to an intent, the branches of the search whose support falls below 
+    the threshold are pruned. 
     
-    data = mine_frequent_sequences(clusters, graph)
-    data.to_csv("{}/mining/{:03d}/sequences.csv".format(model, bound))
+    :param context: a dictionary frozenset(tokens) -> multiplicity (see 
+        `core.community_to_fca_context`)
+    :param min_support: the min support of a concept. When it is smaller than 
+        1, it is interpreted as a fraction of the size of the community.
+    :param max_concepts: stop after that many concepts have been found
+    :return: a list of tuples (support, #objects, intent) where intent is a 
+        sorted tuple of tokens. The first concept is the top of the lattice.
+    '''
+    objects    = list(context.keys())
+    weights    = [ context[o] for o in objects ]
+    attributes = sorted(set().union(*objects)) if objects else []
+    index      = { a: j for j,a in enumerate(attributes) }
+    
+    total      = sum(weights)
+    threshold  = min_support * total if min_support < 1 else min_support
+    threshold  = max(threshold, 1)
+    
+    # bitset of the objects having each attribute / of the attributes of each object
+    a_extent   = [ 0 ] * len(attributes)
+    o_intent   = [ 0 ] * len(objects)
+    for i, o in enumerate(objects):
+        for a in o:
+            a_extent[index[a]] |= 1 << i
+            o_intent[i]        |= 1 << index[a]
+    
+    everything = (1 << len(attributes)) - 1
+    
+    def members(extent):
+        while extent:
+            low     = extent & -extent
+            yield low.bit_length() - 1
+            extent ^= low
+    
+    def support(extent):
+        return sum(weights[i] for i in members(extent))
+    
+    def closure(extent):
+        intent = everything
+        for i in members(extent):
+            intent &= o_intent[i]
+        return intent
+    
+    def decode(extent, intent):
+        return (support(extent), bin(extent).count('1'), 
+                tuple(attributes[j] for j in members(intent)))
+    
+    found  = []
+    top    = (1 << len(objects)) - 1
+    if not objects or total < threshold:
+        return found
+    
+    # best first version of Close-by-One: the concepts having the highest 
+    # support are expanded first so that `max_concepts` keeps the best ones
+    t_intent = closure(top)
+    heap     = [ (-total, 0, top, t_intent, 0) ]
+    counter  = 1
+    found.append(decode(top, t_intent))
+    
+    while heap and len(found) < max_concepts:
+        _, _, extent, intent, start = heapq.heappop(heap)
+        
+        children = []
+        for j in range(start, len(attributes)):
+            if intent >> j & 1:
+                continue
+            
+            c_extent = extent & a_extent[j]
+            c_supp   = support(c_extent)
+            if c_supp < threshold:
+                continue
+            
+            c_intent = closure(c_extent)
+            prefix   = (1 << j) - 1
+            # canonicity test: no attribute smaller than j has been added
+            if c_intent & prefix == intent & prefix:
+                children.append( (-c_supp, c_extent, c_intent, j+1) )
+        
+        for neg_supp, c_extent, c_intent, start in sorted(children, key=lambda c: c[0]):
+            if len(found) >= max_concepts:
+                break
+            heapq.heappush(heap, (neg_supp, counter, c_extent, c_intent, start))
+            counter += 1
+            found.append(decode(c_extent, c_intent))
+    
+    return found
+
+def concepts_to_dot(concepts):
+    '''
+    :param concepts: the concepts of an iceberg lattice (see `iceberg_concepts`)
+    :return: the graphviz (dot) source of the hasse diagram of the `concepts`
+    '''
+    lines   = [ 'digraph lattice {', '  node [shape=box];' ]
+    
+    for i, (supp, size, intent) in enumerate(concepts):
+        lines.append('  c{} [label="{}\\n#{} ({})"];'.format(i, ' '.join(intent), supp, size))
+    
+    for upper, lower in lattice_covers(concepts):
+        lines.append('  c{} -> c{};'.format(upper, lower))
+    
+    lines.append('}')
+    return '\n'.join(lines)
+
+def lattice_covers(concepts):
+    '''
+    :param concepts: the concepts of an iceberg lattice (see `iceberg_concepts`)
+    :return: the list of the pairs (i, j) such that the concept i is a direct
+        upper neighbour of the concept j (the intent of i is a strict subset of
+        that of j and no other concept lies in between)
+    
+    .. note::
+        The concepts are sorted by the size of their intent. The candidate 
+        upper neighbours of a concept are then visited from the largest to the 
+        smallest intent: a candidate is a cover iff it is not below one of the 
+        covers found so far. The intents are compared as bitsets.
+    '''
+    tokens  = { t: k for k, t in enumerate(sorted(set().union(*(c[2] for c in concepts)))) }
+    intents = [ sum(1 << tokens[t] for t in c[2]) for c in concepts ]
+    sizes   = [ len(c[2]) for c in concepts ]
+    order   = sorted(range(len(concepts)), key=lambda i: sizes[i])
+    
+    result  = []
+    for position, j in enumerate(order):
+        covers = []
+        for i in reversed(order[:position]):
+            if sizes[i] == sizes[j] or intents[i] & intents[j] != intents[i]:
+                continue
+            if not any(intents[i] & intents[c] == intents[i] for c in covers):
+                covers.append(i)
+        result.extend( (i, j) for i in covers )
+    return sorted(result)
+
+def _mine_context(args):
+    '''
+    Computes the iceberg lattice of one community (this is executed in a worker
+    process when the communities are processed in parallel).
+    '''
+    context, min_support, max_concepts = args
+    return iceberg_concepts(context, min_support, max_concepts)
 
-def mine_concept(model, bound, clusters, graph):
+def mine_concept(model, bound, clusters, graph, flags=None):
     '''
     Applies formal concept analysis to reveal the concepts hidden in the
     various communities.
+    
+    One deduplicated FCA context is built per community, and only the iceberg
+    of its lattice is computed (the concepts whose support is above some
+    threshold). The results are saved in `{model}/concepts/{bound}/` : 
+    
+        + 'summary.txt' lists the intension of each community (the tokens 
+          common to all its variables)
+        + '{community}.csv' lists the concepts mined in each community 
+        + '{community}.dot' is the graphviz source of the iceberg lattice
+    
+    .. note::
+        The following flags customize the analysis: `fca_min_support`, 
+        `fca_max_concepts` and `fca_jobs` (the number of worker processes used
+        to process the communities in parallel).
     '''
-    c = core.graph_to_fca_context(graph)
+    min_support  = getattr(flags, 'fca_min_support',  None)
+    min_support  = DEFAULT_MIN_SUPPORT  if min_support  is None else min_support
+    max_concepts = getattr(flags, 'fca_max_concepts', None)
+    max_concepts = DEFAULT_MAX_CONCEPTS if max_concepts is None else max_concepts
+    jobs         = getattr(flags, 'fca_jobs',         None)
+    jobs         = 1                    if jobs         is None else jobs
     
-    for i in range( len(clusters) ):
-        named    = [str(vertex) for vertex in clusters[i] if core.vertex_repr(graph, vertex) != '???' ]
-        print("{:3d} | {} ".format( i, c.intension( named ) ))
+    target   = "{}/concepts/{:03d}".format(model, bound)
+    os.makedirs(target, exist_ok=True)
     
+    # semantic info is needed to build the contexts (only available here)
+    contexts = [ core.community_to_fca_context(graph, c) for c in clusters ]
+    tasks    = [ (c, min_support, max_concepts) for c in contexts ]
+    
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(jobs) as pool:
+            lattices = list(pool.map(_mine_context, tasks, chunksize=8))
+    else:
+        lattices = [ _mine_context(t) for t in tasks ]
+    
+    with open("{}/summary.txt".format(target), 'w') as summary:
+        counter = 0
+        for lattice in lattices:
+            counter += 1
+            intension = lattice[0][2] if lattice else ()
+            print("{:03d} | {} ".format(counter, ' '.join(intension)), file=summary)
+            
+            if not lattice:
+                continue
+            
+            frame = pandas.DataFrame(lattice, columns=['Support', 'Objects', 'Intent'])
+            frame['Intent'] = frame['Intent'].map(' '.join)
+            frame.to_csv("{}/{:03d}.csv".format(target, counter), sep=';', index=False)
+            
+            with open("{}/{:03d}.dot".format(target, counter), 'w') as f:
+                print(concepts_to_dot(lattice), file=f)
     
-    #print(c)
-    c.lattice.graphviz(view=True)
-    return c
-    
\ No newline at end of file
+    return lattices
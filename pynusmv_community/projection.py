@@ -0,0 +1,111 @@
+'''
+This module contains the semantic projection of a VIG. Most of the vertices of
+the VIG of a BMC instance stand for Tseitin auxiliary variables: these have no
+meaning in the model (their representation is '???') and are filtered out by
+the dumps, clouds and mining anyway -- but only after they have inflated the
+clustering.
+
+The projected graph only keeps the vertices of the model variables. The
+auxiliary vertices are eliminated by connecting their semantic neighbours:
+with A the (weighted) adjacency matrix of the VIG, S the semantic vertices, X
+the auxiliary ones and D the diagonal matrix of the (degree - 1) of the
+auxiliary vertices, the adjacency of the projected graph is
+
+    A_SS + A_SX.D^-1.A_XS                         (1 hop, S - x - S)
+         + A_SX.D^-1.A_XX.D^-1.A_XS               (2 hops, S - x - x - S)
+         + ...
+
+The normalization by D keeps the weight brought by one auxiliary vertex
+proportional to its degree (rather than to the square of its degree). All of
+this is computed with sparse matrix products.
+
+.. note::
+    The auxiliary vertices having more than `max_degree` neighbours are not
+    eliminated (they are simply dropped) since that would create a quadratic
+    number of edges.
+'''
+import numpy
+
+# The default max number of auxiliary vertices on a path between two semantic
+# vertices of the projected graph
+DEFAULT_HOPS       = 2
+
+# The auxiliary vertices having more neighbours than this are dropped
+DEFAULT_MAX_DEGREE = 1024
+
+def adjacency(graph):
+    '''
+    :return: the symmetric (csr) adjacency matrix of the `graph` (a `VIG`),
+        weighted by the edge weights (1 when unweighted), without self loops
+    '''
+    from scipy import sparse
+
+    n      = len(graph)
+    edges  = graph.edges
+    weight = numpy.ones(len(edges)) if graph.weight is None else graph.weight.astype(numpy.float64)
+
+    matrix = sparse.coo_matrix((weight, (edges[:, 0], edges[:, 1])), shape=(n, n)).tocsr()
+    matrix = (matrix + matrix.T).tocsr()
+    matrix.setdiag(0)
+    matrix.eliminate_zeros()
+    return matrix
+
+def project(graph, hops=DEFAULT_HOPS, max_degree=DEFAULT_MAX_DEGREE):
+    '''
+    Computes the semantic projection of the `graph`.
+
+    :param graph: the `VIG` to project
+    :param hops: the max number of auxiliary vertices on the paths that are
+        contracted into an edge (at least 1)
+    :param max_degree: the auxiliary vertices having more neighbours than this
+        are dropped rather than contracted
+    :return: a tuple (projected, stats) where projected is a weighted `VIG` over
+        the semantic vertices only and stats is a dictionary with the sizes of
+        the graph before/after the projection.
+    '''
+    import igraph
+    from scipy import sparse
+    from pynusmv_community.vig import VIG
+
+    if hops < 1:
+        raise ValueError("The projection contracts at least 1 hop (hops = {})".format(hops))
+
+    matrix   = adjacency(graph)
+    degree   = numpy.diff(matrix.indptr)
+    semantic = numpy.array([ r != '???' for r in graph.semantics ], dtype=bool)
+
+    sem      = numpy.flatnonzero(semantic)
+    aux      = numpy.flatnonzero(~semantic & (degree <= max_degree))
+
+    rows     = matrix[sem]
+    a_ss     = rows[:, sem]
+    a_sx     = rows[:, aux]
+    a_xx     = matrix[aux][:, aux]
+    inverse  = sparse.diags(1.0 / numpy.maximum(degree[aux] - 1, 1))
+
+    # walk[i, x] = weight of the paths from the semantic vertex i to the aux x
+    walk     = a_sx @ inverse
+    result   = a_ss + walk @ a_sx.T
+    for _ in range(hops - 1):
+        walk   = walk @ a_xx @ inverse
+        result = result + walk @ a_sx.T
+
+    # each edge once, self loops removed
+    result   = sparse.triu(result, k=1).tocoo()
+    edges    = numpy.stack([result.row, result.col], axis=1).astype(numpy.int32)
+
+    projected = VIG(igraph.Graph(n=len(sem), edges=edges),
+                    literals = graph.lit[sem].copy(),
+                    edges    = edges,
+                    weight   = result.data)
+    projected.expansion = dict(graph.expansion or {})
+    projected.inherit_semantics(graph, sem)
+
+    stats = {
+        'projection_vertices_before' : len(graph),
+        'projection_edges_before'    : int(matrix.nnz // 2),
+        'projection_aux_dropped'     : int((~semantic).sum() - len(aux)),
+        'projection_vertices_after'  : len(sem),
+        'projection_edges_after'     : len(edges)
+    }
+    return (projected, stats)
@@ -0,0 +1,230 @@
+'''
+This module contains the background renderer of the images (VIG and cluster
+graph) of the analyzed bounds. Rendering a large graph through cairo can take
+minutes; hence it is not done inside of the analysis loop:
+
+    + the layout and style of the image are computed by the analysis (these
+      need the graph) and packed into a `Job` with the edges to draw
+    + the job is queued and the analysis goes on with the next stage / bound
+    + a pool of worker processes renders the queued jobs. A job lasting longer
+      than its timeout is killed (and reported).
+
+The graphs having more edges than a given threshold are not rendered at all
+(and the reason is reported) since neither their layout nor their picture
+would be of any use.
+
+.. note::
+    The pending jobs are all rendered before the process exits (see `wait`).
+
+.. note::
+    A daemonic process (ie. a worker of `commu batch`) can't start any child
+    process: there, the images are rendered inline, without timeout.
+'''
+import os
+import sys
+import time
+import atexit
+import threading
+
+from collections import deque, namedtuple
+
+# The formats of the images
+FORMATS             = ('png', 'svg', 'webp', 'pdf')
+
+# The default max number of edges of a rendered graph
+DEFAULT_MAX_EDGES   = 250000
+# The default max duration (in seconds) of one rendering
+DEFAULT_TIMEOUT     = 600
+# The default number of worker processes
+DEFAULT_JOBS        = 1
+# The edges of the graphs having more edges than this are not curved
+AUTOCURVE_MAX_EDGES = 2000
+
+# A rendering job:
+#   + name    : a short description of the picture (used in the reports)
+#   + target  : the path of the image (its extension gives the format)
+#   + size    : the width (and height) of the image in pixels
+#   + vertices: the number of vertices of the graph
+#   + edges   : the (m, 2) int32 array of the edges of the graph
+#   + layout  : the (n, 2) array of the coordinates of the vertices
+#   + style   : the keyword arguments of `igraph.plot` (colors, sizes, ...)
+Job = namedtuple('Job', 'name target size vertices edges layout style')
+
+def log(text):
+    ''' reports the outcome of a rendering job '''
+    print("render | {}".format(text), file=sys.stderr)
+
+############### WORKER ########################################################
+
+def draw(job):
+    '''
+    Renders the given `job` (this is executed in a worker process). The image
+    is written aside and renamed so that no partial image is ever visible.
+    '''
+    import igraph
+
+    base, ext = os.path.splitext(job.target)
+    # cairo can't write webp: the image is drawn as png then converted
+    tmp       = "{}.tmp{}".format(base, '.png' if ext == '.webp' else ext)
+
+    graph = igraph.Graph(n=job.vertices, edges=job.edges.tolist())
+    igraph.plot(graph,
+                target = tmp,
+                layout = job.layout.tolist(),
+                bbox   = (0, 0, job.size, job.size),
+                **job.style)
+
+    if ext == '.webp':
+        from PIL import Image
+        with Image.open(tmp) as image:
+            image.save(base + '.tmp.webp', 'WEBP')
+        os.remove(tmp)
+        tmp = base + '.tmp.webp'
+
+    os.replace(tmp, job.target)
+
+############### SCHEDULER #####################################################
+
+class Renderer:
+    '''
+    Renders the submitted jobs in (at most) `jobs` worker processes. Each job
+    runs in its own process so that it can be killed when it exceeds the
+    `timeout`.
+    '''
+
+    def __init__(self, jobs=DEFAULT_JOBS, timeout=DEFAULT_TIMEOUT):
+        import multiprocessing
+
+        # spawn: the scheduler thread must never fork the analysis process
+        self.context   = multiprocessing.get_context('spawn')
+        self.jobs      = max(1, jobs or DEFAULT_JOBS)
+        self.timeout   = timeout
+        self.queue     = deque()
+        self.running   = []
+        self.condition = threading.Condition()
+        self.thread    = None
+
+    def submit(self, job):
+        '''
+        Queues the given `job` (it is rendered as soon as a worker is free)
+        '''
+        with self.condition:
+            self.queue.append(job)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._schedule, name='render', daemon=True)
+                self.thread.start()
+            self.condition.notify_all()
+
+    def wait(self):
+        '''
+        Blocks until all the submitted jobs are over
+        '''
+        with self.condition:
+            while self.queue or self.running:
+                self.condition.wait(0.5)
+
+    def _schedule(self):
+        with self.condition:
+            while self.queue or self.running:
+                self._reap()
+                while self.queue and len(self.running) < self.jobs:
+                    self._start(self.queue.popleft())
+                self.condition.wait(0.2)
+            self.thread = None
+            self.condition.notify_all()
+
+    def _start(self, job):
+        process = self.context.Process(target=draw, args=(job,), name=job.name)
+        try:
+            process.start()
+            self.running.append((process, job, time.time()))
+        except Exception as error:
+            # ie. the main module can't be imported by the worker
+            log("{} failed to start ({})".format(job.name, error))
+
+    def _reap(self):
+        still = []
+        for process, job, started in self.running:
+            elapsed = time.time() - started
+            if not process.is_alive():
+                process.join()
+                if process.exitcode != 0:
+                    log("{} failed (exit code {})".format(job.name, process.exitcode))
+            elif self.timeout and elapsed > self.timeout:
+                process.kill()
+                process.join()
+                log("{} killed after {:.1f}s (timeout)".format(job.name, elapsed))
+                cleanup(job)
+            else:
+                still.append((process, job, started))
+        self.running = still
+
+def cleanup(job):
+    ''' removes the temporary files left by an interrupted `job` '''
+    base, _ = os.path.splitext(job.target)
+    for ext in ('.png', '.svg', '.pdf', '.webp'):
+        if os.path.exists(base + '.tmp' + ext):
+            os.remove(base + '.tmp' + ext)
+
+############### ENTRY POINTS ##################################################
+
+# The renderer of this process (created on first use)
+__RENDERER = None
+
+def renderer(flags=None):
+    '''
+    :return: the renderer of this process (it is created, and configured
+        with the `flags`, the first time this function is called)
+    '''
+    global __RENDERER
+
+    if __RENDERER is None:
+        # a timeout of 0 means no timeout at all
+        timeout    = getattr(flags, 'render_timeout', None)
+        __RENDERER = Renderer(getattr(flags, 'render_jobs', None) or DEFAULT_JOBS,
+                              DEFAULT_TIMEOUT if timeout is None else timeout)
+        atexit.register(wait)
+    return __RENDERER
+
+def wait():
+    '''
+    Blocks until all the images submitted so far are rendered
+    '''
+    if __RENDERER is not None:
+        __RENDERER.wait()
+
+def admit(name, edges, flags=None):
+    '''
+    :return: True iff a graph having that many `edges` must be rendered (the
+        reason why it is skipped is reported otherwise)
+    '''
+    limit = getattr(flags, 'render_max_edges', None)
+    limit = DEFAULT_MAX_EDGES if limit is None else limit
+    if edges > limit:
+        log("{} skipped: {} edges > {} (see --render-max-edges)".format(name, edges, limit))
+        return False
+    return True
+
+def submit(job, flags=None):
+    '''
+    Queues the rendering of `job` (or renders it right away when this process
+    can't have any child, see the module documentation)
+    '''
+    import multiprocessing
+
+    os.makedirs(os.path.dirname(job.target) or '.', exist_ok=True)
+    if multiprocessing.current_process().daemon:
+        draw_inline(job)
+    else:
+        renderer(flags).submit(job)
+
+def draw_inline(job):
+    '''
+    Renders the given `job` in this very process, reporting its failure (if
+    any) just like the renderer does
+    '''
+    try:
+        draw(job)
+    except Exception as error:
+        log("{} failed ({})".format(job.name, error))
+        cleanup(job)
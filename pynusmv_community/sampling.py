@@ -0,0 +1,216 @@
+'''
+This module contains the strategies used to decide which bounds are analyzed
+during a sweep.
+
+    + `DenseSweep` simply analyzes all the bounds of a range (this is the
+      default behavior of the tool)
+    + `AdaptiveSweep` starts with a coarse grid of bounds and then bisects the
+      intervals where the modularity or the number of communities changes more
+      than some tolerance. Since these metrics evolve smoothly over long
+      stretches of bounds, this produces the same evolution curves for a
+      fraction of the CNF generations and clusterings.
+
+Both strategies can be capped with a maximum number of analyzed bounds and/or
+a time budget.
+
+A sweep is used as follows::
+
+    for bound in sweep:
+        record = analyze(bound)
+        sweep.report(bound, record)
+'''
+import abc
+import time
+import heapq
+
+from collections import deque
+
+# The default distance between two bounds of the coarse grid
+DEFAULT_STEP                  = 10
+# The default (absolute) tolerance on the modularity
+DEFAULT_TOLERANCE_MODULARITY  = 0.01
+# The default (relative) tolerance on the number of communities
+DEFAULT_TOLERANCE_COMMUNITIES = 0.05
+
+class Sweep(abc.ABC):
+    '''
+    The base class of all sweeps. It implements the budget (max number of
+    analyzed bounds and time budget) which caps the sweep.
+    '''
+
+    def __init__(self, max_bounds=None, time_budget=None):
+        '''
+        :param max_bounds: the max number of bounds to analyze (None = no limit)
+        :param time_budget: the max duration (in seconds) of the sweep. No new
+            bound is started once the budget is exhausted. (None = no limit)
+        '''
+        self.max_bounds  = max_bounds
+        self.time_budget = time_budget
+        self.started     = time.time()
+        self.results     = {}
+
+    def exhausted(self):
+        '''
+        :return: True iff the budget of the sweep is exhausted
+        '''
+        if self.max_bounds is not None and len(self.results) >= self.max_bounds:
+            return True
+        if self.time_budget is not None and time.time() - self.started >= self.time_budget:
+            return True
+        return False
+
+    def report(self, bound, record):
+        '''
+        Reports the `record` obtained for the analysis of `bound`
+        '''
+        value = lambda k: record[k][0] if isinstance(record[k], list) else record[k]
+        self.results[bound] = (value('modularity'), value('#communities'))
+
+    def __iter__(self):
+        for bound in self.bounds():
+            if self.exhausted():
+                return
+            yield bound
+
+    @abc.abstractmethod
+    def bounds(self):
+        '''
+        Generates the bounds to analyze (regardless of the budget)
+        '''
+
+    def pending(self):
+        '''
+        :return: the list of the bounds known to be analyzed next (this is used
+            to estimate the remaining time of the sweep)
+        '''
+        return []
+
+class DenseSweep(Sweep):
+    '''
+    Analyzes all the bounds of the given range
+    '''
+
+    def __init__(self, depths, max_bounds=None, time_budget=None):
+        super().__init__(max_bounds, time_budget)
+        self.depths = depths
+
+    def bounds(self):
+        return iter(self.depths)
+
+    def pending(self):
+        return [ b for b in self.depths if b not in self.results ]
+
+class AdaptiveSweep(Sweep):
+    '''
+    Analyzes a coarse grid of bounds, then refines (bisects) the intervals of
+    that grid where the modularity changes by more than `tol_modularity` or
+    the number of communities changes (relatively) by more than
+    `tol_communities`. The intervals showing the largest changes are refined
+    first so that a limited budget is spent where it matters most.
+    
+    .. note::
+        The bounds of the coarse grid are not analyzed from left to right but
+        interleaved (both ends first, then the midpoints, see `coarse`): when
+        the budget is exhausted halfway through the grid, the analyzed bounds
+        still span the whole range.
+    '''
+
+    def __init__(self, min_bound, max_bound,
+                 step            = DEFAULT_STEP,
+                 tol_modularity  = DEFAULT_TOLERANCE_MODULARITY,
+                 tol_communities = DEFAULT_TOLERANCE_COMMUNITIES,
+                 max_bounds      = None,
+                 time_budget     = None):
+        super().__init__(max_bounds, time_budget)
+        self.min_bound       = min_bound
+        self.max_bound       = max_bound
+        self.step            = max(1, step)
+        self.tol_modularity  = tol_modularity
+        self.tol_communities = tol_communities
+
+    def grid(self):
+        '''
+        :return: the coarse grid of bounds (always including both ends)
+        '''
+        grid = list(range(self.min_bound, self.max_bound+1, self.step))
+        if grid[-1] != self.max_bound:
+            grid.append(self.max_bound)
+        return grid
+
+    def coarse(self):
+        '''
+        :return: the bounds of the coarse grid in the order they are analyzed:
+            both ends first, then the midpoints of the grid, breadth first
+        '''
+        grid   = self.grid()
+        order  = [ grid[0] ] if len(grid) == 1 else [ grid[0], grid[-1] ]
+        queue  = deque([ (0, len(grid)-1) ])
+        while queue:
+            lo, hi = queue.popleft()
+            if hi - lo > 1:
+                mid = (lo + hi) // 2
+                order.append(grid[mid])
+                queue.append((lo, mid))
+                queue.append((mid, hi))
+        return order
+
+    def change(self, lo, hi):
+        '''
+        :return: how much the metrics change between bounds `lo` and `hi`
+            (relative to the tolerances: a value > 1 means the interval must
+            be refined)
+        '''
+        q_lo, c_lo = self.results[lo]
+        q_hi, c_hi = self.results[hi]
+
+        d_q = abs(q_hi - q_lo) / self.tol_modularity if self.tol_modularity else 0
+        d_c = abs(c_hi - c_lo) / max(c_lo, c_hi, 1)
+        d_c = d_c / self.tol_communities if self.tol_communities else 0
+        return max(d_q, d_c)
+
+    def pending(self):
+        # the refinements are not known in advance
+        return [ b for b in self.coarse() if b not in self.results ]
+
+    def bounds(self):
+        for bound in self.coarse():
+            yield bound
+
+        # intervals to refine (biggest changes first)
+        queue = []
+        def consider(lo, hi):
+            if hi - lo > 1 and lo in self.results and hi in self.results:
+                change = self.change(lo, hi)
+                if change > 1:
+                    heapq.heappush(queue, (-change, lo, hi))
+
+        grid = self.grid()
+        for lo, hi in zip(grid, grid[1:]):
+            consider(lo, hi)
+
+        while queue:
+            _, lo, hi = heapq.heappop(queue)
+            mid = (lo + hi) // 2
+            yield mid
+            consider(lo, mid)
+            consider(mid, hi)
+
+def mk_sweep(depths, flags):
+    '''
+    :param depths: the range of bounds to sweep
+    :param flags: the command line flags (which tell whether or not the sweep
+        is adaptive and what its budget is)
+    :return: the sweep that must be used to analyze `depths`
+    '''
+    max_bounds  = getattr(flags, 'max_analyzed_bounds', None)
+    time_budget = getattr(flags, 'time_budget', None)
+
+    if getattr(flags, 'adaptive', False) and len(depths) > 0:
+        return AdaptiveSweep(depths[0], depths[-1],
+                             step            = flags.coarse_step,
+                             tol_modularity  = flags.tolerance_modularity,
+                             tol_communities = flags.tolerance_communities,
+                             max_bounds      = max_bounds,
+                             time_budget     = time_budget)
+
+    return DenseSweep(depths, max_bounds, time_budget)
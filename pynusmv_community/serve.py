@@ -0,0 +1,477 @@
+'''
+This module contains the logic of the `commu serve` subcommand. This command
+starts a local HTTP server which serves one single copy of the d3 viewers
+(`data/graph_vis` and `data/table_vis`) and streams the data of the analyzed
+bounds on demand, straight from the analysis outputs. This way:
+
+    + no copy of the viewers is made for each bound
+    + the (possibly multi-MB) time tables are loaded page by page instead of
+      in one go.
+
+The server understands the following routes (all the data routes answer with
+JSON unless stated otherwise):
+
+    + `/`                                       : the list of the models/bounds
+    + `/graph/?model=M&bound=B`                 : the d3 cluster graph viewer
+    + `/table/?model=M&bound=B`                 : the d3 time table viewer
+    + `/api/models`                             : the models having some data
+    + `/api/M/bounds`                           : the bounds of model M
+    + `/api/M/B/table?offset=&limit=&community=`: one page of the time table
+    + `/api/M/B/communities?offset=&limit=`     : one page of the communities
+    + `/api/M/B/graph`                          : the cluster graph
+    + `/api/M/B/sequences?community=`           : the frequent sequences (csv)
+
+.. note::
+    The viewers read the data produced by the `--show-time-table` and
+    `--show-d3-cluster-graph` flags, either from the loose files or from the
+    archive of the model (see `archive` and the `--archive` flag).
+
+.. note::
+    The outputs of each formula of a formula file (`{model}/f000`, see 
+    `main.formula_key`) and of each task of a batch (`{model}/t<key>`, see
+    `batch.task_folder`) are served as models of their own, named after their
+    folder (ie. 'philo/f000'). 
+
+.. note::
+    The list of the models is cached for `MODELS_TTL` seconds, and the 
+    archives of the models are only opened once.
+'''
+import os
+import io
+import re
+import csv
+import sys
+import json
+import time
+import shutil
+import threading
+import zipfile
+import argparse
+import functools
+import mimetypes
+
+from os.path           import abspath, join, isdir, isfile
+from http.server       import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse      import urlparse, parse_qs, quote, unquote
+
+from pynusmv_community import archive
+
+# The default port of the server
+DEFAULT_PORT  = 8000
+# The default number of rows of one page
+DEFAULT_LIMIT = 200
+# The max number of rows of one page
+MAX_LIMIT     = 5000
+# The number of seconds the list of the models is cached
+MODELS_TTL    = 5
+
+# The sub folders of a model holding the outputs of one formula or batch task
+SUBMODEL      = re.compile(r'^(f\d{3}|t[0-9a-f]{10})$')
+
+# The viewers served by the server
+VIEWERS = {
+    'graph' : abspath(join(__file__, '../data/graph_vis')),
+    'table' : abspath(join(__file__, '../data/table_vis'))
+}
+
+############### DATA LOCATION #################################################
+
+def table_file(model, bound):
+    ''':return: the path to the time table of `model` at `bound`'''
+    return "{}/table_vis/{:03d}.jsonl".format(model, bound)
+
+def graph_file(model, bound):
+    ''':return: the path to the cluster graph of `model` at `bound`'''
+    return "{}/json/{:03d}/cluster_graph.json".format(model, bound)
+
+def sequences_file(model, bound):
+    ''':return: the path to the frequent sequences of `model` at `bound`'''
+    return "{}/mining/{:03d}/sequences.csv".format(model, bound)
+
+# The archives opened so far (folder -> read only archive) and the models found
+# in each root (root -> (time of the scan, models))
+__STORES = {}
+__MODELS = {}
+__LOCK   = threading.Lock()
+
+def store(root, model):
+    '''
+    :return: the read only `archive.Archive` of `model` (None when the model
+        has no archive). The archive is opened once and shared by all the 
+        requests.
+    '''
+    folder = join(root, model)
+    with __LOCK:
+        cached = __STORES.get(folder)
+        if not archive.exists(folder):
+            if cached is not None:
+                del __STORES[folder]
+                cached.close()
+            return None
+        if cached is None:
+            cached = __STORES[folder] = archive.Archive(folder, readonly=True, shared=True)
+        return cached
+
+def archived(root, model):
+    '''
+    :return: the names of the artifacts of `model` packed in its archive (an
+        empty list when the model has no archive)
+    '''
+    packed = store(root, model)
+    return [] if packed is None else packed.names()
+
+def has_data(root, model):
+    ''':return: True iff `model` has data to display in one of the viewers'''
+    return isdir(join(root, model, 'table_vis')) or isdir(join(root, model, 'json')) \
+        or any(n.startswith(('table_vis/', 'json/')) for n in archived(root, model))
+
+def scan(root):
+    '''
+    :return: the sorted list of the models (folders of `root`, and their 
+        formula or task sub folders) having data to display in one of the 
+        viewers
+    '''
+    result = []
+    for name in sorted(os.listdir(root)):
+        if not isdir(join(root, name)):
+            continue
+        if has_data(root, name):
+            result.append(name)
+        for sub in sorted(os.listdir(join(root, name))):
+            model = '{}/{}'.format(name, sub)
+            if SUBMODEL.match(sub) and isdir(join(root, model)) and has_data(root, model):
+                result.append(model)
+    return result
+
+def models(root):
+    '''
+    :return: the sorted list of the models having data to display in one of
+        the viewers (see `scan`). The list is only scanned anew when it is 
+        older than `MODELS_TTL` seconds.
+    '''
+    now = time.monotonic()
+    with __LOCK:
+        cached = __MODELS.get(root)
+    if cached is None or now - cached[0] > MODELS_TTL:
+        cached = (now, scan(root))
+        with __LOCK:
+            __MODELS[root] = cached
+    return cached[1]
+
+def bounds(root, model):
+    '''
+    :return: a dictionary viewer -> sorted list of the bounds of `model` that
+        can be displayed in that viewer
+    '''
+    def numbers(folder, suffix=''):
+        if not isdir(folder):
+            return []
+        names = [ n[:-len(suffix)] if suffix else n for n in os.listdir(folder) if n.endswith(suffix) ]
+        return [ int(n) for n in names if n.isdigit() ]
+
+    packed = set(archived(root, model))
+    tables = numbers(join(root, model, 'table_vis'), '.jsonl') \
+           + [ archive.bound_of(n) for n in packed if n.startswith('table_vis/') and n.endswith('.jsonl') ]
+    graphs = [ b for b in numbers(join(root, model, 'json'))
+               if isfile(join(root, graph_file(model, b))) ] \
+           + [ archive.bound_of(n) for n in packed if n.startswith('json/') and n.endswith('/cluster_graph.json') ]
+    return {
+        'table' : sorted(set(tables)),
+        'graph' : sorted(set(graphs))
+    }
+
+############### TIME TABLES ###################################################
+
+class TimeTable:
+    '''
+    A time table (as dumped by `visualization.table_visualisation`) that is
+    read page by page. The file is made of one header line followed by one
+    line per variable; only the offsets of these lines are kept in memory.
+
+    The table may also be the `size` bytes starting at `start` in `path` (ie.
+    a member stored without compression in the archive of the model).
+    '''
+
+    def __init__(self, path, start=0, size=None):
+        import numpy
+
+        self.path = path
+        self.end  = start + (os.path.getsize(path) - start if size is None else size)
+        with open(path, 'rb') as f:
+            f.seek(start)
+            self.header = json.loads(f.readline().decode('utf-8'))
+            offsets     = []
+            while f.tell() < self.end:
+                offsets.append(f.tell())
+                if not f.readline():
+                    break
+        self.offsets = numpy.array(offsets, dtype=numpy.int64)
+        self._by_commu = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def rows(self, indices):
+        '''
+        :return: the list of the rows at the given `indices`
+        '''
+        result = []
+        with open(self.path, 'rb') as f:
+            for i in indices:
+                f.seek(int(self.offsets[i]))
+                result.append(json.loads(f.readline().decode('utf-8')))
+        return result
+
+    def by_community(self):
+        '''
+        :return: a dictionary community -> array of the indices of the rows
+            where that community appears (computed once, on first use)
+        '''
+        import numpy
+
+        if self._by_commu is None:
+            index = {}
+            with open(self.path, 'rb') as f:
+                f.seek(int(self.offsets[0]) if len(self) else 0)
+                for i in range(len(self)):
+                    _, frames = json.loads(f.readline().decode('utf-8'))
+                    for c in set(c for frame in frames for c in frame):
+                        index.setdefault(c, []).append(i)
+            self._by_commu = { c: numpy.array(r, dtype=numpy.int64) for c, r in index.items() }
+        return self._by_commu
+
+    def page(self, offset=0, limit=DEFAULT_LIMIT, community=None):
+        '''
+        :return: a dictionary with the header of the table, the total number of
+            rows (possibly restricted to the rows of one `community`) and the
+            `limit` rows starting at `offset`.
+        '''
+        import numpy
+
+        if community is None:
+            selected = numpy.arange(len(self))
+        else:
+            selected = self.by_community().get(community, numpy.zeros(0, dtype=numpy.int64))
+
+        page = dict(self.header)
+        page.update({
+            'total'  : len(selected),
+            'offset' : offset,
+            'rows'   : self.rows(selected[offset:offset+limit])
+        })
+        return page
+
+@functools.lru_cache(maxsize=16)
+def _time_table(path, start, size, mtime):
+    return TimeTable(path, start, size)
+
+def time_table(path, start=0, size=None):
+    '''
+    :return: the (cached) time table stored in `path` (at `start`, see
+        `TimeTable`). The cache entry is invalidated as soon as the file is
+        rewritten.
+    '''
+    return _time_table(path, start, size, os.stat(path).st_mtime_ns)
+
+############### REQUEST HANDLING ##############################################
+
+class NotFound(Exception):
+    pass
+
+class Handler(BaseHTTPRequestHandler):
+    '''
+    Handles the requests of the viewers. The `root` class attribute is the
+    folder holding the analysis outputs (one sub folder per model).
+    '''
+    root = '.'
+
+    def do_GET(self):
+        url    = urlparse(self.path)
+        parts  = [ unquote(p) for p in url.path.split('/') if p ]
+        params = { k: v[-1] for k,v in parse_qs(url.query).items() }
+
+        try:
+            if not parts:
+                self.send_html(self.home())
+            elif parts[0] in VIEWERS:
+                self.send_static(VIEWERS[parts[0]], parts[1:] or ['index.html'])
+            elif parts[0] == 'api':
+                self.api(parts[1:], params)
+            else:
+                raise NotFound(url.path)
+        except NotFound as e:
+            self.send_error(404, 'Not found: {}'.format(e))
+        except (ValueError, KeyError) as e:
+            self.send_error(400, 'Bad request: {}'.format(e))
+
+    def log_message(self, fmt, *args):
+        # keep the console quiet unless something goes wrong
+        pass
+
+    ############### ROUTES ####################################################
+
+    def home(self):
+        items = []
+        for model in models(self.root):
+            links = []
+            for viewer, bnds in sorted(bounds(self.root, model).items()):
+                for b in bnds:
+                    links.append('<a href="/{0}/?model={1}&bound={2}">{0} {2}</a>'.format(viewer, quote(model, safe=''), b))
+            items.append('<li><b>{}</b> {}</li>'.format(model, ' '.join(links)))
+        return '<html><body><h1>Models</h1><ul>{}</ul></body></html>'.format(''.join(items))
+
+    def api(self, parts, params):
+        if parts == ['models']:
+            return self.send_json(models(self.root))
+
+        if not parts or parts[0] not in models(self.root):
+            raise NotFound('/'.join(parts))
+        model = parts[0]
+
+        if parts[1:] == ['bounds']:
+            return self.send_json(bounds(self.root, model))
+        if len(parts) != 3:
+            raise NotFound('/'.join(parts))
+
+        bound  = int(parts[1])
+        what   = parts[2]
+        offset = max(0, int(params.get('offset', 0)))
+        limit  = min(MAX_LIMIT, max(1, int(params.get('limit', DEFAULT_LIMIT))))
+        commu  = int(params['community']) if 'community' in params else None
+
+        if what == 'table':
+            table = self.table(model, bound)
+            return self.send_json(table.page(offset, limit, commu))
+
+        if what == 'communities':
+            table = self.table(model, bound)
+            index = table.by_community()
+            comms = table.header['communities']
+            lin   = table.header.get('lineage')
+            page  = [ {'community': c,
+                       'lineage'  : lin[c-1] if lin else None,
+                       'variables': len(index.get(c, ()))} for c in comms[offset:offset+limit] ]
+            return self.send_json({'total': len(comms), 'offset': offset, 'rows': page})
+
+        if what == 'graph':
+            return self.send_bytes(self.read(model, graph_file(model, bound)), 'application/json')
+
+        if what == 'sequences':
+            data = self.read(model, sequences_file(model, bound))
+            if commu is not None:
+                data = self.filter_sequences(data, commu)
+            return self.send_bytes(data, 'text/csv')
+
+        raise NotFound(what)
+
+    ############### HELPERS ###################################################
+
+    def locate(self, model, path):
+        '''
+        :return: a tuple (file, member) where member is the archive member of
+            the artifact `path` ('{model}/...') of `model` or None when `file`
+            is the loose file of that artifact
+        '''
+        full = join(self.root, path)
+        if isfile(full):
+            return (full, None)
+
+        packed = store(self.root, model)
+        member = None if packed is None else packed.member(path[len(model)+1:])
+        if member is not None:
+            return (packed.zip_file, member)
+        raise NotFound(path)
+
+    def read(self, model, path):
+        ''':return: the content (bytes) of the artifact `path` ('{model}/...')'''
+        full, member = self.locate(model, path)
+        if member is None:
+            with open(full, 'rb') as f:
+                return f.read()
+        return store(self.root, model).read(member.name)
+
+    def table(self, model, bound):
+        ''':return: the time table of `model` at `bound`'''
+        full, member = self.locate(model, table_file(model, bound))
+        if member is None:
+            return time_table(full)
+        if member.method != zipfile.ZIP_STORED:
+            raise NotFound('{} (compressed)'.format(table_file(model, bound)))
+        return time_table(full, member.offset, member.size)
+
+    @staticmethod
+    def filter_sequences(data, community):
+        out = io.StringIO()
+        reader = csv.reader(io.StringIO(data.decode('utf-8'), newline=''))
+        writer = csv.writer(out)
+        header = next(reader, [])
+        column = header.index('CommunityNo')
+        writer.writerow(header)
+        for row in reader:
+            if row[column] == str(community):
+                writer.writerow(row)
+        return out.getvalue().encode('utf-8')
+
+    def send_static(self, folder, parts):
+        path = abspath(join(folder, *parts))
+        if not path.startswith(folder + os.sep) or not isfile(path):
+            raise NotFound('/'.join(parts))
+        self.send_file(path, mimetypes.guess_type(path)[0] or 'application/octet-stream')
+
+    def send_file(self, path, ctype):
+        self.send_response(200)
+        self.send_header('Content-Type',   ctype)
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def send_bytes(self, data, ctype):
+        self.send_response(200)
+        self.send_header('Content-Type',   ctype)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_json(self, data):
+        self.send_bytes(json.dumps(data).encode('utf-8'), 'application/json')
+
+    def send_html(self, text):
+        self.send_bytes(text.encode('utf-8'), 'text/html; charset=utf-8')
+
+############### ENTRY POINT ###################################################
+
+def arguments():
+    args = argparse.ArgumentParser(prog="commu serve", description="""
+        Serves the d3 viewers and the data of the analyzed models over HTTP
+    """)
+
+    root              = args.add_argument("root", nargs='?')
+    root.help         = "The folder holding the analysis outputs (one sub folder per model)"
+    root.default      = '.'
+
+    port              = args.add_argument("-p", "--port", type=int)
+    port.help         = "The port to listen on"
+    port.default      = DEFAULT_PORT
+
+    host              = args.add_argument("--host")
+    host.help         = "The interface to listen on"
+    host.default      = '127.0.0.1'
+
+    return args
+
+def main(argv=None):
+    '''
+    The entry point of the `commu serve` subcommand.
+    '''
+    args         = arguments().parse_args(argv)
+    Handler.root = abspath(args.root)
+
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print("Serving {} on http://{}:{}/ (Ctrl-C to stop)".format(Handler.root, args.host, args.port), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
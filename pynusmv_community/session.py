@@ -0,0 +1,321 @@
+'''
+This module contains the library API of the tool. The command line writes all
+of its results into `{model}/...` folders; which is not what one wants in a
+notebook or a service where these results would only be read back.
+
+An `AnalysisSession` owns the NuSMV lifecycle (initialization, loading of the
+model, BMC sub system) and produces one `BoundResult` per analyzed bound. All
+the results of a bound are computed lazily -- on first access -- and kept in
+memory:
+
+    + `cnf`       : the `BeCnf` of the problem
+    + `clauses`   : the clauses of that cnf as flat NumPy arrays
+    + `graph`     : the VIG (projected if `project_semantic` is set)
+    + `clusters`  : the community structure of the graph
+    + `semantics` : the semantic table (literal -> (time, short repr))
+    + `patterns`  : the frequent patterns of each community (DataFrame)
+    + `sequences` : the frequent sequences of each community (DataFrame)
+    + `table`     : the data of the time table viewer (header, rows)
+    + `record`    : the statistics record (as in `main.analyze_one`)
+
+Nothing is written to disk unless asked for: `BoundResult.write` runs the
+artifact stages (see `stages`) and the `sink` of `AnalysisSession.sweep`
+persists the records.
+
+Example::
+
+    with AnalysisSession('models', 'counter', seed=42) as session:
+        for result in session.sweep(range(5)):
+            with result:
+                print(result.bound, result.record['modularity'])
+                result.write('dump_communities')
+
+.. note::
+    NuSMV is a process wide singleton: only one session can be open at a time.
+'''
+import argparse
+import contextlib
+
+from pynusmv_community import cmdline, core, main, stages
+
+def mk_flags(flags=None, **options):
+    '''
+    :param flags: the flags to start from (the default flags if None)
+    :param options: the flags to override (ie. `seed=42, simplify=True`)
+    :return: a copy of the `flags` with the given `options`
+    :raises ValueError: if one of the options is not a known flag
+    '''
+    flags = argparse.Namespace(**vars(flags or cmdline.do_nothing_flags()))
+    for name, value in options.items():
+        if not hasattr(flags, name):
+            raise ValueError("Unknown option: {}".format(name))
+        setattr(flags, name, value)
+    return flags
+
+class AnalysisSession:
+    '''
+    A session analyzing one model in memory (see the module documentation).
+    '''
+
+    def __init__(self, path_to, model, flags=None, **options):
+        '''
+        :param path_to: the path to the folder containing the model
+        :param model: the name of the model to load (without the .smv suffix)
+        :param flags: the flags (as parsed by `cmdline`) driving the analysis.
+            The artifact stages they enable are only run by `write`.
+        :param options: individual flags overriding these of `flags`
+        '''
+        self.path_to = path_to
+        self.model   = model
+        self.flags   = mk_flags(flags, **options)
+        self._stack  = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *_):
+        self.close()
+
+    @property
+    def is_open(self):
+        ''':return: True iff the model is currently loaded'''
+        return self._stack is not None
+
+    def open(self):
+        '''
+        Initializes NuSMV and loads the model (this is a no-op when the session
+        is already open).
+
+        :return: self
+        '''
+        if self._stack is None:
+            stack = contextlib.ExitStack()
+            stack.enter_context(main.loaded_model(self.path_to, self.model))
+            self._stack = stack
+        return self
+
+    def close(self):
+        '''
+        Unloads the model and deinitializes NuSMV. The results of this session
+        that depend on NuSMV (ie. the semantic info) must have been computed
+        before that.
+        '''
+        if self._stack is not None:
+            stack, self._stack = self._stack, None
+            stack.close()
+
+    def analyze(self, bound, formula=None):
+        '''
+        :param bound: the number of time steps of the problem
+        :param formula: an LTL formula to check (may be None)
+        :return: the (lazy) `BoundResult` of the analysis of the model at
+            `bound`. Nothing is computed until some result is accessed.
+        '''
+        self.open()
+        return BoundResult(self.model, bound, formula, self.flags)
+
+    def sweep(self, bounds, formula=None, sink=None):
+        '''
+        Analyzes the model for each of the `bounds`.
+
+        :param bounds: the bounds to analyze
+        :param formula: an LTL formula to check (may be None)
+        :param sink: an optional object having an `append(record)` method (ie.
+            a `sink.StatsSink`) receiving the record of each bound
+        :return: a generator of the `BoundResult` of each bound.
+
+        .. note::
+            The results are not closed by the generator: use them as context
+            managers (or close them) when their graph is no longer needed.
+
+        .. note::
+            Without a `sink`, the results are as lazy as these of `analyze`.
+            With a sink, the sweep is eager: the record of each bound (hence 
+            its graph and clustering) is computed before the result is yielded.
+        '''
+        for bound in bounds:
+            result = self.analyze(bound, formula)
+            if sink is not None:
+                sink.append(result.record)
+            yield result
+
+class BoundResult:
+    '''
+    The in-memory results of the analysis of one model at one bound. Each
+    result is computed the first time it is accessed.
+    '''
+
+    def __init__(self, model, bound, formula=None, flags=None):
+        self.model       = model
+        self.bound       = bound
+        self.formula     = formula
+        self.flags       = flags or cmdline.do_nothing_flags()
+        self._cnf        = None
+        self._clauses    = None
+        self._simplified = None
+        self._graph      = None
+        self._projection = None
+        self._clusters   = None
+        self._semantics  = None
+        self._patterns   = None
+        self._sequences  = None
+        self._table      = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    ############### FORMULA ###################################################
+
+    @property
+    def cnf(self):
+        ''':return: the `BeCnf` of the problem'''
+        if self._cnf is None:
+            self._cnf = core.mk_cnf(self.bound, self.formula)
+        return self._cnf
+
+    @property
+    def clauses(self):
+        '''
+        :return: the clauses of the `cnf` as a `simplify.FlatCnf` (all the
+            literals in one int32 array, delimited by an array of offsets)
+        '''
+        if self._clauses is None:
+            from pynusmv_community import simplify
+            self._clauses = simplify.FlatCnf.of(self.cnf)
+        return self._clauses
+
+    @property
+    def simplification(self):
+        '''
+        :return: the statistics of the simplification of the cnf (None unless
+            the `simplify` flag is set)
+        '''
+        return self._simplify()[1]
+
+    def _simplify(self):
+        if self._simplified is None:
+            self._simplified = main.simplify_cnf(self.cnf, self.flags)
+        return self._simplified
+
+    ############### GRAPH #####################################################
+
+    @property
+    def graph(self):
+        ''':return: the `vig.VIG` of the problem'''
+        if self._graph is None:
+            graph = core.mk_graph(self._simplify()[0], **main.graph_options(self.flags))
+            self._graph, self._projection = main.project_graph(graph, self.flags)
+        return self._graph
+
+    @property
+    def projection(self):
+        '''
+        :return: the statistics of the semantic projection of the graph (None
+            unless the `project_semantic` flag is set)
+        '''
+        self.graph
+        return self._projection
+
+    @property
+    def clusters(self):
+        ''':return: the community structure (igraph `VertexClustering`)'''
+        return self._cluster()[0]
+
+    @property
+    def hierarchy(self):
+        ''':return: the `core.Hierarchy` of the clustering (if any)'''
+        return self._cluster()[1]
+
+    @property
+    def ensemble(self):
+        ''':return: the `ensemble.Ensemble` of the clustering (if any)'''
+        return self._cluster()[2]
+
+    def _cluster(self):
+        if self._clusters is None:
+            self._clusters = main.cluster(self.model, self.bound, self.graph, self.flags)
+        return self._clusters
+
+    ############### SEMANTICS #################################################
+
+    @property
+    def semantics(self):
+        '''
+        :return: the semantic table of the graph: a dictionary mapping the cnf
+            literal of each vertex to a tuple (time frame, short repr). The
+            auxiliary variables have no time frame (`vig.NO_TIME`) and are
+            represented as '???'.
+        '''
+        if self._semantics is None:
+            graph = self.graph
+            times = graph.time_frame.tolist()
+            self._semantics = { l: (t, r) for l, t, r in zip(graph.lit.tolist(), times, graph.semantics) }
+        return self._semantics
+
+    @property
+    def patterns(self):
+        ''':return: the frequent patterns of each community (see `mining`)'''
+        if self._patterns is None:
+            from pynusmv_community import mining
+            self._patterns = mining.mine_frequent_patterns(self.clusters, self.graph)
+        return self._patterns
+
+    @property
+    def sequences(self):
+        ''':return: the frequent sequences of each community (see `mining`)'''
+        if self._sequences is None:
+            from pynusmv_community import mining
+            self._sequences = mining.mine_frequent_sequences(self.clusters, self.graph)
+        return self._sequences
+
+    @property
+    def table(self):
+        '''
+        :return: the data of the time table viewer as a tuple (header, rows)
+            (see `visualization.time_table`)
+        '''
+        if self._table is None:
+            from pynusmv_community import visualization
+            self._table = visualization.time_table(self.model, self.bound, self.clusters, self.graph)
+        return self._table
+
+    @property
+    def record(self):
+        ''':return: the statistics record of the analysis (see `main.analyze_one`)'''
+        clusters, hierarchy, result = self._cluster()
+        return main.mk_record(self.model, self.bound, self.cnf, self.graph, clusters, hierarchy,
+                              self.simplification, self.projection, result)
+
+    ############### OUTPUT ####################################################
+
+    def write(self, *names):
+        '''
+        Writes the artifacts of this result to disk (in the `{model}/...`
+        folders) by running the artifact stages.
+
+        :param names: the names of the stages to run (ie. 'dump_communities',
+            'show_time_table'). When none is given, the stages enabled by the
+            flags of the session are run.
+        '''
+        flags = self.flags
+        if names:
+            unknown = [ n for n in names if n not in stages.REGISTRY ]
+            if unknown:
+                raise ValueError("Unknown stage(s): {}".format(', '.join(unknown)))
+            flags = argparse.Namespace(**vars(flags))
+            for stage in stages.REGISTRY:
+                setattr(flags, stage, stage in names)
+
+        stages.run(flags, model=self.model, bound=self.bound, cnf=self.cnf,
+                   clusters=self.clusters, graph=self.graph, hierarchy=self.hierarchy)
+
+    def close(self):
+        '''
+        Releases the graph of this result (and the space it occupies on disk
+        when its edges were spilled).
+        '''
+        if self._graph is not None:
+            self._graph.close()
@@ -0,0 +1,372 @@
+'''
+This module contains the (optional) simplification of the CNF before its VIG
+is built. The CNF generated by NuSMV contains many unit, duplicate and
+subsumed clauses: these inflate the graph without carrying any structure. The
+following (satisfiability preserving) simplifications are applied:
+
+    + removal of the duplicate literals and of the tautological clauses
+    + unit propagation
+    + removal of the duplicate clauses
+    + removal of the subsumed clauses
+    + pure literal elimination
+
+The clauses are stored as flat int arrays (one array of literals and one array
+of clause offsets) and each simplification works with occurrence lists built
+over these arrays by sorting, so that no per-clause python object is needed.
+
+.. note::
+    The variables keep their identifier: the semantic information of the
+    vertices of the simplified VIG is the same as in the original one.
+'''
+import numpy
+
+# The number of clauses whose subsumed clauses are looked for in one batch
+SUBSUMPTION_BATCH = 1 << 14
+
+class Unsatisfiable(Exception):
+    '''
+    Raised when the unit propagation derives the empty clause
+    '''
+    pass
+
+class FlatCnf:
+    '''
+    A CNF formula stored as flat int arrays. This class exposes the same
+    `vars_number`, `clauses_number` and `clauses_list` as the `BeCnf` of
+    pynusmv so that it can be used in its place to build the graph.
+    '''
+
+    def __init__(self, vars_number, offsets, literals):
+        '''
+        :param vars_number: the number of variables of the formula
+        :param offsets: the (m+1) offsets of the clauses in `literals`
+        :param literals: the literals of all the clauses
+        '''
+        self.vars_number = vars_number
+        self.offsets     = numpy.asarray(offsets,  dtype=numpy.int64)
+        self.literals    = numpy.asarray(literals, dtype=numpy.int64)
+
+    @staticmethod
+    def of(cnf):
+        '''
+        :return: the `FlatCnf` equivalent to the given pynusmv `BeCnf`
+        '''
+        import itertools
+
+        clauses  = cnf.clauses_list
+        lengths  = numpy.fromiter((len(c) for c in clauses), dtype=numpy.int64, count=len(clauses))
+        literals = numpy.fromiter(itertools.chain.from_iterable(clauses),
+                                  dtype=numpy.int64, count=int(lengths.sum()))
+        offsets  = numpy.concatenate(([0], numpy.cumsum(lengths)))
+        return FlatCnf(cnf.vars_number, offsets, literals)
+
+    @property
+    def clauses_number(self):
+        return len(self.offsets) - 1
+
+    @property
+    def clauses_list(self):
+        lits = self.literals.tolist()
+        offs = self.offsets.tolist()
+        return [ lits[s:e] for s, e in zip(offs, offs[1:]) ]
+
+    def variables(self):
+        ''':return: the number of distinct variables occurring in the clauses'''
+        return len(numpy.unique(numpy.abs(self.literals)))
+
+############### FLAT ARRAYS UTILITIES #########################################
+
+def _clause_ids(offsets):
+    ''':return: the clause of each position of the literals array'''
+    return numpy.repeat(numpy.arange(len(offsets)-1), numpy.diff(offsets))
+
+def _select(offsets, literals, keep_clause, keep_position=None):
+    '''
+    :return: the (offsets, literals) of the formula made of the clauses
+        flagged in `keep_clause`, restricted to the positions flagged in
+        `keep_position` (if any)
+    '''
+    keep = keep_clause[_clause_ids(offsets)]
+    if keep_position is not None:
+        keep &= keep_position
+    lengths = numpy.bincount(_clause_ids(offsets)[keep], minlength=len(offsets)-1)[keep_clause]
+    return (numpy.concatenate(([0], numpy.cumsum(lengths))), literals[keep])
+
+def _gather(offsets, ids):
+    '''
+    :return: the positions spanned by the ranges offsets[i]:offsets[i+1] of all
+        the given `ids` (concatenated)
+    '''
+    starts  = offsets[ids]
+    lengths = offsets[ids+1] - starts
+    total   = int(lengths.sum())
+    if total == 0:
+        return numpy.zeros(0, dtype=numpy.int64)
+    shift   = numpy.repeat(starts - numpy.concatenate(([0], numpy.cumsum(lengths)[:-1])), lengths)
+    return shift + numpy.arange(total)
+
+def _occurrences(keys, size):
+    '''
+    :return: an occurrence list index (order, offsets): the positions holding
+        key k are order[offsets[k]:offsets[k+1]]
+    '''
+    order   = numpy.argsort(keys, kind='stable')
+    offsets = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(keys, minlength=size))))
+    return (order, offsets)
+
+def _code(literals):
+    ''':return: the index of each literal in a table of 2*(vars+1) literals'''
+    return 2 * numpy.abs(literals) + (literals < 0)
+
+############### SIMPLIFICATIONS ###############################################
+
+def normalize(offsets, literals):
+    '''
+    Removes the duplicate literals of each clause and the tautological
+    clauses (those containing both x and -x).
+
+    :return: a tuple (offsets, literals, #tautologies)
+    '''
+    cid   = _clause_ids(offsets)
+    code  = _code(literals)
+    order = numpy.argsort(cid * (int(code.max(initial=0))+1) + code, kind='stable')
+    s_cid = cid[order]
+    s_lit = literals[order]
+
+    same  = s_cid[1:] == s_cid[:-1]
+    dup   = same & (s_lit[1:] == s_lit[:-1])
+    taut  = same & (s_lit[1:] == -s_lit[:-1])
+
+    keep_position = numpy.ones(len(literals), dtype=bool)
+    keep_position[order[1:][dup]] = False
+    keep_clause   = numpy.ones(len(offsets)-1, dtype=bool)
+    keep_clause[s_cid[1:][taut]]  = False
+
+    offsets, literals = _select(offsets, literals, keep_clause, keep_position)
+    return (offsets, literals, int((~keep_clause).sum()))
+
+def propagate(offsets, literals, vars_number):
+    '''
+    Unit propagation: the literals of the unit clauses are assigned, the
+    clauses they satisfy are removed and their negation is removed from the
+    other clauses (possibly producing new unit clauses). The propagation
+    proceeds by rounds, all the units of one round being processed at once.
+
+    :return: a tuple (offsets, literals, #assigned variables)
+    :raise Unsatisfiable: when the empty clause is derived
+    '''
+    clauses  = len(offsets) - 1
+    cid      = _clause_ids(offsets)
+    count    = numpy.diff(offsets)
+    alive    = numpy.ones(len(literals), dtype=bool)
+    active   = numpy.ones(clauses, dtype=bool)
+    value    = numpy.zeros(vars_number+1, dtype=numpy.int8)
+    order, by_var = _occurrences(numpy.abs(literals), vars_number+1)
+
+    if (count == 0).any():
+        raise Unsatisfiable()
+
+    units    = literals[offsets[:-1][count == 1]]
+    assigned = 0
+    while len(units):
+        units = numpy.unique(units)
+        var   = numpy.abs(units)
+        if len(numpy.unique(var)) != len(var):
+            raise Unsatisfiable()
+        sign  = numpy.sign(units).astype(numpy.int8)
+        if (value[var] == -sign).any():
+            raise Unsatisfiable()
+
+        fresh = value[var] == 0
+        var, sign = var[fresh], sign[fresh]
+        value[var] = sign
+        assigned  += len(var)
+
+        positions  = order[_gather(by_var, var)]
+        positions  = positions[alive[positions]]
+        satisfied  = numpy.sign(literals[positions]) == value[numpy.abs(literals[positions])]
+
+        # the satisfied clauses are removed altogether
+        done = numpy.unique(cid[positions[satisfied]])
+        active[done] = False
+        alive[_gather(offsets, done)] = False
+
+        # the falsified literals are removed from the remaining clauses
+        falsified = positions[~satisfied]
+        falsified = falsified[active[cid[falsified]]]
+        alive[falsified] = False
+        touched   = numpy.unique(cid[falsified])
+        count    -= numpy.bincount(cid[falsified], minlength=clauses)
+
+        if (count[touched] == 0).any():
+            raise Unsatisfiable()
+
+        unit_clauses = touched[count[touched] == 1]
+        in_units     = _gather(offsets, unit_clauses)
+        units        = literals[in_units[alive[in_units]]]
+
+    offsets, literals = _select(offsets, literals, active, alive)
+    return (offsets, literals, assigned)
+
+def _mix(values):
+    ''':return: a (splitmix64) hash of each of the given int values'''
+    with numpy.errstate(over='ignore'):
+        z = values.astype(numpy.uint64) + numpy.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> numpy.uint64(30))) * numpy.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> numpy.uint64(27))) * numpy.uint64(0x94D049BB133111EB)
+        return z ^ (z >> numpy.uint64(31))
+
+def deduplicate(offsets, literals):
+    '''
+    Removes the duplicate clauses (regardless of the order of their literals).
+    The clauses are first grouped by (length, order independent hash); only
+    the clauses of one same group are actually compared.
+
+    :return: a tuple (offsets, literals, #duplicates)
+    '''
+    clauses = len(offsets) - 1
+    if clauses == 0:
+        return (offsets, literals, 0)
+
+    # (the clauses are never empty at this point)
+    length  = numpy.diff(offsets)
+    with numpy.errstate(over='ignore'):
+        hashes = numpy.add.reduceat(_mix(literals), offsets[:-1])
+
+    order   = numpy.lexsort((numpy.arange(clauses), hashes, length))
+    same    = (hashes[order][1:] == hashes[order][:-1]) & (length[order][1:] == length[order][:-1])
+
+    group   = numpy.concatenate(([0], numpy.cumsum(~same)))
+    keep    = numpy.ones(clauses, dtype=bool)
+    sorted_ = lambda c: numpy.sort(literals[offsets[c]:offsets[c+1]])
+
+    current, kept = -1, None
+    for k in (numpy.flatnonzero(same) + 1).tolist():
+        # compare with all the distinct clauses kept so far in that group
+        if group[k] != current:
+            current, kept = group[k], [ sorted_(order[k-1]) ]
+        here = sorted_(order[k])
+        if any(numpy.array_equal(here, other) for other in kept):
+            keep[order[k]] = False
+        else:
+            kept.append(here)
+
+    offsets, literals = _select(offsets, literals, keep)
+    return (offsets, literals, int((~keep).sum()))
+
+def subsume(offsets, literals, vars_number, batch=SUBSUMPTION_BATCH):
+    '''
+    Removes the clauses that are subsumed by some other (shorter) clause. The
+    candidates subsumed by a clause C are the clauses containing the least
+    frequent literal of C; they are filtered with 64 bits signatures before the
+    actual inclusion test (which is vectorized over all the candidate pairs).
+
+    .. note::
+        The duplicate clauses must have been removed beforehand.
+
+    :return: a tuple (offsets, literals, #subsumed)
+    '''
+    clauses = len(offsets) - 1
+    if clauses == 0:
+        return (offsets, literals, 0)
+
+    cid     = _clause_ids(offsets)
+    length  = numpy.diff(offsets)
+    code    = _code(literals)
+    size    = 2 * (vars_number + 1)
+
+    # (the clauses are never empty at this point)
+    bits    = numpy.left_shift(numpy.uint64(1), (numpy.abs(literals) % 64).astype(numpy.uint64))
+    sign    = numpy.bitwise_or.reduceat(bits, offsets[:-1])
+
+    order, by_lit = _occurrences(code, size)
+    frequency     = numpy.diff(by_lit)[code]
+    first         = numpy.argsort(cid * (int(frequency.max())+1) + frequency, kind='stable')
+    rarest        = code[first[offsets[:-1]]]
+
+    # (clause, literal) membership test
+    members = numpy.sort(cid * size + code)
+    removed = numpy.zeros(clauses, dtype=bool)
+
+    for start in range(0, clauses, batch):
+        subsuming = numpy.arange(start, min(start+batch, clauses))
+        lengths   = numpy.diff(by_lit)[rarest[subsuming]]
+        cand      = cid[order[_gather(by_lit, rarest[subsuming])]]
+        subs      = numpy.repeat(subsuming, lengths)
+
+        ok   = (cand != subs) & (length[cand] >= length[subs]) & ((sign[subs] & ~sign[cand]) == 0)
+        cand, subs = cand[ok], subs[ok]
+        if not len(cand):
+            continue
+
+        # every literal of subs must belong to cand
+        pos   = _gather(offsets, subs)
+        pair  = numpy.repeat(numpy.arange(len(subs)), length[subs])
+        keys  = cand[pair] * size + code[pos]
+        found = numpy.searchsorted(members, keys)
+        found = members[numpy.minimum(found, len(members)-1)] == keys
+        miss  = numpy.bincount(pair[~found], minlength=len(subs))
+        removed[cand[miss == 0]] = True
+
+    offsets, literals = _select(offsets, literals, ~removed)
+    return (offsets, literals, int(removed.sum()))
+
+def eliminate_pure(offsets, literals, vars_number):
+    '''
+    Pure literal elimination: the clauses containing a variable which only
+    occurs with one polarity are removed. This is repeated until no pure
+    literal remains (removing clauses can make other literals pure).
+
+    :return: a tuple (offsets, literals, #pure literals)
+    '''
+    eliminated = 0
+    while len(literals):
+        var  = numpy.abs(literals)
+        pos  = numpy.bincount(var[literals > 0], minlength=vars_number+1)
+        neg  = numpy.bincount(var[literals < 0], minlength=vars_number+1)
+        pure = (pos > 0) != (neg > 0)
+        if not pure.any():
+            break
+
+        eliminated += int(pure.sum())
+        hit  = numpy.bincount(_clause_ids(offsets)[pure[var]], minlength=len(offsets)-1) > 0
+        offsets, literals = _select(offsets, literals, ~hit)
+    return (offsets, literals, eliminated)
+
+############### ENTRY POINT ###################################################
+
+def simplify(cnf):
+    '''
+    Simplifies the given `cnf` (see the module documentation).
+
+    :param cnf: a pynusmv `BeCnf` (or a `FlatCnf`)
+    :return: a tuple (simplified, stats) where simplified is a `FlatCnf` and
+        stats is a dictionary of the sizes of the formula before and after the
+        simplification and of the effect of each simplification. When the unit
+        propagation proves the formula unsatisfiable, it is returned as is.
+    '''
+    flat   = cnf if isinstance(cnf, FlatCnf) else FlatCnf.of(cnf)
+    vars_n = max(flat.vars_number, int(numpy.abs(flat.literals).max()) if len(flat.literals) else 0)
+    stats  = {
+        'simplify_clauses_before'  : flat.clauses_number,
+        'simplify_literals_before' : len(flat.literals),
+        'simplify_variables_before': flat.variables()
+    }
+
+    offsets, literals = flat.offsets, flat.literals
+    try:
+        offsets, literals, stats['simplify_tautologies'] = normalize(offsets, literals)
+        offsets, literals, stats['simplify_units']       = propagate(offsets, literals, vars_n)
+        offsets, literals, stats['simplify_duplicates']  = deduplicate(offsets, literals)
+        offsets, literals, stats['simplify_subsumed']    = subsume(offsets, literals, vars_n)
+        offsets, literals, stats['simplify_pure']        = eliminate_pure(offsets, literals, vars_n)
+        result = FlatCnf(flat.vars_number, offsets, literals)
+        stats['simplify_unsat'] = False
+    except Unsatisfiable:
+        result = flat
+        stats['simplify_unsat'] = True
+
+    stats['simplify_clauses_after']   = result.clauses_number
+    stats['simplify_literals_after']  = len(result.literals)
+    stats['simplify_variables_after'] = result.variables()
+    return (result, stats)
@@ -0,0 +1,199 @@
+'''
+This module contains the statistics sink. The sink persists each per-bound
+statistics record as soon as the analysis of that bound is over (rather than
+collecting all of them in memory until the end of the run). This way, a crash
+in the middle of a long sweep loses nothing but the bound being analyzed and
+the progress of the run can be monitored while it is running.
+
+The sink maintains the following files in `{model}/stats/`:
+
+    + 'data.csv'      : one line per record (appended and fsync'ed)
+    + 'parts/*.parquet': one parquet file per record (when parquet is enabled)
+    + 'summary.json'  : a summary of the run so far (atomically rewritten)
+
+.. note::
+    The header of 'data.csv' is the union of the columns of all the records:
+    when a record brings new columns, the file is rewritten with the extended
+    header (the previous records have no value for these columns).
+
+.. note::
+    A sink starts the statistics of the model over: the files of the previous
+    run are removed, including these of the formats that are not written 
+    anymore (so that `read` never returns the stale records of a format that
+    was used before).
+
+.. note::
+    A sink without any format writes nothing at all: it only keeps the records
+    in memory (ie. to plot the charts of `--show-stats`).
+'''
+import os
+import csv
+import json
+import time
+
+# The formats supported by the sink
+CSV     = 'csv'
+PARQUET = 'parquet'
+
+class StatsSink:
+    '''
+    Appends the statistics records of one model to disk as they are produced.
+    '''
+
+    def __init__(self, model, formats=(CSV,)):
+        '''
+        :param model: the name of the model whose statistics are persisted
+        :param formats: the formats (csv, parquet) to write the records in.
+            When it is empty, the records are only kept in memory.
+        '''
+        self.model   = model
+        self.formats = tuple(formats)
+        self.folder  = "{}/stats".format(model)
+        self.columns = []
+        self.count   = 0
+        self.bounds  = []
+        self.last    = None
+        self.records = None if self.formats else []
+        self._csv    = None
+
+        if not self.formats:
+            return
+
+        os.makedirs(self.folder, exist_ok=True)
+        if os.path.isdir(self.parts):
+            for part in os.listdir(self.parts):
+                os.remove(os.path.join(self.parts, part))
+        if PARQUET in self.formats:
+            os.makedirs(self.parts, exist_ok=True)
+
+        if CSV in self.formats:
+            self._csv = open(self.csv_file, 'w', newline='')
+        elif os.path.exists(self.csv_file):
+            os.remove(self.csv_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    @property
+    def csv_file(self):
+        ''':return: the path to the csv file holding all records'''
+        return "{}/data.csv".format(self.folder)
+
+    @property
+    def parts(self):
+        ''':return: the path to the folder holding the parquet records'''
+        return "{}/parts".format(self.folder)
+
+    @property
+    def summary(self):
+        ''':return: the path to the summary of the run'''
+        return "{}/summary.json".format(self.folder)
+
+    def append(self, record):
+        '''
+        Persists the given `record`. The record is a dictionary mapping each
+        column to a one element list (as returned by `main.analyze_one`)
+        '''
+        flat = { k: (v[0] if isinstance(v, list) else v) for k,v in record.items() }
+
+        if CSV in self.formats:
+            self._append_csv(flat)
+        if PARQUET in self.formats:
+            self._append_parquet(flat)
+        if self.records is not None:
+            self.records.append(flat)
+
+        self.count += 1
+        self.last   = flat
+        if 'bound' in flat:
+            self.bounds.append(int(flat['bound']))
+        if self.formats:
+            self._write_summary()
+
+    def _append_csv(self, flat):
+        new = [ k for k in flat if k not in self.columns ]
+        if new:
+            self.columns += new
+            self._rewrite_header()
+
+        writer = csv.writer(self._csv, delimiter=';')
+        writer.writerow([self.count] + [ flat.get(c, '') for c in self.columns ])
+        self._csv.flush()
+        os.fsync(self._csv.fileno())
+
+    def _rewrite_header(self):
+        '''
+        Rewrites the csv file with the current `columns` as header (the rows
+        written so far are padded with empty values)
+        '''
+        self._csv.close()
+        with open(self.csv_file, 'r', newline='') as f:
+            rows = list(csv.reader(f, delimiter=';'))[1:]
+
+        # written aside and renamed so that the records are never lost
+        with open(self.csv_file+'.tmp', 'w', newline='') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow([''] + self.columns)
+            for row in rows:
+                writer.writerow(row + [''] * (len(self.columns) + 1 - len(row)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.csv_file+'.tmp', self.csv_file)
+
+        self._csv = open(self.csv_file, 'a', newline='')
+
+    def _append_parquet(self, flat):
+        import pandas
+
+        name  = "{}/{:06d}.parquet".format(self.parts, self.count)
+        frame = pandas.DataFrame.from_dict({ k: [v] for k,v in flat.items() })
+        # written aside and renamed so that no partial part is ever visible
+        frame.to_parquet(name+'.tmp', engine='pyarrow', index=False)
+        os.replace(name+'.tmp', name)
+
+    def _write_summary(self):
+        summary = {
+            'model'   : self.model,
+            'records' : self.count,
+            'bounds'  : self.bounds,
+            'last'    : self.last,
+            'updated' : time.strftime('%Y-%m-%dT%H:%M:%S')
+        }
+
+        # atomic rewrite: the summary is either the old or the new one
+        with open(self.summary+'.tmp', 'w') as f:
+            json.dump(summary, f, indent=2, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.summary+'.tmp', self.summary)
+
+    def data(self):
+        '''
+        :return: a pandas DataFrame with all the records appended so far
+        '''
+        if self.records is not None:
+            import pandas
+            return pandas.DataFrame.from_records(self.records)
+        return read(self.model)
+
+    def close(self):
+        '''
+        Closes the files held open by the sink
+        '''
+        if self._csv is not None and not self._csv.closed:
+            self._csv.close()
+
+def read(model):
+    '''
+    :return: a pandas DataFrame with all the statistics records persisted by a
+        sink for the given `model`.
+    '''
+    import pandas
+
+    path = "{}/stats/data.csv".format(model)
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        return pandas.read_csv(path, sep=';', index_col=0)
+    return pandas.read_parquet("{}/stats/parts".format(model))
@@ -0,0 +1,158 @@
+'''
+This module contains the registry of the artifact stages. An artifact stage is
+one of the (optional) dump, visualization or mining steps that can be executed
+on each analyzed instance. Each stage is keyed by the name of the command line
+flag that enables it (ie. 'dump_cnf' for `--dump-cnf`).
+
+.. note::
+    The stages are loaded *lazily*: the registry only knows the dotted path of
+    the function implementing a stage. The module defining that function is
+    only imported the first time the stage actually has to run. This is what
+    keeps the heavy imports (igraph drawing, wordcloud, matplotlib, pymining,
+    concepts, ...) out of the startup time of the tool.
+
+.. note::
+    Third party packages can register extra stages through the
+    'pynusmv_community.stages' entry point group. The name of the entry point
+    is used as the flag name (a `--<name>` flag is added to the command line)
+    and the object it points to must be callable with the signature
+    `stage(model, bound, clusters, graph)`.
+'''
+import importlib
+
+from collections import OrderedDict, namedtuple
+
+# The entry point group third parties use to register their own stages
+ENTRY_POINT_GROUP = 'pynusmv_community.stages'
+
+# The arguments passed to a stage unless specified otherwise
+DEFAULT_ARGS = ('model', 'bound', 'clusters', 'graph')
+
+# flag   -> the name of the cmdline flag (dest) that enables the stage
+# target -> either a 'module:function' string or an entry point (to be loaded)
+# args   -> the names of the analysis context entries passed to the stage
+Stage = namedtuple('Stage', 'flag target args')
+
+REGISTRY = OrderedDict()
+
+# The stages that have been loaded so far (flag -> callable)
+__LOADED = {}
+
+# The flags registered through entry points (None until they are scanned)
+__PLUGINS = None
+
+def register(flag, target, args=DEFAULT_ARGS):
+    '''
+    Registers a new stage in the registry.
+
+    :param flag: the name of the flag (dest) enabling this stage
+    :param target: the 'module:function' path to the stage or an entry point
+    :param args: the names of the context entries that must be passed on to the
+        stage when it is run
+    '''
+    REGISTRY[flag] = Stage(flag, target, tuple(args))
+    __LOADED.pop(flag, None)
+
+def _entry_points():
+    '''
+    :return: the list of entry points declared in the stages group (without
+        loading any of them)
+    '''
+    try:
+        from importlib.metadata import entry_points
+        found = entry_points()
+        if hasattr(found, 'select'):
+            return list(found.select(group=ENTRY_POINT_GROUP))
+        return list(found.get(ENTRY_POINT_GROUP, []))
+    except ImportError:
+        import pkg_resources
+        return list(pkg_resources.iter_entry_points(ENTRY_POINT_GROUP))
+
+def discover():
+    '''
+    Registers all the stages declared by third parties through entry points.
+    The entry points are only listed, they are not loaded.
+
+    :return: the list of the flags that were registered by third parties
+    '''
+    global __PLUGINS
+
+    if __PLUGINS is None:
+        __PLUGINS = []
+        for entry in _entry_points():
+            flag = entry.name.replace('-', '_')
+            if flag not in REGISTRY:
+                register(flag, entry)
+                __PLUGINS.append(flag)
+
+    return list(__PLUGINS)
+
+def load(flag):
+    '''
+    Returns the function implementing the stage keyed by `flag`. The module
+    defining that function is imported the first time this function is called.
+
+    :param flag: the flag identifying the stage to load
+    :return: the function implementing the stage
+    '''
+    if flag not in __LOADED:
+        target = REGISTRY[flag].target
+
+        if isinstance(target, str):
+            module, func = target.split(':')
+            __LOADED[flag] = getattr(importlib.import_module(module), func)
+        else:
+            __LOADED[flag] = target.load()
+
+    return __LOADED[flag]
+
+def enabled(flags):
+    '''
+    :param flags: the parsed command line arguments (or any object having one
+        boolean attribute per flag)
+    :return: the list of the stages that are enabled by `flags`
+    '''
+    return [ s for s in REGISTRY.values() if getattr(flags, s.flag, False) ]
+
+def run(flags, **context):
+    '''
+    Runs all the stages that are enabled by the given `flags` (in order of
+    registration).
+
+    :param flags: the parsed command line arguments
+    :param context: the analysis context (ie. model, bound, cnf, clusters,
+        graph) from which the arguments of each stage are taken. The `flags`
+        themselves are also part of that context.
+    '''
+    context['flags'] = flags
+    for stage in enabled(flags):
+        load(stage.flag)( *[ context[arg] for arg in stage.args ] )
+
+############### BUILTIN STAGES ################################################
+
+# track the communities first (the dumps use their lineage)
+register('track_evolution',           'pynusmv_community.evolution:track', DEFAULT_ARGS+('flags',))
+
+# generate the dumps
+register('dump_cnf',                  'pynusmv_community.dump:dimacs', ('model', 'bound', 'cnf'))
+register('dump_mapping',              'pynusmv_community.dump:mapping',('model', 'bound', 'cnf'))
+register('dump_communities',          'pynusmv_community.dump:communities_curated')
+register('dump_raw_communities',      'pynusmv_community.dump:communities_raw')
+register('dump_semantic_communities', 'pynusmv_community.dump:communities_semantic')
+register('dump_json_cluster_graph',   'pynusmv_community.dump:json_cluster_graph')
+register('dump_edgelist',             'pynusmv_community.dump:edgelist')
+register('dump_metis',                'pynusmv_community.dump:metis')
+register('keep_levels',               'pynusmv_community.dump:hierarchy',('model', 'bound', 'hierarchy'))
+register('build_index',               'pynusmv_community.index:build')
+
+# generate the visualization artifacts
+register('show_vig',                  'pynusmv_community.visualization:vig', DEFAULT_ARGS+('flags',))
+register('show_cluster_graph',        'pynusmv_community.visualization:cluster_graph', DEFAULT_ARGS+('flags',))
+register('show_d3_cluster_graph',     'pynusmv_community.visualization:d3_visualisation')
+register('show_clouds',               'pynusmv_community.visualization:clouds')
+register('show_time_table',           'pynusmv_community.visualization:table_visualisation')
+register('show_formal_concepts',      'pynusmv_community.mining:mine_concept', DEFAULT_ARGS+('flags',))
+
+# mine frequent patterns and sequences
+register('mine_patterns',             'pynusmv_community.mining:dump_frequent_patterns', DEFAULT_ARGS+('flags',))
+register('mine_sequences',            'pynusmv_community.mining:dump_frequent_sequences', DEFAULT_ARGS+('flags',))
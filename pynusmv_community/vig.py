@@ -0,0 +1,669 @@
+'''
+This module contains the machinery used to build the variable incidence graph
+(VIG) of large CNF instances with a bounded memory footprint.
+
+Rather than collecting every edge of the graph as a python tuple, the clauses
+are walked in batches and the edges are written as pairs of int32 in a NumPy
+buffer. When that buffer grows over a configurable RAM cap, it is spilled to
+a memory mapped file on disk.
+'''
+import os
+import copy
+import weakref
+import tempfile
+import itertools
+
+import numpy
+
+# The number of clauses processed in one batch
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+# The size (in bytes) above which edges are spilled to disk (default: 1GB)
+DEFAULT_RAM_CAP    = 1 << 30
+
+# The max number of edges generated in one vectorized step
+PAIRS_PER_STEP     = 1 << 20
+
+class EdgeBuffer:
+    '''
+    A growable buffer of (src, dst) int32 pairs (or more generally, of rows of
+    `columns` items of some `dtype`). This buffer lives in RAM as
+    long as it fits in `ram_cap` bytes. Beyond that limit, its content is
+    moved to a memory mapped file (in `spill_dir`) which is removed when the
+    buffer is closed (or garbage collected).
+    '''
+
+    def __init__(self, capacity=1024, ram_cap=DEFAULT_RAM_CAP, spill_dir=None, 
+                 columns=2, dtype=numpy.int32):
+        '''
+        :param capacity: the initial number of edges the buffer can hold
+        :param ram_cap: the maximum number of bytes held in RAM
+        :param spill_dir: the directory where to create the memory mapped file
+            (defaults to the system temp dir)
+        :param columns: the number of items stored per edge
+        :param dtype: the type of the items stored in the buffer
+        '''
+        self.ram_cap   = ram_cap
+        self.spill_dir = spill_dir
+        self.spill     = None
+        self.cleanup   = None
+        self.size      = 0
+        self.columns   = columns
+        self.dtype     = numpy.dtype(dtype)
+        self.data      = numpy.empty((max(1, capacity), columns), dtype=self.dtype)
+
+    def __len__(self):
+        return self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    @property
+    def spilled(self):
+        '''
+        :return: True iff the content of the buffer has been spilled to disk
+        '''
+        return self.spill is not None
+
+    def _grow(self, needed):
+        '''
+        Makes sure that the buffer can hold (at least) `needed` edges.
+        '''
+        capacity = len(self.data)
+        if needed <= capacity:
+            return
+
+        while capacity < needed:
+            capacity *= 2
+        nbytes = capacity * self.columns * self.dtype.itemsize
+
+        if self.spill is None and nbytes <= self.ram_cap:
+            grown = numpy.empty((capacity, self.columns), dtype=self.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+            return
+
+        if self.spill is None:
+            fd, self.spill = tempfile.mkstemp(suffix='.edges', dir=self.spill_dir)
+            os.close(fd)
+            self.cleanup   = weakref.finalize(self, os.remove, self.spill)
+            previous = self.data[:self.size]
+        else:
+            # the content is already on disk: extending the file is enough
+            self.data.flush()
+            previous = None
+            del self.data
+
+        with open(self.spill, 'r+b') as f:
+            f.truncate(nbytes)
+
+        self.data = numpy.memmap(self.spill, dtype=self.dtype, mode='r+',
+                                 shape=(capacity, self.columns))
+        if previous is not None:
+            self.data[:self.size] = previous
+
+    def append(self, pairs):
+        '''
+        Appends the given (k, 2) array of pairs at the end of the buffer.
+        '''
+        count = len(pairs)
+        self._grow(self.size + count)
+        self.data[self.size:self.size+count] = numpy.reshape(pairs, (count, self.columns))
+        self.size += count
+
+    def view(self):
+        '''
+        :return: a (read only) view on the edges that have been added to the
+            buffer
+        '''
+        edges = self.data[:self.size]
+        if self.columns == 1:
+            edges = edges[:, 0]
+        edges.flags.writeable = False
+        return edges
+
+    def chunks(self, size=DEFAULT_CHUNK_SIZE):
+        '''
+        Iterates over the content of the buffer by slices of `size` edges
+        '''
+        for start in range(0, self.size, size):
+            yield self.data[start:min(start+size, self.size)]
+
+    def copy(self):
+        '''
+        :return: an independent copy of this buffer (with the same RAM cap)
+        '''
+        other = EdgeBuffer(max(1, self.size), self.ram_cap, self.spill_dir, self.columns, self.dtype)
+        for chunk in self.chunks():
+            other.append(chunk)
+        return other
+
+    def close(self):
+        '''
+        Releases the resources (the spill file) held by this buffer
+        '''
+        if self.spill is not None:
+            del self.data
+            self.cleanup()
+            self.spill   = None
+            self.cleanup = None
+        self.data = numpy.empty((1, self.columns), dtype=self.dtype)
+        self.size = 0
+
+############### LONG CLAUSES EXPANSION ########################################
+
+# Expand a clause as a clique (one edge per pair of variables)
+CLIQUE   = 'clique'
+# Connect all variables of a clause to one virtual vertex standing for it
+STAR     = 'star'
+# Sample (a few) random pairs of variables and reweight the resulting edges
+SAMPLE   = 'sample'
+# Simply ignore the clause
+SKIP     = 'skip'
+
+STRATEGIES = (CLIQUE, STAR, SAMPLE, SKIP)
+
+# The average number of sampled edges per variable of a 'sampled' clause
+DEFAULT_SAMPLE_DEGREE = 8
+
+def parse_policy(text):
+    '''
+    Parses an expansion policy. A policy is a comma separated list of 
+    `threshold:strategy` items meaning that the clauses having (at least) 
+    `threshold` literals are expanded with the given `strategy` (the strategy 
+    with the highest matching threshold applies). A strategy without 
+    threshold applies to all clauses. Ex: 'clique,64:sample,4096:skip'
+    
+    :param text: the textual description of the policy
+    :return: a list of (threshold, strategy) sorted by increasing threshold
+    '''
+    policy = { 0: CLIQUE }
+    for item in filter(None, (text or '').split(',')):
+        threshold, _, strategy = item.strip().rpartition(':')
+        if strategy not in STRATEGIES:
+            raise ValueError("Unknown expansion strategy '{}' (expected one of {})"
+                             .format(strategy, ', '.join(STRATEGIES)))
+        policy[int(threshold or 0)] = strategy
+    return sorted(policy.items())
+
+def batches(iterable, size=DEFAULT_CHUNK_SIZE):
+    '''
+    Splits `iterable` in lists of (at most) `size` items
+    '''
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+class EdgeBuilder:
+    '''
+    Builds the edges of the VIG of some CNF formula. In this graph, there is one
+    vertex per VARIABLE (no distinction is made between the two possible
+    literals of a variable) and there is an edge between two variables iff
+    their literals belong to one same clause.
+
+    The vertices are numbered in the order of their first appearance in the
+    clauses (this is the numbering that used to be implemented in
+    `core.mk_graph`).
+    '''
+
+    def __init__(self, vars_number=0, ram_cap=DEFAULT_RAM_CAP, spill_dir=None,
+                 policy=None, sample_degree=DEFAULT_SAMPLE_DEGREE, seed=None):
+        '''
+        :param vars_number: the (expected) number of variables in the CNF
+        :param ram_cap: the max number of bytes used to store edges in RAM
+        :param spill_dir: where to spill the edges that do not fit in RAM
+        :param policy: the expansion policy (see `parse_policy`) telling how
+            clauses are to be expanded depending on their length. (by default,
+            all clauses are expanded as cliques)
+        :param sample_degree: the average number of edges sampled per variable 
+            of the clauses expanded with the 'sample' strategy
+        :param seed: the seed of the random generator used for sampling
+        '''
+        # variable -> vertex (-1 when the variable has no vertex yet)
+        self.canonical = numpy.full(vars_number+1, -1, dtype=numpy.int32)
+        # vertex   -> variable (0 for the virtual clause vertices)
+        self.literals  = numpy.empty(max(1, vars_number), dtype=numpy.int32)
+        self.counter   = 0
+        self.edges     = EdgeBuffer(ram_cap=ram_cap, spill_dir=spill_dir)
+        # only allocated when some edge gets a weight other than 1
+        self.weights   = None
+        
+        self.policy    = parse_policy(policy) if isinstance(policy, str) or policy is None else policy
+        self.degree    = sample_degree
+        self.random    = numpy.random.default_rng(seed)
+        # how many clauses were handled with each strategy
+        self.expansion = dict.fromkeys(STRATEGIES, 0)
+
+    def copy(self):
+        '''
+        :return: an independent copy of this builder. This permits to build
+            the graphs of several formulas sharing a common part (ie. the
+            unrolled model) without expanding the clauses of that part again.
+        '''
+        other = EdgeBuilder(0, self.edges.ram_cap, self.edges.spill_dir, self.policy, self.degree)
+        other.edges.close()
+        
+        other.canonical = self.canonical.copy()
+        other.literals  = self.literals.copy()
+        other.counter   = self.counter
+        other.edges     = self.edges.copy()
+        other.weights   = None if self.weights is None else self.weights.copy()
+        other.random    = copy.deepcopy(self.random)
+        other.expansion = dict(self.expansion)
+        return other
+
+    def strategy(self, length):
+        '''
+        :return: the strategy to use to expand a clause of `length` literals
+        '''
+        chosen = CLIQUE
+        for threshold, strategy in self.policy:
+            if length >= threshold:
+                chosen = strategy
+        return chosen
+
+    def _append(self, pairs, weight=1.0):
+        '''
+        Appends the given `pairs` to the edges of the graph, all of them having
+        the given `weight` (scalar or array).
+        '''
+        pairs = pairs.reshape(-1, 2)
+        if self.weights is None and numpy.any(numpy.asarray(weight) != 1.0):
+            self.weights = EdgeBuffer(len(self.edges.data), self.edges.ram_cap, 
+                                      self.edges.spill_dir, 1, numpy.float32)
+            self.weights.append(numpy.ones(len(self.edges), dtype=numpy.float32))
+        
+        self.edges.append(pairs)
+        if self.weights is not None:
+            self.weights.append(numpy.broadcast_to(numpy.asarray(weight, dtype=numpy.float32), (len(pairs),)))
+
+    def _virtual(self, count):
+        '''
+        Creates `count` virtual vertices (standing for clauses) and returns 
+        their identifiers.
+        '''
+        start, stop = self.counter, self.counter + count
+        if stop > len(self.literals):
+            grown = numpy.empty(max(stop, 2*len(self.literals)), dtype=numpy.int32)
+            grown[:start] = self.literals[:start]
+            self.literals = grown
+        
+        self.literals[start:stop] = 0
+        self.counter              = stop
+        return numpy.arange(start, stop, dtype=numpy.int32)
+
+    def _vertices(self, variables):
+        '''
+        Assigns a vertex to each of the `variables` which has none yet (in order
+        of first appearance) and returns the vertices of all `variables`.
+        '''
+        if len(variables) == 0:
+            return variables
+
+        highest = int(variables.max())
+        if highest >= len(self.canonical):
+            grown = numpy.full(max(highest+1, 2*len(self.canonical)), -1, dtype=numpy.int32)
+            grown[:len(self.canonical)] = self.canonical
+            self.canonical = grown
+
+        fresh = variables[self.canonical[variables] < 0]
+        if len(fresh):
+            uniq, first = numpy.unique(fresh, return_index=True)
+            fresh       = uniq[numpy.argsort(first, kind='stable')]
+            start, stop = self.counter, self.counter + len(fresh)
+
+            if stop > len(self.literals):
+                grown = numpy.empty(max(stop, 2*len(self.literals)), dtype=numpy.int32)
+                grown[:start] = self.literals[:start]
+                self.literals = grown
+
+            self.canonical[fresh]          = numpy.arange(start, stop, dtype=numpy.int32)
+            self.literals[start:stop]      = fresh
+            self.counter                   = stop
+
+        return self.canonical[variables]
+
+    def add_clauses(self, clauses):
+        '''
+        Adds the edges implied by one batch of `clauses` to the graph.
+        '''
+        # variables of all the clauses that imply at least one edge
+        kept     = [ c for c in clauses if len(c) >= 2 ]
+        if not kept:
+            return
+
+        lengths  = numpy.fromiter((len(c) for c in kept), dtype=numpy.int64, count=len(kept))
+        flat     = numpy.abs(numpy.fromiter(itertools.chain.from_iterable(kept),
+                                            dtype=numpy.int64, count=int(lengths.sum())))
+        vertices = self._vertices(flat)
+        offsets  = numpy.concatenate(([0], numpy.cumsum(lengths)[:-1]))
+
+        # one vectorized pass per clause length
+        for k in numpy.unique(lengths):
+            starts   = offsets[lengths == k]
+            strategy = self.strategy(k)
+            self.expansion[strategy] += len(starts)
+            
+            if strategy == CLIQUE:
+                self._clique(vertices, starts, k)
+            elif strategy == STAR:
+                self._star(vertices, starts, k)
+            elif strategy == SAMPLE:
+                self._sample(vertices, starts, k)
+    
+    def _clique(self, vertices, starts, k):
+        '''
+        Adds one edge per pair of variables for each of the clauses of length
+        `k` starting at the given `starts` offsets in `vertices`.
+        '''
+        src, dst = numpy.triu_indices(k, 1)
+        step     = max(1, PAIRS_PER_STEP // len(src))
+        
+        for i in range(0, len(starts), step):
+            matrix = vertices[starts[i:i+step, None] + numpy.arange(k)]
+            pairs  = numpy.empty((len(matrix), len(src), 2), dtype=numpy.int32)
+            pairs[:, :, 0] = matrix[:, src]
+            pairs[:, :, 1] = matrix[:, dst]
+            self._append(pairs)
+    
+    def _star(self, vertices, starts, k):
+        '''
+        Connects each of the variables of the clauses of length `k` to a new 
+        virtual vertex standing for the clause. Each of the k edges weighs
+        (k-1)/2 so that the total weight of the clause is the same as that of
+        its clique expansion.
+        '''
+        step = max(1, PAIRS_PER_STEP // k)
+        
+        for i in range(0, len(starts), step):
+            matrix = vertices[starts[i:i+step, None] + numpy.arange(k)]
+            pairs  = numpy.empty((len(matrix), k, 2), dtype=numpy.int32)
+            pairs[:, :, 0] = self._virtual(len(matrix))[:, None]
+            pairs[:, :, 1] = matrix
+            self._append(pairs, (k - 1) / 2)
+    
+    def _sample(self, vertices, starts, k):
+        '''
+        Samples `sample_degree * k` random pairs of variables (at most) in each
+        of the clauses of length `k`. Each of the sampled edges is reweighted so
+        that the total weight of the clause is the same as that of its clique 
+        expansion.
+        '''
+        total    = k * (k - 1) // 2
+        samples  = min(total, self.degree * k)
+        step     = max(1, PAIRS_PER_STEP // samples)
+        
+        for i in range(0, len(starts), step):
+            chunk  = starts[i:i+step]
+            src    = self.random.integers(0, k,   size=(len(chunk), samples))
+            dst    = self.random.integers(0, k-1, size=(len(chunk), samples))
+            # shifting makes sure that src != dst
+            dst   += (dst >= src)
+            pairs  = numpy.empty((len(chunk), samples, 2), dtype=numpy.int32)
+            pairs[:, :, 0] = vertices[chunk[:, None] + src]
+            pairs[:, :, 1] = vertices[chunk[:, None] + dst]
+            self._append(pairs, total / samples)
+
+    def add_all(self, clauses, chunk_size=DEFAULT_CHUNK_SIZE):
+        '''
+        Adds the edges implied by all the `clauses` walking them by batches
+        of `chunk_size` clauses.
+        '''
+        for batch in batches(clauses, chunk_size):
+            self.add_clauses(batch)
+
+    @property
+    def vertex_literals(self):
+        '''
+        :return: an int32 array mapping each vertex to its variable
+        '''
+        return self.literals[:self.counter]
+
+    def to_graph(self):
+        '''
+        Builds the igraph graph from the edges that have been collected so far.
+        The graph is built in one go, straight from the (read only) view on the
+        edge buffer: no python list of the edges ever needs to exist.
+        
+        .. note::
+            The edges must not be added by chunks: each `add_edges` call 
+            re-indexes all the edges of the graph.
+        '''
+        import igraph
+
+        return igraph.Graph(n=self.counter, edges=self.edges.view())
+
+    def to_vig(self):
+        '''
+        Builds the igraph graph and wraps it together with its metadata in a
+        `VIG`. The ownership of the edge buffer is transferred to the `VIG`.
+        '''
+        weight = None if self.weights is None else self.weights.view().copy()
+        graph  = VIG(self.to_graph(), 
+                     literals = self.vertex_literals.copy(), 
+                     edges    = self.edges,
+                     weight   = weight)
+        graph.expansion = dict(self.expansion)
+        
+        self.edges = EdgeBuffer(ram_cap=self.edges.ram_cap, spill_dir=self.edges.spill_dir)
+        return graph
+
+    def close(self):
+        '''
+        Releases the resources held by the edge buffer.
+        '''
+        self.edges.close()
+        if self.weights is not None:
+            self.weights.close()
+
+# The time frame associated with the vertices having no semantic information
+NO_TIME = numpy.iinfo(numpy.int32).min
+
+class VIG:
+    '''
+    The variable incidence graph of a CNF formula. This is a thin wrapper 
+    around an igraph graph which keeps the vertex and edge metadata in typed 
+    NumPy arrays (rather than in python lists of igraph attributes):
+    
+        + `lit`       : the CNF variable associated with each vertex (int32)
+        + `community` : the (1-based) community of each vertex (int32)
+        + `size`      : the size of the community of each vertex (int32)
+        + `time_frame`: the time step of the variable of each vertex (int32)
+        + `weight`    : the weight of each edge (float32, None if unweighted)
+        + `lineage`   : the lineage of each community (see `evolution`)
+    
+    The semantic information of the vertices (`time_frame`, `semantics`) is 
+    looked up in NuSMV lazily. When several graphs share most of their
+    variables, the same dictionary can be given to all of them as their 
+    `semantic_table` so that each variable is looked up only once.
+    
+    .. note::
+        The virtual vertices standing for the clauses expanded with the 'star'
+        strategy are associated with the literal 0 (see `virtual`). They take 
+        part in the clustering but not in its outputs (see `RealClustering`).
+    
+    .. note::
+        Any attribute that is not defined by the wrapper is looked up on the
+        wrapped igraph graph. Hence, a `VIG` can be used wherever an igraph
+        graph is expected (ie. `graph.vs`, `graph.community_multilevel()`, ...)
+    '''
+    
+    def __init__(self, graph, literals=None, edges=None, weight=None):
+        '''
+        :param graph: the wrapped igraph graph
+        :param literals: the int32 array of the variables of all vertices
+        :param edges: the `EdgeBuffer` (or (m, 2) int32 array) of the edges
+        :param weight: the array of the weights of the edges
+        '''
+        self.graph     = graph
+        self.lit       = numpy.zeros(graph.vcount(), dtype=numpy.int32) if literals is None else literals
+        self.buffer    = edges
+        self.weight    = None if weight is None else numpy.asarray(weight, dtype=numpy.float32)
+        self.community = None
+        self.size      = None
+        self.lineage   = None
+        self.expansion = None
+        self.semantic_table = None
+        self._time     = None
+        self._reprs    = None
+    
+    def __getattr__(self, name):
+        # only called when the attribute is not found on the wrapper itself
+        if name == 'graph':
+            raise AttributeError(name)
+        return getattr(self.graph, name)
+    
+    def __len__(self):
+        return self.graph.vcount()
+    
+    @property
+    def edges(self):
+        '''
+        :return: a (m, 2) int32 array with the endpoints of all the edges
+        '''
+        if self.buffer is None:
+            self.buffer = numpy.array(self.graph.get_edgelist(), dtype=numpy.int32).reshape(-1, 2)
+        if isinstance(self.buffer, EdgeBuffer):
+            return self.buffer.view()
+        return self.buffer
+    
+    @property
+    def virtual(self):
+        '''
+        :return: the boolean mask of the virtual vertices (the star centres)
+        '''
+        return self.lit == 0
+    
+    @property
+    def weights(self):
+        '''
+        :return: the weights to use when clustering this graph (None when the
+            graph is not weighted)
+        '''
+        return None if self.weight is None else self.weight.tolist()
+    
+    def _lookup_semantics(self):
+        '''
+        Looks up (once) the semantic information of all the vertices in NuSMV
+        '''
+        from pynusmv_community import core
+        
+        table = {} if self.semantic_table is None else self.semantic_table
+        times = numpy.full(len(self.lit), NO_TIME, dtype=numpy.int32)
+        reprs = []
+        for vertex, literal in enumerate(self.lit.tolist()):
+            if literal not in table:
+                variable = core.cnf_to_be_var(literal) if literal else None
+                time     = NO_TIME if variable is None else variable.time
+                table[literal] = (time, core.short_var_repr(variable))
+            times[vertex] = table[literal][0]
+            reprs.append(table[literal][1])
+        
+        self._time  = times
+        self._reprs = reprs
+    
+    @property
+    def time_frame(self):
+        '''
+        :return: an int32 array with the time step of the variable associated 
+            with each vertex (`NO_TIME` for the vertices without semantic 
+            information). This is computed lazily (once) since it requires 
+            one NuSMV lookup per vertex.
+        '''
+        if self._time is None:
+            self._lookup_semantics()
+        return self._time
+    
+    @property
+    def semantics(self):
+        '''
+        :return: the list of the short representation (see 
+            `core.short_var_repr`) of the variable of each vertex. Just like 
+            `time_frame`, this is computed lazily (once).
+        '''
+        if self._reprs is None:
+            self._lookup_semantics()
+        return self._reprs
+    
+    def inherit_semantics(self, parent, vertices):
+        '''
+        Copies the semantic information of the given `vertices` of the `parent`
+        graph (which become the vertices 0, 1, ... of this graph) so that no
+        NuSMV lookup is performed again.
+        '''
+        self._time  = parent.time_frame[vertices]
+        self._reprs = [ parent.semantics[v] for v in vertices.tolist() ]
+    
+    def set_membership(self, clusters):
+        '''
+        Records the `community` and community `size` of each vertex according
+        to the given `clusters` (an igraph `VertexClustering`).
+        '''
+        membership     = numpy.asarray(clusters.membership, dtype=numpy.int32)
+        # the virtual vertices are not counted in the size of their community
+        sizes          = numpy.bincount(membership[~self.virtual], minlength=len(clusters))
+        self.community = membership + 1
+        self.size      = sizes.astype(numpy.int32)[membership]
+    
+    def close(self):
+        '''
+        Releases the resources (ie. spilled edges) held by this graph
+        '''
+        if isinstance(self.buffer, EdgeBuffer):
+            self.buffer.close()
+        self.buffer = None
+
+class RealClustering:
+    '''
+    The clustering of a `VIG` having virtual vertices, seen without them: the
+    communities only list (and count) the real vertices. The virtual vertices
+    keep their community in the `membership` (which covers all the vertices of
+    the graph) so that the edges they carry can still be aggregated.
+    
+    .. note::
+        Any attribute that is not defined by the wrapper (`membership`, 
+        `modularity`, `graph`, ...) is looked up on the wrapped igraph 
+        `VertexClustering`.
+    '''
+    
+    def __init__(self, clustering, virtual):
+        '''
+        :param clustering: the wrapped igraph `VertexClustering`
+        :param virtual: the boolean mask of the virtual vertices of the graph
+        '''
+        self.clustering = clustering
+        self.virtual    = virtual
+    
+    def __getattr__(self, name):
+        # only called when the attribute is not found on the wrapper itself
+        if name == 'clustering':
+            raise AttributeError(name)
+        return getattr(self.clustering, name)
+    
+    def __len__(self):
+        return len(self.clustering)
+    
+    def __iter__(self):
+        membership = numpy.asarray(self.clustering.membership)
+        real       = numpy.flatnonzero(~self.virtual)
+        real       = real[numpy.argsort(membership[real], kind='stable')]
+        bounds     = numpy.searchsorted(membership[real], numpy.arange(len(self)+1))
+        for i in range(len(self)):
+            yield real[bounds[i]:bounds[i+1]].tolist()
+    
+    def __getitem__(self, index):
+        if index < 0 or index >= len(self):
+            raise IndexError("cluster index out of range")
+        membership = numpy.asarray(self.clustering.membership)
+        return numpy.flatnonzero((membership == index) & ~self.virtual).tolist()
+    
+    def sizes(self):
+        ''':return: the number of real vertices of each community'''
+        membership = numpy.asarray(self.clustering.membership)
+        return numpy.bincount(membership[~self.virtual], minlength=len(self)).tolist()
@@ -5,92 +5,118 @@ core to do the heavy lifting.
 '''
 
 import os
-import shutil 
+import json
 import math
 import random
-import igraph
 
-import pandas as pd
-
-from os.path                import abspath, join 
-from wordcloud              import WordCloud 
-from pynusmv_community      import core, mining, dump
-from igraph.drawing.colors  import known_colors#, color_to_html_format
+from pynusmv_community      import core, dump
 #from scipy.sparse.linalg.isolve.iterative import cg
 
-colors = list(known_colors.values())
-random.shuffle(colors)
+# The (shuffled) color table, only computed when something is actually drawn
+__COLORS = None
+
+def palette():
+    '''
+    :return: the (randomly shuffled) table of colors used to draw the graphs.
+        The table is only built the first time it is needed.
+    '''
+    global __COLORS
+    
+    if __COLORS is None:
+        from igraph.drawing.colors import known_colors#, color_to_html_format
+        __COLORS = list(known_colors.values())
+        random.shuffle(__COLORS)
+    
+    return __COLORS
 
         
-def vig(model, bound, clusters, graph):
+def image_target(folder, bound, flags, default):
     '''
-    Saves an image representing the VIG of the sat problem.
+    :return: a tuple (path, size) giving the path (and extension) of the image
+        of `bound` in `folder` and its width in pixels (the `render_format`
+        and `render_size` flags override the defaults of the picture)
     '''
-    os.makedirs("{}/vig/".format(model), exist_ok=True)
+    fmt, size = default
+    fmt       = getattr(flags, 'render_format', None) or fmt
+    size      = getattr(flags, 'render_size',   None) or size
+    return ("{}/{:03d}.{}".format(folder, bound, fmt), size)
+
+def vig(model, bound, clusters, graph, flags=None):
+    '''
+    Saves an image representing the VIG of the sat problem. The layout and
+    colors are computed here, the image itself is drawn in the background (see
+    `render`).
+    '''
+    import numpy
+    from pynusmv_community import render
+    
+    name  = "vig {:03d}".format(bound)
+    if not render.admit(name, len(graph.edges), flags):
+        return
+    
+    edges = numpy.array(graph.edges, dtype=numpy.int32).reshape(-1, 2)
+    
+    target, size = image_target("{}/vig".format(model), bound, flags, ('png', 2400))
     
-    igraph.plot(clusters, 
-                layout  = graph.layout("large_graph"),
-                bbox    = (0, 0, 2400, 2400),
-                target  = "{}/vig/{:03d}.png".format(model, bound))
+    colors = palette()
+    member = clusters.membership
+    color  = lambda c: colors[c % len(colors)]
+    style  = {
+        'vertex_color': [ color(c) for c in member ],
+        # the edges of a community have its color, the others are grey
+        'edge_color'  : [ color(member[s]) if member[s] == member[d] else 'grey' for s, d in edges.tolist() ]
+    }
+    
+    layout = numpy.array(graph.layout("large_graph").coords).reshape(-1, 2)
+    render.submit(render.Job(name, target, size, len(member), edges, layout, style), flags)
 
 
-def cluster_graph(model, bound, clusters, graph):
+def cluster_graph(model, bound, clusters, graph, flags=None):
     '''
     Saves an image representing the structure of the sat problem derived from
-    `model` unrolled `bound` times and classified in `clusters`
+    `model` unrolled `bound` times and classified in `clusters`. The layout and
+    style are computed here, the image itself is drawn in the background (see
+    `render`).
     '''
-    os.makedirs("{}/structure/".format(model), exist_ok=True)
+    import numpy
+    from pynusmv_community import render
     
-    # set cluster size and id on all vs
-    counter = 0
-    for cluster in clusters:
-        counter += 1
-        size     = len(cluster)
-        for vertex in cluster:
-            graph.vs[vertex]['size'] = size
-            graph.vs[vertex]['community'] = counter;
-    # set equal weight for all connections so that it becomes visible in
-    # the output diagram
-    graph.es['weight'] = [ 1 for _ in graph.es]
-    
-    cg = clusters.cluster_graph(combine_vertices={'size': 'first', 'community': 'first'},
-                                combine_edges={'weight': 'sum'})
-    
-    smallest_v   = min(cg.vs['size'])
+    cg   = core.cluster_graph(clusters, graph)
+    name = "cluster graph {:03d}".format(bound)
+    if not render.admit(name, len(cg.edges), flags):
+        return
+    
+    target, size = image_target("{}/structure".format(model), bound, flags, ('svg', 3200))
+    
+    colors       = palette()
+    smallest_v   = cg.size.min()
     normalize_v  = lambda x: x / smallest_v
     
     visual_style = {
-        'vertex_size' : [ int(round(normalize_v(x))) for x in cg.vs['size'] ],
-        'vertex_color': [ colors[v.index % len(colors)] for v in cg.vs ],
+        'vertex_size' : [ int(round(normalize_v(x))) for x in cg.size ],
+        'vertex_color': [ colors[v % len(colors)] for v in range(len(cg.size)) ],
+        'vertex_shape': 'circle',
         
-        'edge_width'  : [ int(1+round(math.log(x))) for x in cg.es['weight'] ],
-        'edge_color'  : [ colors[e.source % len(colors)] for e in cg.es ],
-        #'edge_curved' : True,
-        'auto_curve' : True,
+        'edge_width'  : [ int(1+round(math.log(x))) for x in cg.weight ],
+        'edge_color'  : [ colors[s % len(colors)] for s in cg.edges[:, 0].tolist() ],
+        # curving the edges is quadratic in the number of edges
+        'autocurve'   : len(cg.edges) <= render.AUTOCURVE_MAX_EDGES,
         
-        'target'      : "{}/structure/{:03d}.svg".format(model, bound),
-        'layout'      : cg.layout("fr"),#cg.layout("rt_circular"),
-        'bbox'        : (0, 0, 3200, 3200),
-        'margin'      : 250,
-        #'background'  : (0,0,0,0)
-        
-        'vertex_label': [ 'commu-{:03d}'.format(c) for c in cg.vs['community'] ],
-        'shape'       : 'circle'
+        'margin'      : int(size * 250 / 3200),
+        'vertex_label': [ 'commu-{:03d}'.format(c) for c in cg.community ]
     }
     
-    #cg.write_svg(
-    #    fname  = "{}/structure/{:03d}.svg".format(model, bound),
-    #    labels = 'community',
-    #    #**visual_style
-    # )
-        
-    igraph.plot(cg, **visual_style)
+    layout = numpy.array(cg.layout("fr").coords).reshape(-1, 2)
+    edges  = numpy.asarray(cg.edges, dtype=numpy.int32).reshape(-1, 2)
+    render.submit(render.Job(name, target, size, len(cg.size), edges, layout, visual_style), flags)
 
 def clouds(model, bound, clusters, graph):
     '''
     Saves the wordclouds for the communities stored in the `clusters` of the 
     `graph` derived from `bound` unrolling of the time for `model`
     '''
+    from wordcloud import WordCloud 
+    
     os.makedirs("{}/clouds/{:03d}".format(model, bound), exist_ok=True)
     s_cluster = [ [core.vertex_repr(graph, v) for v in c ] for c in clusters ]
     
@@ -103,12 +129,22 @@ def clouds(model, bound, clusters, graph):
         cloud= WordCloud(stopwords={},regexp=r'\w[\.\[\]\{\}\w]+').generate(text)
         cloud.to_file("{}/clouds/{:03d}/{:03d}.png".format(model, bound, counter))
 
-def statistics(model, data):
+def statistics(model, data=None):
     '''
     Aggregates and produces machine processable statistics from the `frames` 
     obtained from `model`.
+    
+    :param data: the statistics to plot. When it is omitted, the statistics 
+        that have been persisted so far by the stats sink are plotted (this 
+        permits to refresh the plots while the analysis is running).
     '''
+    import matplotlib.pyplot as plt
+    from pynusmv_community import sink
+    
     os.makedirs("{}/stats/".format(model), exist_ok=True)
+    
+    if data is None:
+        data = sink.read(model)
 
     chart   = lambda z: data[['bound', z]].plot(x='bound', y=z, kind="scatter")
     commu   = chart('#communities').get_figure()
@@ -117,49 +153,39 @@ def statistics(model, data):
     commu.savefig('{}/stats/comunities.png'.format(model))
     modul.savefig('{}/stats/modularity.png'.format(model))
     
+    plt.close(commu)
+    plt.close(modul)
+    
 def d3_visualisation(model, bound, clusters, graph):
     '''
     Generates a d3 graph based visualisation of the problem.
     This mainly helps in visualizing the cluster graph (rather than the VIG).
     
+    Only the data is generated (cluster graph and frequent sequences), the 
+    viewer itself is served by `commu serve`.
+    
     .. note::
         This feature is *experimental* and I found it not very helpful to 
         understand the meaning of the communities.
     '''
-    target_dir = "{}/d3_graph_vis/{:03d}".format(model, bound)
-    source_dir = abspath(join(__file__, '../data/graph_vis'))
-    
-    shutil.rmtree(target_dir, ignore_errors=True)
-    shutil.copytree(source_dir, target_dir)
-    os.makedirs(join(target_dir, './data/'), exist_ok=True)
+    from pynusmv_community import mining
     
     mining.dump_frequent_sequences(model, bound, clusters, graph)
     dump.json_cluster_graph(model, bound, clusters, graph)
     
-    shutil.copy("{}/mining/{:03d}/sequences.csv".format(model, bound), 
-                "{}/d3_graph_vis/{:03d}/data/sequences.csv".format(model, bound))
-    
-    shutil.copy("{}/json/{:03d}/cluster_graph.json".format(model, bound), 
-                "{}/d3_graph_vis/{:03d}/data/cluster_graph.json".format(model, bound))
-    
 
-def table_visualisation(model, bound, clusters, graph):
-    '''
-    Generates a d3 table based visualisation of the problem.
-    This helps in plotting what is part of each community and get a sense of
-    the temporal (and semantic) information hidden in the various communities. 
+def time_table(model, bound, clusters, graph):
     '''
-    ########### PREPPING THE OUTPUT ##########################################
-    target_dir = "{}/table_vis/{:03d}".format(model, bound)
-    source_dir = abspath(join(__file__, '../data/table_vis'))
+    Computes (in memory) the data of the d3 table based visualisation of the 
+    problem: that is, for each semantic variable, the communities it belongs 
+    to at each time frame.
     
-    shutil.rmtree(target_dir, ignore_errors=True)
-    shutil.copytree(source_dir, target_dir)
-    os.makedirs(join(target_dir, './data/'), exist_ok=True)
+    :return: a tuple (header, rows) where header is a dictionary describing the
+        table (model, bound, frames, communities and lineage) and each row is a
+        list [variable, [sorted communities at each frame]]
+    '''
+    import pandas as pd
     
-    ########### ACTUALLY START GENERATING THE DATA ###########################
-    ## Note: this could be moved to dump module
-    ####
     semantic_vars = core.semantic_vars(graph)
     time_frames   = range(-1, bound+1)
     
@@ -184,22 +210,36 @@ def table_visualisation(model, bound, clusters, graph):
                 
                 dataframe.loc[var_name][var_block].add(counter)
     
+    header = {
+        "model"      : model,
+        "bound"      : bound,
+        "frames"     : list(time_frames),
+        "communities": list( range(1, len(clusters)+1) ),
+        "lineage"    : None if graph.lineage is None else graph.lineage.tolist()
+    }
+    rows   = [ [v, [ sorted(dataframe.loc[v][t]) for t in time_frames ]] for v in semantic_vars ]
+    return (header, rows)
+
+def table_visualisation(model, bound, clusters, graph):
+    '''
+    Generates a d3 table based visualisation of the problem.
+    This helps in plotting what is part of each community and get a sense of
+    the temporal (and semantic) information hidden in the various communities. 
     
-    with open(join(target_dir, './data/test.json'), "w") as f:
-        print('''
-            {{
-            "model" : "{}",
-            "bound" : {},
-            "communities": {},
-            "data": {} 
-            }}
-            '''.format(
-                model, 
-                bound, 
-                list( range(1, len(clusters)+1) ), 
-                dataframe.to_json(orient='index')
-            ),   
-            file=f
-        )
-        
-    return dataframe
\ No newline at end of file
+    Only the data is generated (`{model}/table_vis/{bound}.jsonl`), the viewer
+    itself is served by `commu serve` which streams that table page by page.
+    The first line of the file holds the header of the table and each of the
+    following lines holds the communities of one variable at each time frame
+    (see `time_table`).
+    '''
+    os.makedirs("{}/table_vis".format(model), exist_ok=True)
+    
+    header, rows = time_table(model, bound, clusters, graph)
+    
+    # written aside and renamed so that the server never reads a partial table
+    target = "{}/table_vis/{:03d}.jsonl".format(model, bound)
+    with open(target+'.tmp', "w") as f:
+        print(json.dumps(header), file=f)
+        for row in rows:
+            print(json.dumps(row), file=f)
+    os.replace(target+'.tmp', target)
@@ -8,6 +8,8 @@ structure of bounded model checking instances.
     + `pynusmv` to process NuSMV models and generate the BMC instances
     + `python-igraph` to produce and analyze graphs (ie. compute q-score)
     + `pycairo` to be able to render the graphs and save them to file (provided through cairocffi)
+    + `numpy` to store the (huge) graphs compactly while they are built
+    + `scipy` to compute the (sparse) overlaps of the communities across bounds
     + `pandas` to analyze the statistics gathered
     + `mathplotlib` to plot nice charts of the wordclouds and statistics
     + `wordcloud` to generate the wordcoulds that are used to analyze the communities
@@ -20,6 +22,8 @@ from setuptools import setup, find_packages
 REQUIREMENTS = [
     'pynusmv',
     'python-igraph',
+    'numpy',
+    'scipy',
     'cairocffi',#'pycairo', -- see https://stackoverflow.com/questions/12072093/python-igraph-plotting-not-available
     'pandas',
     'matplotlib',
@@ -0,0 +1,164 @@
+'''
+Tests of the simplification of the CNF (see `pynusmv_community.simplify`).
+The fixtures are small enough for their satisfiability to be decided by brute
+force, which permits to check that each pass preserves it.
+'''
+import itertools
+import random
+import types
+import unittest
+
+import numpy
+
+from pynusmv_community import simplify
+
+def flat(clauses, vars_number=None):
+    ''':return: the `FlatCnf` of the given list of `clauses`'''
+    if vars_number is None:
+        vars_number = max((abs(l) for c in clauses for l in c), default=0)
+    cnf = types.SimpleNamespace(clauses_list=clauses, vars_number=vars_number)
+    return simplify.FlatCnf.of(cnf)
+
+def clauses_of(offsets, literals):
+    ''':return: the list of clauses described by the flat arrays'''
+    return simplify.FlatCnf(0, offsets, literals).clauses_list
+
+def satisfiable(clauses, vars_number):
+    ''':return: True iff the `clauses` are satisfiable (brute force)'''
+    for values in itertools.product((False, True), repeat=vars_number):
+        holds = lambda l: values[abs(l)-1] == (l > 0)
+        if all(any(holds(l) for l in c) for c in clauses):
+            return True
+    return False
+
+def random_cnf(rng, vars_number, clauses_number):
+    ''':return: a random list of clauses (with duplicates, units, ...)'''
+    clauses = []
+    for _ in range(clauses_number):
+        length = rng.choice((1, 2, 2, 3, 3, 4))
+        clauses.append([ rng.choice((-1, 1)) * rng.randint(1, vars_number) for _ in range(length) ])
+    # some duplicate (shuffled) clauses
+    for clause in rng.sample(clauses, len(clauses) // 4):
+        clauses.append(rng.sample(clause, len(clause)))
+    return clauses
+
+class TestNormalize(unittest.TestCase):
+
+    def test_duplicate_literals_and_tautologies(self):
+        cnf = flat([[1, 1, 2], [1, -1, 3], [2, 3], [-2, 4, -2]])
+        offsets, literals, tautologies = simplify.normalize(cnf.offsets, cnf.literals)
+
+        self.assertEqual(tautologies, 1)
+        self.assertEqual(clauses_of(offsets, literals), [[1, 2], [2, 3], [-2, 4]])
+
+class TestPropagate(unittest.TestCase):
+
+    def test_units_are_propagated(self):
+        cnf = flat([[1], [-1, 2], [-2, 3, 4], [5, -3], [1, 6]])
+        offsets, literals, assigned = simplify.propagate(cnf.offsets, cnf.literals, 6)
+
+        self.assertEqual(assigned, 2)
+        self.assertEqual(clauses_of(offsets, literals), [[3, 4], [5, -3]])
+
+    def test_conflicting_units(self):
+        cnf = flat([[1], [-1]])
+        with self.assertRaises(simplify.Unsatisfiable):
+            simplify.propagate(cnf.offsets, cnf.literals, 1)
+
+    def test_derived_empty_clause(self):
+        cnf = flat([[1], [-1, 2], [-2, -1]])
+        with self.assertRaises(simplify.Unsatisfiable):
+            simplify.propagate(cnf.offsets, cnf.literals, 2)
+
+class TestDeduplicate(unittest.TestCase):
+
+    def test_duplicates_regardless_of_order(self):
+        cnf = flat([[1, 2], [2, 1], [3], [1, 2, 3], [3, 2, 1], [1, -2]])
+        offsets, literals, duplicates = simplify.deduplicate(cnf.offsets, cnf.literals)
+
+        self.assertEqual(duplicates, 2)
+        self.assertEqual(clauses_of(offsets, literals), [[1, 2], [3], [1, 2, 3], [1, -2]])
+
+class TestSubsume(unittest.TestCase):
+
+    def test_subsumed_clauses(self):
+        cnf = flat([[1, 2], [1, 2, 3], [2, -3], [1, -3, 2, 4], [1, -2, 3]])
+        offsets, literals, subsumed = simplify.subsume(cnf.offsets, cnf.literals, 4)
+
+        self.assertEqual(subsumed, 2)
+        self.assertEqual(clauses_of(offsets, literals), [[1, 2], [2, -3], [1, -2, 3]])
+
+    def test_batches(self):
+        rng     = random.Random(7)
+        clauses = [ list(c) for c in { tuple(sorted(set(c))) for c in random_cnf(rng, 8, 60) } ]
+        cnf     = flat(clauses, 8)
+
+        expected = simplify.subsume(cnf.offsets, cnf.literals, 8)
+        actual   = simplify.subsume(cnf.offsets, cnf.literals, 8, batch=3)
+        self.assertEqual(actual[2], expected[2])
+        self.assertEqual(clauses_of(*actual[:2]), clauses_of(*expected[:2]))
+
+class TestEliminatePure(unittest.TestCase):
+
+    def test_cascade(self):
+        # once [1, 2] is removed, 2 still occurs with both polarities
+        cnf = flat([[1, 2], [-2, 3], [-3, 2], [-3]])
+        offsets, literals, pure = simplify.eliminate_pure(cnf.offsets, cnf.literals, 3)
+
+        self.assertEqual(pure, 1)
+        self.assertEqual(clauses_of(offsets, literals), [[-2, 3], [-3, 2], [-3]])
+
+        # removing [1, 2] makes 2 pure, removing [-2, 3] makes 3 pure
+        cnf = flat([[1, 2], [-2, 3], [-3]])
+        offsets, literals, pure = simplify.eliminate_pure(cnf.offsets, cnf.literals, 3)
+
+        self.assertEqual(pure, 3)
+        self.assertEqual(clauses_of(offsets, literals), [])
+
+class TestSimplify(unittest.TestCase):
+
+    def test_stats(self):
+        cnf = flat([[1, -1], [2], [-2, 3, 4], [3, 4], [4, 3], [3, 4, 5], [-4, 6], [-6, 4]])
+        result, stats = simplify.simplify(cnf)
+
+        self.assertFalse(stats['simplify_unsat'])
+        self.assertEqual(stats['simplify_clauses_before'],  8)
+        self.assertEqual(stats['simplify_literals_before'], 17)
+        self.assertEqual(stats['simplify_variables_before'], 6)
+        self.assertEqual(stats['simplify_tautologies'], 1)
+        self.assertEqual(stats['simplify_units'],       1)
+        self.assertEqual(stats['simplify_duplicates'],  2)
+        self.assertEqual(stats['simplify_subsumed'],    1)
+        # 3 is pure: [3, 4] goes away, then 4 and 6 are not pure
+        self.assertEqual(stats['simplify_pure'],        1)
+        self.assertEqual(result.clauses_list, [[-4, 6], [-6, 4]])
+        self.assertEqual(stats['simplify_clauses_after'],   2)
+        self.assertEqual(stats['simplify_literals_after'],  4)
+        self.assertEqual(stats['simplify_variables_after'], 2)
+
+    def test_unsatisfiable(self):
+        cnf = flat([[1], [-1, 2], [-2, -1], [3, 4]])
+        result, stats = simplify.simplify(cnf)
+
+        self.assertTrue(stats['simplify_unsat'])
+        self.assertIs(result, cnf)
+        self.assertEqual(stats['simplify_clauses_after'], 4)
+
+    def test_satisfiability_is_preserved(self):
+        rng = random.Random(42)
+        for _ in range(200):
+            vars_number = rng.randint(1, 8)
+            clauses     = random_cnf(rng, vars_number, rng.randint(1, 30))
+            result, stats = simplify.simplify(flat(clauses, vars_number))
+
+            expected = satisfiable(clauses, vars_number)
+            if stats['simplify_unsat']:
+                self.assertFalse(expected, clauses)
+            else:
+                self.assertEqual(satisfiable(result.clauses_list, vars_number), expected, clauses)
+                self.assertLessEqual(result.clauses_number, len(clauses))
+                # the variables keep their identifier
+                self.assertTrue(set(numpy.abs(result.literals).tolist()) <= set(range(1, vars_number+1)))
+
+if __name__ == '__main__':
+    unittest.main()